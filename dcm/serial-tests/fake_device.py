@@ -0,0 +1,87 @@
+import os
+import tty
+import time
+import select
+import argparse
+import threading
+from link import FrameParser, encode_frame
+from messages import PARAMS, LED_SET
+
+class FakeDevice:
+    # pacemaker stand-in on a pseudo terminal, speaks the framed protocol from link.py
+    # replies to the handshake, echoes params (0x03) and approvals (0x04), and answers the LED read (0x22)
+    # with the last LED settings (0x55); the link under test opens self.port like a real serial port
+
+    def __init__(self, reply_delay=0.0, drop_every=0):
+        self.master, slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        self.slave = slave # kept open so the pty stays alive until the link opens it
+        self.reply_delay = reply_delay
+        self.drop_every = drop_every
+        self.parser = FrameParser()
+        self.params = bytes(PARAMS.size)
+        self.led_settings = bytes(LED_SET.size)
+        self.received = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='fake-device', daemon=True)
+        self.thread.start()
+
+    def _reply(self, msg_id, msg_type, payload):
+        if self.reply_delay:
+            time.sleep(self.reply_delay)
+        os.write(self.master, encode_frame(msg_id, msg_type, payload))
+
+    def handle(self, msg_id, msg_type, payload):
+        self.received += 1
+        if self.drop_every and self.received % self.drop_every == 0:
+            return
+        if msg_type == 0x01:
+            self._reply(msg_id, 0x01, b'AlaREM-fake')
+        elif msg_type == 0x03:
+            self.params = payload
+            self._reply(msg_id, 0x03, self.params)
+        elif msg_type == 0x04:
+            self._reply(msg_id, 0x04, self.params)
+        elif msg_type == 0x55:
+            self.led_settings = payload[:LED_SET.size]
+        elif msg_type == 0x22:
+            self._reply(msg_id, 0x22, self.led_settings)
+
+    def _run(self):
+        while self.running:
+            readable, _, _ = select.select([self.master], [], [], 0.05)
+            if not readable:
+                continue
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                return
+            for msg_id, msg_type, payload in self.parser.feed(data):
+                self.handle(msg_id, msg_type, payload)
+
+    def send_unsolicited(self, msg_type, payload=b''):
+        os.write(self.master, encode_frame(0, msg_type, payload))
+
+    def write_raw(self, data):
+        os.write(self.master, data)
+
+    def close(self):
+        self.running = False
+        self.thread.join(timeout=1.0)
+        os.close(self.master)
+        os.close(self.slave)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run a fake pacemaker on a pseudo terminal')
+    parser.add_argument('--reply-delay', type=float, default=0.0)
+    args = parser.parse_args()
+
+    device = FakeDevice(reply_delay=args.reply_delay)
+    print(f"Fake device listening on {device.port}, e.g. python main.py --port {device.port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        device.close()
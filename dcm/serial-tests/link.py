@@ -0,0 +1,163 @@
+import queue
+import struct
+import threading
+from concurrent.futures import Future
+
+# frame layout, all fields little-endian:
+#   sync     2 bytes  0xAA 0x55
+#   length   uint16   payload length
+#   msg_id   uint8    request id, echoed by the device in its response (0 for unsolicited messages)
+#   msg_type uint8    0x01 handshake, 0x02 handshake ack, 0x03 params, 0x04 approve params, ...
+#   payload  length bytes
+#   crc      uint16   CRC-16/CCITT-FALSE over length, msg_id, msg_type and payload
+SYNC = b'\xaa\x55'
+FRAME_HEADER = struct.Struct('<2sHBB')
+FRAME_CRC = struct.Struct('<H')
+MAX_PAYLOAD = 1024
+
+def crc16_ccitt(data, crc=0xFFFF):
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) & 0xFFFF if crc & 0x8000 else (crc << 1) & 0xFFFF
+    return crc
+
+def encode_frame(msg_id, msg_type, payload=b''):
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError(f'Payload of {len(payload)} bytes is larger than {MAX_PAYLOAD}')
+    header = FRAME_HEADER.pack(SYNC, len(payload), msg_id, msg_type)
+    return header + bytes(payload) + FRAME_CRC.pack(crc16_ccitt(header[2:] + bytes(payload)))
+
+class FrameParser:
+    # reassembles frames from an arbitrary byte stream, resynchronizing on the next sync word after garbage or a bad CRC
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.dropped_bytes = 0
+        self.crc_errors = 0
+
+    def feed(self, data):
+        self.buffer.extend(data)
+        frames = []
+        while True:
+            start = self.buffer.find(SYNC)
+            if start < 0:
+                # keep a trailing 0xAA, it may be the first half of the next sync word
+                keep = 1 if self.buffer[-1:] == SYNC[:1] else 0
+                self.dropped_bytes += len(self.buffer) - keep
+                del self.buffer[:len(self.buffer) - keep]
+                return frames
+            if start:
+                self.dropped_bytes += start
+                del self.buffer[:start]
+            if len(self.buffer) < FRAME_HEADER.size:
+                return frames
+
+            _, length, msg_id, msg_type = FRAME_HEADER.unpack_from(self.buffer)
+            if length > MAX_PAYLOAD:
+                self.dropped_bytes += 1
+                del self.buffer[:1]
+                continue
+            frame_size = FRAME_HEADER.size + length + FRAME_CRC.size
+            if len(self.buffer) < frame_size:
+                return frames
+
+            payload = bytes(self.buffer[FRAME_HEADER.size:FRAME_HEADER.size + length])
+            (crc,) = FRAME_CRC.unpack_from(self.buffer, FRAME_HEADER.size + length)
+            if crc != crc16_ccitt(self.buffer[2:FRAME_HEADER.size + length]):
+                self.crc_errors += 1
+                self.dropped_bytes += 1
+                del self.buffer[:1]
+                continue
+
+            del self.buffer[:frame_size]
+            frames.append((msg_id, msg_type, payload))
+
+class SerialLink:
+    # framed request/response over a pyserial-like port (read/write/in_waiting/close)
+    # a background thread parses incoming bytes; responses resolve the pending request with the same msg_id,
+    # everything else is put on the messages queue
+
+    def __init__(self, port, read_timeout=0.05):
+        self.port = port
+        self.port.timeout = read_timeout
+        self.parser = FrameParser()
+        self.messages = queue.Queue()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.next_id = 1
+        self.running = True
+        self.reader = threading.Thread(target=self._read_loop, name='serial-link-reader', daemon=True)
+        self.reader.start()
+
+    def _read_loop(self):
+        while self.running:
+            try:
+                data = self.port.read(max(1, self.port.in_waiting))
+            except Exception as error:
+                self._fail_pending(error)
+                return
+            if not data:
+                continue
+            for msg_id, msg_type, payload in self.parser.feed(data):
+                with self.lock:
+                    future = self.pending.pop(msg_id, None) if msg_id else None
+                if future is not None:
+                    future.set_result((msg_type, payload))
+                else:
+                    self.messages.put((msg_id, msg_type, payload))
+
+    def _fail_pending(self, error):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(error)
+
+    def _allocate_id(self):
+        with self.lock:
+            for _ in range(255):
+                msg_id = self.next_id
+                self.next_id = self.next_id % 255 + 1 # ids 1..255, 0 is reserved for unsolicited messages
+                if msg_id not in self.pending:
+                    self.pending[msg_id] = Future()
+                    return msg_id, self.pending[msg_id]
+        raise RuntimeError('255 requests already pending')
+
+    def send(self, msg_type, payload=b'', msg_id=0):
+        with self.write_lock:
+            self.port.write(encode_frame(msg_id, msg_type, payload))
+
+    def request_async(self, msg_type, payload=b''):
+        # returns a concurrent.futures.Future resolving to the (msg_type, payload) of the response
+        msg_id, future = self._allocate_id()
+        try:
+            self.send(msg_type, payload, msg_id)
+        except Exception:
+            with self.lock:
+                self.pending.pop(msg_id, None)
+            raise
+        future.msg_id = msg_id
+        return future
+
+    def request(self, msg_type, payload=b'', timeout=1.0):
+        future = self.request_async(msg_type, payload)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            with self.lock:
+                self.pending.pop(future.msg_id, None)
+            raise TimeoutError(f'No response to message type 0x{msg_type:02x} (id {future.msg_id}) within {timeout} s') from None
+
+    def receive(self, timeout=None):
+        # next unsolicited message as (msg_id, msg_type, payload), None on timeout
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.running = False
+        self.reader.join(timeout=1.0)
+        self._fail_pending(ConnectionError('Link closed'))
+        self.port.close()
@@ -0,0 +1,68 @@
+import time
+import serial
+from link import SerialLink, FrameParser, encode_frame
+from fake_device import FakeDevice
+
+def open_link(device):
+    return SerialLink(serial.Serial(port=device.port, baudrate=115200))
+
+if __name__ == "__main__":
+    # the parser resynchronizes on the next sync word after garbage (including a lone 0xAA) and after a frame with a bad CRC,
+    # whichever way the stream is split
+    corrupted = bytearray(encode_frame(7, 0x03, b'corrupted'))
+    corrupted[-1] ^= 0xFF
+    stream = b'\x00\xaa\x13\x37' + encode_frame(1, 0x01, b'first') + bytes(corrupted) + b'\xaa' + encode_frame(2, 0x22, b'second')
+    for chunk_size in (1, 3, len(stream)):
+        parser = FrameParser()
+        frames = []
+        for start in range(0, len(stream), chunk_size):
+            frames.extend(parser.feed(stream[start:start + chunk_size]))
+        assert frames == [(1, 0x01, b'first'), (2, 0x22, b'second')], (chunk_size, frames)
+        assert parser.crc_errors == 1 and parser.dropped_bytes > 0 and not parser.buffer
+
+    # the same over the pseudo terminal: garbage and a corrupted frame from the device do not disturb the next request
+    device = FakeDevice()
+    link = open_link(device)
+    try:
+        device.write_raw(b'\x55\xaa\xaa\x00' + bytes(corrupted))
+        device.send_unsolicited(0x55, b'unsolicited')
+        assert link.request(0x01, timeout=1.0) == (0x01, b'AlaREM-fake')
+        assert link.receive(timeout=1.0) == (0, 0x55, b'unsolicited')
+        assert link.parser.crc_errors == 1 and link.parser.dropped_bytes > 0
+    finally:
+        link.close()
+        device.close()
+
+    # every third request is dropped by the device: that request times out, the ones after it are answered as usual
+    device = FakeDevice(drop_every=3)
+    link = open_link(device)
+    try:
+        for number in range(1, 7):
+            payload = bytes([number]) * 8
+            start_time = time.perf_counter()
+            try:
+                response = link.request(0x03, payload, timeout=0.3)
+            except TimeoutError:
+                assert number % 3 == 0, number
+                continue
+            assert number % 3 != 0 and response == (0x03, payload), (number, response)
+            assert time.perf_counter() - start_time < 0.3
+        assert not link.pending
+    finally:
+        link.close()
+        device.close()
+
+    # pipelined requests with a slow device: every reply resolves the future with its own msg_id
+    device = FakeDevice(reply_delay=0.002)
+    link = open_link(device)
+    try:
+        payloads = [bytes([number]) * 16 for number in range(100)]
+        futures = [link.request_async(0x03, payload) for payload in payloads]
+        assert len({future.msg_id for future in futures}) == len(futures)
+        for future, payload in zip(futures, payloads):
+            assert future.result(timeout=5.0) == (0x03, payload), (future.msg_id, payload)
+        assert not link.pending
+    finally:
+        link.close()
+        device.close()
+    print(f"Serial link verified: resync after garbage and bad CRCs, dropped requests time out alone, {len(futures)} pipelined requests matched by msg_id")
@@ -1,7 +1,8 @@
 import serial
-import struct
-import time
+import argparse
 import platform
+from link import SerialLink
+from messages import MESSAGES, HANDSHAKE, HANDSHAKE_ACK, PARAMS
 
 def serial_init(port, baudrate):
     return serial.Serial(
@@ -9,120 +10,89 @@ def serial_init(port, baudrate):
         baudrate=baudrate,
     )
 
-def send_payload(payload):
-    if platform.system() == 'Windows':
-        serial.write(payload)
-    else:
-        print(payload)
-
-def send_params(msgtype, mode, LRL, URL, ARP, VRP, APW, VPW, AAmp, VAmp, ASens, VSens):
-    data = bytearray()
-    data.append(0x16) # for the message id
-    data.append(msgtype) # for the message type
-    data.extend(struct.pack('<B', mode))
-    data.extend(struct.pack('<B', LRL))
-    data.extend(struct.pack('<B', URL))
-    data.extend(struct.pack('<H', ARP)) # pack as little-endian unsigned short
-    data.extend(struct.pack('<H', VRP)) # pack as little-endian unsigned short
-    data.extend(struct.pack('<B', APW))
-    data.extend(struct.pack('<B', VPW))
-    data.extend(struct.pack('<f', AAmp)) # pack as little-endian float
-    data.extend(struct.pack('<f', VAmp)) # pack as little-endian float
-    data.extend(struct.pack('<f', ASens)) # pack as little-endian float
-    data.extend(struct.pack('<f', VSens)) # pack as little-endian float
-
-    send_payload(data)
-
-def read_params(mode, LRL, URL, ARP, VRP, APW, VPW, AAmp, VAmp, ASens, VSens):
-    buffer = serial.read(27)
-    if (
-    mode == buffer[2] and
-    LRL == buffer[3] and
-    URL == buffer[4] and
-    ARP == struct.unpack('<H', buffer[5:7])[0] and
-    VRP == struct.unpack('<H', buffer[7:9])[0] and
-    APW == buffer[9] and
-    VPW == buffer[10] and
-    AAmp == struct.unpack('<f', buffer[11:15])[0] and
-    VAmp == struct.unpack('<f', buffer[15:19])[0] and
-    ASens == struct.unpack('<f', buffer[19:23])[0] and
-    VSens == struct.unpack('<f', buffer[23:27])[0]):
+def pack_params(mode, LRL, URL, ARP, VRP, APW, VPW, AAmp, VAmp, ASens, VSens):
+    return PARAMS.encode(mode, LRL, URL, ARP, VRP, APW, VPW, AAmp, VAmp, ASens, VSens)
+
+def unpack_params(buffer):
+    return PARAMS.decode(buffer)
+
+def send_params(link, msgtype, mode, LRL, URL, ARP, VRP, APW, VPW, AAmp, VAmp, ASens, VSens, timeout=1.0):
+    # resolves on the response carrying the same message id, raises TimeoutError if the device does not answer
+    _, payload = link.request(msgtype, MESSAGES[msgtype].encode(mode, LRL, URL, ARP, VRP, APW, VPW, AAmp, VAmp, ASens, VSens), timeout=timeout)
+    return payload
+
+def read_params(payload, mode, LRL, URL, ARP, VRP, APW, VPW, AAmp, VAmp, ASens, VSens):
+    returned = unpack_params(payload)
+    # compare after a float32 round trip, the device stores the amplitudes and sensitivities as float32
+    sent = unpack_params(pack_params(mode, LRL, URL, ARP, VRP, APW, VPW, AAmp, VAmp, ASens, VSens))
+    if returned == sent:
         print("Pacemaker Returned Same Values as Given")
     else:
         print("Pacemaker Returned DIFFERENT Values")
-    print(buffer[1])
-    print(buffer[2])
-    print(buffer[3])
-    print(buffer[4])
-    print(struct.unpack('<H', buffer[5:7])[0])
-    print(struct.unpack('<H', buffer[7:9])[0])
-    print(buffer[9])
-    print(buffer[10])
-    print(struct.unpack('<f', buffer[11:15])[0])
-    print(struct.unpack('<f', buffer[15:19])[0])
-    print(struct.unpack('<f', buffer[19:23])[0])
-    print(struct.unpack('<f', buffer[23:27])[0])
-
-def params(mode, LRL, URL, ARP, VRP, APW, VPW, AAmp, VAmp, ASens, VSens):
-    send_params(0x03, mode, LRL, URL, ARP, VRP, APW, VPW, AAmp, VAmp, ASens, VSens)
+    print(returned)
+    return returned == sent
+
+def params(link, mode, LRL, URL, ARP, VRP, APW, VPW, AAmp, VAmp, ASens, VSens):
+    payload = send_params(link, 0x03, mode, LRL, URL, ARP, VRP, APW, VPW, AAmp, VAmp, ASens, VSens)
     print(f"Sent: {mode}, {LRL}bpm, {URL}bpm, {ARP}ms, {VRP}ms, {APW}ms, {VPW}ms, {AAmp}V, {VAmp}V, {ASens}V, {VSens}V")
-    time.sleep(0.1)
-    read_params(mode, LRL, URL, ARP, VRP, APW, VPW, AAmp, VAmp, ASens, VSens)
-    time.sleep(0.1)
-    send_params(0x04, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+    read_params(payload, mode, LRL, URL, ARP, VRP, APW, VPW, AAmp, VAmp, ASens, VSens)
+    payload = send_params(link, 0x04, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
     print("Sent Approval")
-    time.sleep(0.1)
-    read_params(mode, LRL, URL, ARP, VRP, APW, VPW, AAmp, VAmp, ASens, VSens)
-
-def send_01():
-    data = bytearray()
-    data.append(0x00)
-    data.append(0x01)
-    data.extend(b'AlaREM')
-    send_payload(data)
-
-def send_02():
-    data = bytearray()
-    data.append(0x01)
-    data.append(0x02)
-    send_payload(data)
-
-def read_message():
-    if platform.system() == 'Windows':
-        buffer = serial.read(10)
-        print(buffer)
+    read_params(payload, mode, LRL, URL, ARP, VRP, APW, VPW, AAmp, VAmp, ASens, VSens)
 
-if __name__ == "__main__":
+def send_01(link):
+    _, payload = link.request(HANDSHAKE.msg_type, HANDSHAKE.encode(b'AlaREM'))
+    print(payload)
+
+def send_02(link):
+    link.send(HANDSHAKE_ACK.msg_type)
 
-    if platform.system() == 'Windows':
-        serial = serial_init('COM5', 115200)
+def read_message(link, timeout=1.0):
+    message = link.receive(timeout=timeout)
+    if message is not None:
+        print(message)
+    return message
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Talk to the pacemaker over the framed serial link')
+    parser.add_argument('--port', default='COM5' if platform.system() == 'Windows' else None)
+    parser.add_argument('--baudrate', type=int, default=115200)
+    parser.add_argument('--fake', action='store_true', help='run against fake_device.FakeDevice on a pseudo terminal')
+    args = parser.parse_args()
+
+    device = None
+    if args.fake:
+        from fake_device import FakeDevice
+        device = FakeDevice()
+        args.port = device.port
+    if args.port is None:
+        parser.error('--port is required (or --fake)')
+
+    link = SerialLink(serial_init(args.port, args.baudrate))
 
     handshake = False
 
     while True:
         try:
             if not handshake:
-                send_01()
-                time.sleep(1)
-                read_message()
-                time.sleep(1)
-                send_02()
-                time.sleep(1)
+                send_01(link)
+                send_02(link)
                 handshake = True
 
-            read_message()
+            read_message(link)
 
             # print('\n\n')
-            # params(100, 61, 121, 250, 250, 1, 1, 5.0, 5.0, 4.0, 4.0)
-            # time.sleep(2)
+            # params(link, 100, 61, 121, 250, 250, 1, 1, 5.0, 5.0, 4.0, 4.0)
             # print('\n\n')
-            # params(200, 175, 125, 250, 250, 1, 1, 5.0, 5.0, 4.0, 4.0)
-            # time.sleep(2)
+            # params(link, 200, 175, 125, 250, 250, 1, 1, 5.0, 5.0, 4.0, 4.0)
 
 
+        except TimeoutError as error:
+            print(error)
         except KeyboardInterrupt:
             print("Exiting")
             break
 
-    if platform.system() == 'Windows':
-        serial.close()
\ No newline at end of file
+    link.close()
+    if device is not None:
+        device.close()
@@ -0,0 +1,96 @@
+import time
+import struct
+import argparse
+from dataclasses import astuple
+from messages import PARAMS
+
+# the per-field packing main.py used before the schema registry, kept here as the baseline
+def legacy_pack_params(mode, LRL, URL, ARP, VRP, APW, VPW, AAmp, VAmp, ASens, VSens):
+    data = bytearray()
+    data.extend(struct.pack('<B', mode))
+    data.extend(struct.pack('<B', LRL))
+    data.extend(struct.pack('<B', URL))
+    data.extend(struct.pack('<H', ARP))
+    data.extend(struct.pack('<H', VRP))
+    data.extend(struct.pack('<B', APW))
+    data.extend(struct.pack('<B', VPW))
+    data.extend(struct.pack('<f', AAmp))
+    data.extend(struct.pack('<f', VAmp))
+    data.extend(struct.pack('<f', ASens))
+    data.extend(struct.pack('<f', VSens))
+    return bytes(data)
+
+def legacy_unpack_params(buffer):
+    return (
+        buffer[0],
+        buffer[1],
+        buffer[2],
+        struct.unpack('<H', buffer[3:5])[0],
+        struct.unpack('<H', buffer[5:7])[0],
+        buffer[7],
+        buffer[8],
+        struct.unpack('<f', buffer[9:13])[0],
+        struct.unpack('<f', buffer[13:17])[0],
+        struct.unpack('<f', buffer[17:21])[0],
+        struct.unpack('<f', buffer[21:25])[0]
+    )
+
+def measure(function, repeats):
+    start_time = time.perf_counter()
+    function(repeats)
+    return repeats / (time.perf_counter() - start_time)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Encode/decode rate of the params message, per-field struct calls vs the precompiled schema')
+    parser.add_argument('--messages', type=int, default=200000)
+    args = parser.parse_args()
+
+    values = (100, 61, 121, 250, 250, 1, 1, 5.0, 5.0, 4.0, 4.0)
+    payload = PARAMS.encode(*values)
+    assert payload == legacy_pack_params(*values)
+    assert astuple(PARAMS.decode(payload)) == legacy_unpack_params(payload)
+    bulk = payload * args.messages
+    buffer = bytearray(PARAMS.size)
+
+    def legacy_encode(n):
+        for _ in range(n):
+            legacy_pack_params(*values)
+
+    def schema_encode(n):
+        for _ in range(n):
+            PARAMS.encode(*values)
+
+    def schema_pack_into(n):
+        for _ in range(n):
+            PARAMS.pack_into(buffer, 0, *values)
+
+    def legacy_decode(n):
+        for _ in range(n):
+            legacy_unpack_params(payload)
+
+    def schema_decode(n):
+        for _ in range(n):
+            PARAMS.decode(payload)
+
+    def schema_decode_many(n):
+        assert len(PARAMS.decode_many(bulk)) == n
+
+    def schema_decode_array(n):
+        assert len(PARAMS.decode_array(bulk)) == n
+
+    print(f"{args.messages} params messages of {PARAMS.size} bytes")
+    print(f"{'Codec':<22}{'Messages/s':>14}")
+    rates = {}
+    for name, function in (
+        ('legacy encode', legacy_encode),
+        ('schema encode', schema_encode),
+        ('schema pack_into', schema_pack_into),
+        ('legacy decode', legacy_decode),
+        ('schema decode', schema_decode),
+        ('schema decode_many', schema_decode_many),
+        ('schema decode_array', schema_decode_array)
+    ):
+        rates[name] = measure(function, args.messages)
+        print(f"{name:<22}{rates[name]:>14,.0f}")
+    print(f"Encode speedup: {rates['schema pack_into'] / rates['legacy encode']:.1f}x")
+    print(f"Decode speedup: {rates['schema decode'] / rates['legacy decode']:.1f}x (bulk {rates['schema decode_many'] / rates['legacy decode']:.1f}x)")
@@ -0,0 +1,81 @@
+import struct
+from itertools import starmap
+from operator import attrgetter
+from dataclasses import make_dataclass
+
+# every device message is described once as (field name, struct format) pairs
+# each schema compiles to a single little-endian struct.Struct and a slotted dataclass for decoded messages
+# (not frozen, a frozen dataclass is ~4x slower to construct which dominates decode time)
+
+FIELD_TYPES = {'B': int, 'H': int, 'I': int, 'f': float, 'd': float, 's': bytes}
+
+class MessageSchema:
+
+    def __init__(self, msg_type, name, fields):
+        self.msg_type = msg_type
+        self.name = name
+        self.fields = fields
+        self.struct = struct.Struct('<' + ''.join(fmt for _, fmt in fields))
+        self.size = self.struct.size
+        self.cls = make_dataclass(name, [(field, FIELD_TYPES[fmt[-1]]) for field, fmt in fields], slots=True)
+        self._astuple = attrgetter(*[field for field, _ in fields]) if len(fields) > 1 else (lambda message: tuple(getattr(message, field) for field, _ in fields))
+
+    def encode(self, *values):
+        return self.struct.pack(*values)
+
+    def pack_into(self, buffer, offset, *values):
+        # writes into a preallocated buffer, e.g. bytearray(schema.size), without creating intermediate bytes
+        self.struct.pack_into(buffer, offset, *values)
+
+    def encode_message(self, message):
+        return self.struct.pack(*self._astuple(message))
+
+    def decode(self, buffer, offset=0):
+        return self.cls(*self.struct.unpack_from(buffer, offset))
+
+    def decode_many(self, buffer):
+        # bulk decode of back-to-back messages of this type
+        return list(starmap(self.cls, self.struct.iter_unpack(buffer)))
+
+    def decode_array(self, buffer):
+        # same as decode_many but into a numpy structured array, one column per field
+        import numpy as np
+        dtype = np.dtype([(field, '<' + fmt) if fmt[-1] != 's' else (field, f'S{fmt[:-1] or 1}') for field, fmt in self.fields])
+        return np.frombuffer(buffer, dtype=dtype, count=len(buffer) // self.size)
+
+MESSAGES = {}
+MESSAGES_BY_NAME = {}
+
+def define_message(msg_type, name, fields):
+    schema = MessageSchema(msg_type, name, fields)
+    MESSAGES[msg_type] = schema
+    MESSAGES_BY_NAME[name] = schema
+    return schema
+
+PARAMS_FIELDS = [
+    ('mode', 'B'),
+    ('LRL', 'B'), # bpm
+    ('URL', 'B'), # bpm
+    ('ARP', 'H'), # ms
+    ('VRP', 'H'), # ms
+    ('APW', 'B'), # ms
+    ('VPW', 'B'), # ms
+    ('AAmp', 'f'), # V
+    ('VAmp', 'f'), # V
+    ('ASens', 'f'), # V
+    ('VSens', 'f') # V
+]
+LED_FIELDS = [
+    ('red_enable', 'B'),
+    ('green_enable', 'B'),
+    ('blue_enable', 'B'),
+    ('off_time', 'f'),
+    ('switch_time', 'H')
+]
+
+HANDSHAKE = define_message(0x01, 'Handshake', [('name', '6s')])
+HANDSHAKE_ACK = define_message(0x02, 'HandshakeAck', [])
+PARAMS = define_message(0x03, 'Params', PARAMS_FIELDS)
+APPROVE_PARAMS = define_message(0x04, 'ApproveParams', PARAMS_FIELDS)
+LED_READ = define_message(0x22, 'LedRead', LED_FIELDS)
+LED_SET = define_message(0x55, 'LedSet', LED_FIELDS)
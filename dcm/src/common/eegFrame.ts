@@ -0,0 +1,37 @@
+// binary EEG sample frame sent to the python backend (see src/python/eegFrames.py)
+// little-endian header: magic 'EG', version, channel count, sample rate, sequence, timestamp, samples per channel
+// followed by the float32 samples of each channel, one channel after the other
+
+export const EEG_FRAME_VERSION = 1
+export const EEG_FRAME_HEADER_BYTES = 24
+
+export const encodeEegFrame = (
+  channels: Float32Array[],
+  sampleRate: number,
+  sequence: number,
+  timestamp: number,
+): ArrayBuffer => {
+  const samples = channels[0].length
+  const buffer = new ArrayBuffer(EEG_FRAME_HEADER_BYTES + channels.length * samples * 4)
+  const view = new DataView(buffer)
+
+  view.setUint8(0, 'E'.charCodeAt(0))
+  view.setUint8(1, 'G'.charCodeAt(0))
+  view.setUint8(2, EEG_FRAME_VERSION)
+  view.setUint8(3, channels.length)
+  view.setFloat32(4, sampleRate, true)
+  view.setUint32(8, sequence >>> 0, true)
+  view.setFloat64(12, timestamp, true)
+  view.setUint32(20, samples, true)
+
+  // DataView keeps the sample bytes little-endian regardless of the host
+  let offset = EEG_FRAME_HEADER_BYTES
+  for (const channel of channels) {
+    for (let i = 0; i < samples; i++) {
+      view.setFloat32(offset, channel[i], true)
+      offset += 4
+    }
+  }
+
+  return buffer
+}
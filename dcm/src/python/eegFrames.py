@@ -0,0 +1,65 @@
+import struct
+from collections import namedtuple
+import numpy as np
+
+# binary EEG sample frame, all fields little-endian:
+#   magic      2s   b'EG'
+#   version    B    FRAME_VERSION
+#   channels   B    number of channels
+#   sampleRate f    samples per second per channel
+#   sequence   I    per-connection frame counter, wraps at 2**32
+#   timestamp  d    sender clock in seconds at the first sample
+#   samples    I    samples per channel
+# followed by channels x samples float32 values, channel-major
+FRAME_MAGIC = b'EG'
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct('<2sBBfIdI')
+SEQUENCE_MODULO = 2**32
+
+EegFrame = namedtuple('EegFrame', ['channels', 'sample_rate', 'sequence', 'timestamp', 'samples'])
+
+def encode_frame(samples, sample_rate, sequence, timestamp):
+    samples = np.ascontiguousarray(samples, dtype='<f4')
+    header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, samples.shape[0], sample_rate, sequence % SEQUENCE_MODULO, timestamp, samples.shape[1])
+    return header + samples.tobytes()
+
+def decode_frame(buffer):
+    # samples is a read-only float32 view over the received bytes, no per-sample python objects are created
+    magic, version, channels, sample_rate, sequence, timestamp, n_samples = FRAME_HEADER.unpack_from(buffer)
+    if magic != FRAME_MAGIC:
+        raise ValueError('Not an EEG frame')
+    if version != FRAME_VERSION:
+        raise ValueError(f'Unsupported EEG frame version {version}')
+    if len(buffer) != FRAME_HEADER.size + channels * n_samples * 4:
+        raise ValueError(f'EEG frame length {len(buffer)} does not match {channels} channels x {n_samples} samples')
+
+    samples = np.frombuffer(buffer, dtype='<f4', count=channels * n_samples, offset=FRAME_HEADER.size).reshape(channels, n_samples)
+    return EegFrame(channels, sample_rate, sequence, timestamp, samples)
+
+class SequenceTracker:
+    # classifies each sequence number against the next expected one
+    # 'ok' in order, 'gap' when frames were skipped (missing holds how many), 'late' for a frame older than one already seen
+
+    def __init__(self):
+        self.expected = None
+        self.received = 0
+        self.missing = 0
+        self.late = 0
+
+    def check(self, sequence):
+        self.received += 1
+        if self.expected is None:
+            self.expected = (sequence + 1) % SEQUENCE_MODULO
+            return 'ok', 0
+
+        ahead = (sequence - self.expected) % SEQUENCE_MODULO
+        if ahead >= SEQUENCE_MODULO // 2:
+            self.late += 1
+            return 'late', 0
+
+        self.expected = (sequence + 1) % SEQUENCE_MODULO
+        self.missing += ahead
+        return ('gap', ahead) if ahead else ('ok', 0)
+
+    def summary(self):
+        return {'received': self.received, 'missing': self.missing, 'late': self.late}
@@ -1,22 +1,323 @@
-import asyncio
+import os
+import sys
 import json
+import time
+import signal
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+# the sleep model code lives in the repository's model/ directory
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', 'model')))
+from model_bundle import load_model_bundle, latest_model_bundle, MODEL_DIR
+from streaming_inference import StreamingSleepStager
+from wake_alarm import WakeAlarm
+from instrumentation import configure, span, count, observe, flush, start_metrics_server
+from eegFrames import decode_frame, SequenceTracker
+
+MAX_BATCH_SIZE = 256 # epochs scored by one booster call
+MAX_BATCH_DELAY = 0.005 # seconds the batcher waits for more epochs after the first one arrives
+MAX_PENDING_EPOCHS = 1024 # epochs waiting for scoring before pushes are held back
+MAX_INCOMING_MESSAGES = 16 # websocket frames buffered per connection before reads stop
+LATENCY_WINDOW = 1000 # latencies kept per command for the stats command
 
 async def addTwoNumber(a: int, b: int) -> int:
     return a + b
 
-async def handler(websocket):
-    async for message in websocket:
-        data = json.loads(message)
-        if data['cmd'] == 'add':
-            result = await addTwoNumber(int(data['a']), int(data['b']))
-            await websocket.send(json.dumps({'result': result}))
-        else:
-            await websocket.send(json.dumps({'error': 'unknown command'}))
+class LatencyStats:
+    # rolling per-command latency window, reported by the stats command
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.latencies = {}
+        self.counts = {}
+        self.window = window
+
+    def record(self, cmd, seconds):
+        self.latencies.setdefault(cmd, deque(maxlen=self.window)).append(seconds * 1e3)
+        self.counts[cmd] = self.counts.get(cmd, 0) + 1
+
+    def summary(self):
+        return {cmd: {
+            'count': self.counts[cmd],
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'max_ms': float(np.max(latencies))
+        } for cmd, latencies in self.latencies.items()}
+
+class MicroBatcher:
+    # collects feature rows from every connection and scores them together in a worker thread
+    # the bounded queue is the backpressure point, submit() waits while too many epochs are pending
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.predictor = None
+        self.queue = asyncio.Queue(maxsize=MAX_PENDING_EPOCHS)
+        self.batch_sizes = deque(maxlen=LATENCY_WINDOW)
+
+    async def submit(self, X):
+        if self.predictor is None:
+            raise RuntimeError('No model loaded, send load_model first')
+        futures = []
+        for row in X:
+            future = asyncio.get_running_loop().create_future()
+            await self.queue.put((row, future))
+            futures.append(future)
+        return futures
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + MAX_BATCH_DELAY
+            while len(batch) < MAX_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            rows, futures = zip(*batch)
+            try:
+                with span('server.predict'):
+                    probabilities = await loop.run_in_executor(self.executor, self.predictor.predict_positive_proba, np.stack(rows))
+            except Exception as error:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.batch_sizes.append(len(batch))
+            count('server.batches')
+            count('server.inferences', len(batch))
+            for future, probability in zip(futures, probabilities):
+                if not future.done():
+                    future.set_result(float(probability))
+
+class Session:
+    # per-connection streaming state
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.stager = None
+        self.subscribed = False
+        self.published = asyncio.Queue() # (epochs, futures, received_time) of every push, drained in order by one task
+        self.publisher = None # that task, started by the first push with epochs
+        self.sequence = SequenceTracker() # binary frame ordering
+        self.received_time = None
+        self.alarm = None # smoothing and wake window, see wake_alarm.py
+
+class SleepAnalysisServer:
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.batcher = MicroBatcher(self.executor)
+        self.stats = LatencyStats()
+        self.model_path = None
+
+    async def load_model(self, session, data):
+        path = data.get('path') or latest_model_bundle(MODEL_DIR)
+        loop = asyncio.get_running_loop()
+        # scored with the numpy tree evaluator unless the bundle has no exported trees or 'evaluator': 'xgboost' is sent
+        self.batcher.predictor = await loop.run_in_executor(self.executor, load_model_bundle, path, 1, data.get('evaluator'))
+        self.model_path = path
+        return {'path': path, 'features': self.batcher.predictor.features, 'feature_set': self.batcher.predictor.feature_set.name, 'evaluator': self.batcher.predictor.evaluator}
+
+    async def start_session(self, session, data):
+        if self.batcher.predictor is None:
+            raise RuntimeError('No model loaded, send load_model first')
+        # the stager only extracts features, scoring goes through the shared batcher
+        session.stager = StreamingSleepStager(None, float(data['sampling_frequency']), hop_seconds=float(data.get('hop_seconds', 30)), features=self.batcher.predictor.features, feature_set=self.batcher.predictor.feature_set)
+        # the filter divides out the prior the model was trained under, bundles saved before it was recorded assume a balanced one
+        prior = self.batcher.predictor.metadata.get('positive_rate') or 0.5
+        session.alarm = WakeAlarm(hop_seconds=session.stager.hop_samples / session.stager.sampling_frequency, **{'prior': prior, **data.get('smoothing', {})})
+        if 'wake_window' in data:
+            await self.set_alarm(session, data['wake_window'])
+        return {'sampling_frequency': session.stager.sampling_frequency, 'epoch_samples': session.stager.epoch_samples, 'hop_samples': session.stager.hop_samples}
+
+    async def set_alarm(self, session, data):
+        # start and deadline in seconds of session time, the same clock as the epochs' end_time
+        if session.alarm is None:
+            raise RuntimeError('No session started, send start_session first')
+        session.alarm.set_window(float(data['start']), float(data['deadline']))
+        return {'start': session.alarm.scheduler.window_start, 'deadline': session.alarm.scheduler.deadline}
+
+    async def subscribe(self, session, data):
+        session.subscribed = bool(data.get('enabled', True))
+        return {'subscribed': session.subscribed}
+
+    async def push_samples(self, session, samples):
+        if session.stager is None:
+            raise RuntimeError('No session started, send start_session first')
+
+        with span('server.features'):
+            epochs = session.stager.push(samples)
+        if epochs:
+            X = np.array([[epoch['features'][feature] for feature in session.stager.features] for epoch in epochs], dtype=np.float32)
+            futures = await self.batcher.submit(X)
+            session.published.put_nowait((epochs, futures, session.received_time))
+            if session.publisher is None:
+                session.publisher = asyncio.create_task(self.run_publisher(session))
+        return {'samples': int(samples.shape[1]), 'epochs': len(epochs)}
+
+    async def push(self, session, data):
+        return await self.push_samples(session, np.asarray(data['samples'], dtype=np.float32))
+
+    async def push_frame(self, session, data):
+        frame = data['frame']
+        # checked before the sequence is recorded, a frame sent before start_session can be sent again afterwards
+        if session.stager is None:
+            raise RuntimeError('No session started, send start_session first')
+        # the header carries the rate as float32, so it only matches the session's rate to float32 precision
+        if frame.channels != session.stager.buffer.buffer.shape[0] or not np.isclose(frame.sample_rate, session.stager.sampling_frequency, rtol=1e-6, atol=0):
+            raise ValueError(f'Frame has {frame.channels} channels at {frame.sample_rate} Hz, session expects {session.stager.buffer.buffer.shape[0]} at {session.stager.sampling_frequency} Hz')
+
+        # late frames are dropped, the stager only moves forward in time; gaps are reported back to the sender
+        status, missing = session.sequence.check(frame.sequence)
+        count('server.frames', status=status)
+        if status == 'late':
+            return {'sequence': frame.sequence, 'status': status, 'samples': 0, 'epochs': 0}
+        return {'sequence': frame.sequence, 'status': status, 'missing': missing, **await self.push_samples(session, frame.samples)}
+
+    async def run_publisher(self, session):
+        # the session's only consumer of scored epochs, a push is published after every push before it
+        try:
+            while True:
+                epochs, futures, received_time = await session.published.get()
+                await self.publish_epochs(session, epochs, futures, received_time)
+        except ConnectionClosed:
+            return # nobody left to publish to, the handler ends the session
+
+    async def publish_epochs(self, session, epochs, futures, received_time):
+        for epoch, future in zip(epochs, futures):
+            # epochs are published in order per session, so the filter sees them in order too
+            try:
+                probability = await future
+            except Exception as error:
+                # an epoch that could not be scored still advances the filter, and the alarm can still reach its deadline
+                smoothed, alarm = session.alarm.update(epoch['end_time'], float('nan'))
+                if session.subscribed:
+                    await session.websocket.send(json.dumps({'cmd': 'epoch', 'epoch': epoch['epoch'], 'error': str(error)}))
+            else:
+                latency = time.perf_counter() - received_time
+                self.stats.record('epoch', latency)
+                observe('server.epoch', latency)
+                count('server.epochs')
+                smoothed, alarm = session.alarm.update(epoch['end_time'], probability)
+                if session.subscribed:
+                    await session.websocket.send(json.dumps({
+                        'cmd': 'epoch',
+                        'epoch': epoch['epoch'],
+                        'start_time': epoch['start_time'],
+                        'end_time': epoch['end_time'],
+                        'probability': probability,
+                        'smoothed_probability': smoothed,
+                        'stage': self.batcher.predictor.metadata['label_mapping']['classes'][int(probability > 0.5)],
+                        'latency_ms': latency * 1e3
+                    }))
+            if alarm is not None:
+                count('server.alarms', reason=alarm)
+                await session.websocket.send(json.dumps({'cmd': 'alarm', 'reason': alarm, 'time': epoch['end_time'], 'epoch': epoch['epoch'], 'smoothed_probability': smoothed}))
+
+    async def get_stats(self, session, data):
+        batch_sizes = self.batcher.batch_sizes
+        return {
+            'latency': self.stats.summary(),
+            'pending_epochs': self.batcher.queue.qsize(),
+            'mean_batch_size': float(np.mean(batch_sizes)) if batch_sizes else 0.0,
+            'frames': session.sequence.summary(),
+            'model': self.model_path
+        }
+
+    async def add(self, session, data):
+        return {'result': await addTwoNumber(int(data['a']), int(data['b']))}
+
+    def decode(self, message):
+        # control messages are JSON text frames, binary frames carry EEG samples (see eegFrames.py)
+        if isinstance(message, str):
+            return json.loads(message)
+        return {'cmd': 'push_frame', 'frame': decode_frame(message)}
+
+    async def handle(self, session, message):
+        session.received_time = time.perf_counter()
+        cmd = None
+        try:
+            data = self.decode(message)
+            cmd = data.get('cmd')
+            if cmd not in self.commands:
+                return {'error': 'unknown command'}
+            response = await self.commands[cmd](self, session, data)
+        except Exception as error:
+            response = {'error': f'{type(error).__name__}: {error}'}
+
+        latency = time.perf_counter() - session.received_time
+        if cmd in self.commands:
+            self.stats.record(cmd, latency)
+            observe('server.handle', latency, cmd=cmd)
+        count('server.messages', cmd=cmd if cmd in self.commands else 'invalid')
+        count('server.bytes_received', len(message))
+        if cmd == 'add':
+            return response
+        return {'cmd': cmd, **response, 'latency_ms': latency * 1e3}
+
+    commands = {
+        'add': add,
+        'load_model': load_model,
+        'start_session': start_session,
+        'set_alarm': set_alarm,
+        'subscribe': subscribe,
+        'push': push,
+        'push_frame': push_frame,
+        'stats': get_stats
+    }
+
+    async def handler(self, websocket):
+        session = Session(websocket)
+        try:
+            async for message in websocket:
+                response = await self.handle(session, message)
+                if response is not None:
+                    with span('server.send'):
+                        await websocket.send(json.dumps(response))
+        except ConnectionClosed:
+            pass # the client went away mid-session
+        finally:
+            if session.publisher is not None:
+                session.publisher.cancel()
+                await asyncio.gather(session.publisher, return_exceptions=True)
 
-async def main():
-    async with serve(handler, 'localhost', 8765) as server:
-        await server.serve_forever()
+async def main(host='localhost', port=8765):
+    server = SleepAnalysisServer()
+    batcher_task = asyncio.create_task(server.batcher.run())
+    # SIGTERM (the app quitting) stops the server like ctrl-c, so traces and metrics are flushed on the way out
+    stop = asyncio.get_running_loop().create_future()
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal_number, lambda: stop.done() or stop.set_result(None))
+        except NotImplementedError: # windows
+            pass
+    async with serve(server.handler, host, port, max_queue=MAX_INCOMING_MESSAGES):
+        await stop
+    batcher_task.cancel()
 
 if __name__ == '__main__':
-    asyncio.run(main())
\ No newline at end of file
+    # the app starts it without arguments, other ports are for load tests (testing/websocket_load.bench.py)
+    parser = argparse.ArgumentParser(description='Sleep analysis WebSocket server')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--metrics-port', type=int, default=None, help='serve Prometheus metrics on this port (enables instrumentation)')
+    parser.add_argument('--trace', default=None, help='write spans and counters to this JSONL trace file')
+    parser.add_argument('--profile', nargs='+', default=None, help='cProfile a sample of these spans, e.g. server.features server.predict')
+    args = parser.parse_args()
+    if args.metrics_port is not None or args.trace or args.profile:
+        configure(trace=args.trace, profile=args.profile)
+        if args.metrics_port is not None:
+            start_metrics_server(args.metrics_port, args.host)
+    try:
+        asyncio.run(main(args.host, args.port))
+    finally:
+        flush()
@@ -0,0 +1,48 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from eegFrames import encode_frame, decode_frame
+
+def json_round_trip(samples, sequence):
+    message = json.dumps({'cmd': 'push', 'sequence': sequence, 'samples': samples.tolist()})
+    decoded = np.asarray(json.loads(message)['samples'], dtype=np.float32)
+    return message, decoded
+
+def binary_round_trip(samples, sequence):
+    message = encode_frame(samples, 100.0, sequence, time.time())
+    decoded = decode_frame(message).samples
+    return message, decoded
+
+def measure(round_trip, frames):
+    start_time = time.perf_counter()
+    size = 0
+    for sequence, samples in enumerate(frames):
+        message, decoded = round_trip(samples, sequence)
+        size += len(message)
+    return time.perf_counter() - start_time, size, decoded
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Encode + decode throughput of JSON vs binary EEG frames')
+    parser.add_argument('--frames', type=int, default=2000)
+    parser.add_argument('--channels', type=int, default=2)
+    parser.add_argument('--samples', type=int, default=25, help='samples per channel per frame (25 = 250 ms at 100 Hz)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frames = [(rng.standard_normal((args.channels, args.samples)) * 40).astype(np.float32) for _ in range(args.frames)]
+    total_samples = args.frames * args.channels * args.samples
+
+    print(f"{args.frames} frames of {args.channels} x {args.samples} float32 samples")
+    print(f"{'Format':<8}{'Frames/s':>12}{'Samples/s':>14}{'Bytes/frame':>13}")
+    results = {}
+    for name, round_trip in (('json', json_round_trip), ('binary', binary_round_trip)):
+        elapsed, size, decoded = measure(round_trip, frames)
+        results[name] = elapsed
+        assert np.array_equal(decoded, frames[-1])
+        print(f"{name:<8}{args.frames / elapsed:>12,.0f}{total_samples / elapsed:>14,.0f}{size / args.frames:>13,.0f}")
+    print(f"Binary speedup: {results['json'] / results['binary']:.1f}x")
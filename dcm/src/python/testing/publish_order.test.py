@@ -0,0 +1,85 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+import numpy as np
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import serve
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+MODEL_DIR = os.path.abspath(os.path.join(PYTHON_DIR, '..', '..', '..', 'model'))
+sys.path.insert(0, PYTHON_DIR)
+sys.path.insert(0, MODEL_DIR)
+from mainProcess import SleepAnalysisServer
+
+# several pushes of a few epochs each on one connection, the first scoring batch held back so the later pushes are all
+# scored together and their epochs become ready at once, and every send held up a little like on a slow link (a send only
+# yields to other tasks under backpressure): the epoch messages (and the alarm filter updates) still have to come out in push order
+
+SAMPLING_FREQUENCY = 100
+PUSHES = 8
+EPOCHS_PER_PUSH = 3
+
+async def run(bundle):
+    server = SleepAnalysisServer()
+    batcher_task = asyncio.create_task(server.batcher.run())
+    rng = np.random.default_rng(0)
+
+    async def slow_link_handler(websocket):
+        send = websocket.send
+        async def slow_send(message):
+            await asyncio.sleep(rng.uniform(0, 0.002))
+            await send(message)
+        websocket.send = slow_send
+        await server.handler(websocket)
+
+    async with serve(slow_link_handler, 'localhost', 0) as websocket_server:
+        port = websocket_server.sockets[0].getsockname()[1]
+        async with connect(f'ws://localhost:{port}') as websocket:
+            async def command(data):
+                await websocket.send(json.dumps(data))
+                while True:
+                    response = json.loads(await websocket.recv())
+                    if response.get('cmd') == data['cmd'] and 'epoch' not in response:
+                        assert 'error' not in response, response
+                        return response
+                    epochs.append(response)
+
+            epochs = []
+            await command({'cmd': 'load_model', 'path': bundle})
+            predict = server.batcher.predictor.predict_positive_proba
+            calls = []
+            def held_back_predict(X):
+                calls.append(len(X))
+                if len(calls) == 1:
+                    time.sleep(0.3)
+                return predict(X)
+            server.batcher.predictor.predict_positive_proba = held_back_predict
+
+            await command({'cmd': 'start_session', 'sampling_frequency': SAMPLING_FREQUENCY})
+            await command({'cmd': 'subscribe'})
+            n_channels = len(server.batcher.predictor.feature_set.channels)
+            for _ in range(PUSHES):
+                await command({'cmd': 'push', 'samples': rng.normal(0, 20, (n_channels, EPOCHS_PER_PUSH * 30 * SAMPLING_FREQUENCY)).tolist()})
+            while len(epochs) < PUSHES * EPOCHS_PER_PUSH:
+                epochs.append(json.loads(await asyncio.wait_for(websocket.recv(), 5)))
+    batcher_task.cancel()
+    return epochs, calls
+
+if __name__ == "__main__":
+    import xgboost as xgb
+    from model_training import FEATURES, MODEL_PARAMS
+    from model_bundle import save_model_bundle
+    with tempfile.TemporaryDirectory() as workdir:
+        rng = np.random.default_rng(1)
+        X = rng.dirichlet(np.ones(len(FEATURES)), size=2000).astype(np.float32)
+        bundle = save_model_bundle(xgb.XGBClassifier(**MODEL_PARAMS).fit(X, X[:, 1] > X[:, 4]), FEATURES, path=os.path.join(workdir, 'bundle'))
+        epochs, calls = asyncio.run(run(bundle))
+
+    assert len(calls) > 1 and sum(calls) == PUSHES * EPOCHS_PER_PUSH, calls # the pushes after the first wait and are scored together
+    assert all(epoch['cmd'] == 'epoch' and 'error' not in epoch for epoch in epochs), epochs
+    assert [epoch['epoch'] for epoch in epochs] == list(range(PUSHES * EPOCHS_PER_PUSH)), [epoch['epoch'] for epoch in epochs]
+    assert all(later['end_time'] > earlier['end_time'] for earlier, later in zip(epochs, epochs[1:]))
+    print(f"{len(epochs)} epochs of {PUSHES} pushes published in order, {len(calls)} scoring batches")
@@ -0,0 +1,300 @@
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+import numpy as np
+from websockets.asyncio.client import connect
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+MODEL_DIR = os.path.abspath(os.path.join(PYTHON_DIR, '..', '..', '..', 'model'))
+sys.path.insert(0, PYTHON_DIR)
+sys.path.insert(0, MODEL_DIR)
+from eegFrames import encode_frame
+
+# starts mainProcess.py on a free localhost port and streams binary EEG frames into it from N concurrent clients,
+# paced at real time or faster; every client measures push_frame round trips and the delay from sending the frame that
+# completes an epoch to receiving its scored epoch message, while the server process's CPU and memory are sampled from /proc
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+def percentiles(values):
+    values = np.asarray(values) * 1e3
+    if len(values) == 0:
+        return {'count': 0, 'p50_ms': float('nan'), 'p95_ms': float('nan'), 'p99_ms': float('nan'), 'max_ms': float('nan')}
+    return {'count': len(values), **{f'p{q}_ms': float(np.percentile(values, q)) for q in (50, 95, 99)}, 'max_ms': float(values.max())}
+
+class ProcessMonitor:
+    # CPU (percent of one core) and resident memory of a process, sampled every interval seconds; Linux only
+
+    def __init__(self, pid, interval=0.25):
+        self.pid = pid
+        self.interval = interval
+        self.cpu = []
+        self.rss_mb = []
+
+    def times(self):
+        with open(f'/proc/{self.pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+    def rss(self):
+        with open(f'/proc/{self.pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+
+    async def run(self):
+        if not os.path.exists(f'/proc/{self.pid}'):
+            return
+        last_times, last_time = self.times(), time.perf_counter()
+        while True:
+            await asyncio.sleep(self.interval)
+            cpu_times, now = self.times(), time.perf_counter()
+            self.cpu.append((cpu_times - last_times) / (now - last_time) * 100)
+            self.rss_mb.append(self.rss())
+            last_times, last_time = cpu_times, now
+
+    def summary(self):
+        if not self.cpu:
+            return {'cpu_mean_percent': None, 'cpu_max_percent': None, 'rss_peak_mb': None}
+        return {'cpu_mean_percent': float(np.mean(self.cpu)), 'cpu_max_percent': float(np.max(self.cpu)), 'rss_peak_mb': float(np.max(self.rss_mb))}
+
+class LoadClient:
+    # one simulated headband: a session on its own connection, frames paced at speed x real time
+    # late: a push_frame response that came back after the next frame was due; dropped: frames or epochs never answered
+
+    def __init__(self, url, signals, sampling_frequency, frame_seconds, speed, duration, loss=0.0, seed=0):
+        self.url = url
+        self.signals = signals
+        self.sampling_frequency = sampling_frequency
+        self.frame_samples = int(round(frame_seconds * sampling_frequency))
+        self.frame_interval = frame_seconds / speed
+        self.n_frames = int(duration / self.frame_interval)
+        self.loss = loss
+        self.rng = np.random.default_rng(seed)
+        self.offset = int(self.rng.integers(signals.shape[1])) # clients replay different parts of the recording
+        self.send_times = np.full(self.n_frames, np.nan)
+        self.sent_frames = [] # sequence numbers actually sent, the server's clock only counts their samples
+        self.pending = set()
+        self.frame_latencies = []
+        self.epoch_latencies = []
+        self.statuses = {}
+        self.late = 0
+        self.behind = 0 # frames the client itself sent late, the harness is saturated if this grows
+        self.lost = 0
+        self.samples_sent = 0
+        self.epochs = 0
+        self.errors = 0
+
+    def frame(self, i):
+        start = (self.offset + i * self.frame_samples) % (self.signals.shape[1] - self.frame_samples)
+        return self.signals[:, start:start + self.frame_samples]
+
+    async def request(self, websocket, message):
+        await websocket.send(json.dumps(message))
+        response = json.loads(await websocket.recv())
+        if 'error' in response:
+            raise RuntimeError(f"{message['cmd']} failed: {response['error']}")
+        return response
+
+    async def read(self, websocket):
+        async for message in websocket:
+            received_time = time.perf_counter()
+            data = json.loads(message)
+            if 'error' in data:
+                self.errors += 1
+            if data.get('cmd') == 'push_frame' and data.get('sequence') in self.pending:
+                self.pending.discard(data['sequence'])
+                latency = received_time - self.send_times[data['sequence']]
+                self.frame_latencies.append(latency)
+                self.late += int(latency > self.frame_interval)
+                self.statuses[data.get('status')] = self.statuses.get(data.get('status'), 0) + 1
+            elif data.get('cmd') == 'epoch' and 'end_time' in data:
+                # the frame holding the epoch's last sample is the one that made it complete
+                frame = self.sent_frames[int(np.ceil(round(data['end_time'] * self.sampling_frequency) / self.frame_samples)) - 1]
+                self.epoch_latencies.append(received_time - self.send_times[frame])
+                self.epochs += 1
+
+    async def run(self, start_delay=0.0, drain_timeout=10.0):
+        async with connect(self.url, max_size=None) as websocket:
+            session = await self.request(websocket, {'cmd': 'start_session', 'sampling_frequency': self.sampling_frequency})
+            await self.request(websocket, {'cmd': 'subscribe'})
+            reader = asyncio.create_task(self.read(websocket))
+            await asyncio.sleep(start_delay)
+
+            loop = asyncio.get_running_loop()
+            start_time = loop.time()
+            for i in range(self.n_frames):
+                delay = start_time + i * self.frame_interval - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                elif delay < -self.frame_interval:
+                    self.behind += 1
+                if self.rng.random() < self.loss:
+                    self.lost += 1 # the sequence number is skipped like a frame lost over the radio link
+                    continue
+                self.pending.add(i)
+                self.sent_frames.append(i)
+                self.send_times[i] = time.perf_counter()
+                self.samples_sent += self.frame_samples
+                await websocket.send(encode_frame(self.frame(i), self.sampling_frequency, i, time.time()))
+
+            expected_epochs = self.samples_sent // session['epoch_samples']
+            deadline = loop.time() + drain_timeout
+            while (self.pending or self.epochs < expected_epochs) and loop.time() < deadline:
+                await asyncio.sleep(0.01)
+            reader.cancel()
+            self.dropped_frames = len(self.pending)
+            self.dropped_epochs = max(expected_epochs - self.epochs, 0)
+
+async def run_level(url, server_pid, bundle, signals, sampling_frequency, args, n_clients):
+    async with connect(url) as websocket:
+        await websocket.send(json.dumps({'cmd': 'load_model', 'path': bundle}))
+        response = json.loads(await websocket.recv())
+        if 'error' in response:
+            raise RuntimeError(f"load_model failed: {response['error']}")
+
+    monitor = ProcessMonitor(server_pid)
+    monitor_task = asyncio.create_task(monitor.run())
+    clients = [LoadClient(url, signals, sampling_frequency, args.frame_seconds, args.speed, args.duration, args.loss, seed=i) for i in range(n_clients)]
+    # starts spread over one frame interval, real devices are not in lockstep
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    start_time = time.perf_counter()
+    await asyncio.gather(*(client.run(start_delay=i / n_clients * clients[0].frame_interval) for i, client in enumerate(clients)))
+    elapsed = time.perf_counter() - start_time
+    harness_usage = resource.getrusage(resource.RUSAGE_SELF)
+    monitor_task.cancel()
+
+    async with connect(url) as websocket:
+        await websocket.send(json.dumps({'cmd': 'stats'}))
+        server_stats = json.loads(await websocket.recv())
+
+    frames = sum(len(client.frame_latencies) for client in clients)
+    statuses = {}
+    for client in clients:
+        for status, count in client.statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+    return {
+        'clients': n_clients,
+        'seconds': elapsed,
+        'frames_per_second': frames / elapsed,
+        'epochs_per_second': sum(client.epochs for client in clients) / elapsed,
+        'frame_rtt': percentiles(np.concatenate([client.frame_latencies for client in clients])),
+        'epoch_latency': percentiles(np.concatenate([client.epoch_latencies for client in clients])),
+        'late_frames': sum(client.late for client in clients),
+        'dropped_frames': sum(client.dropped_frames for client in clients),
+        'dropped_epochs': sum(client.dropped_epochs for client in clients),
+        'lost_frames': sum(client.lost for client in clients),
+        'statuses': statuses,
+        'errors': sum(client.errors for client in clients),
+        'client_behind_frames': sum(client.behind for client in clients),
+        'server': monitor.summary(),
+        'harness_cpu_percent': (harness_usage.ru_utime + harness_usage.ru_stime - usage.ru_utime - usage.ru_stime) / elapsed * 100,
+        'server_stats': {key: server_stats.get(key) for key in ('latency', 'mean_batch_size', 'pending_epochs')}
+    }
+
+def log_tail(path, size=2000):
+    with open(path, 'rb') as f:
+        f.seek(max(0, os.path.getsize(path) - size))
+        return f.read().decode(errors='replace')
+
+async def wait_for_server(url, process, log_path, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with code {process.returncode}: {log_tail(log_path)}')
+        try:
+            async with connect(url):
+                return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise TimeoutError(f'Server did not accept connections on {url} within {timeout} s')
+
+def load_signals(edf_files, channels, hours, sampling_frequency):
+    # replayed PhysioNet recordings (concatenated) or synthetic EEG, channels x samples in uV like the headband sends
+    if edf_files:
+        from preprocessing_functions import read_eeg_signals
+        recordings = [read_eeg_signals(edf_file, channels) for edf_file in edf_files]
+        if len({recording_sampling_frequency for _, recording_sampling_frequency in recordings}) > 1:
+            raise ValueError('Replayed recordings must share one sampling frequency')
+        return np.hstack([signals for signals, _ in recordings]), recordings[0][1]
+    sys.path.insert(0, os.path.join(MODEL_DIR, 'testing', 'benchmarks'))
+    from synthetic import synthetic_signals
+    return synthetic_signals(hours, sampling_frequency, channels=len(channels)) * 1e6, float(sampling_frequency)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Multi-client load test of the WebSocket server on localhost: latency percentiles, late and dropped messages, server CPU and memory')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32], help='concurrent clients, one run with a fresh server per value')
+    parser.add_argument('--speed', type=float, default=10, help='playback speed, 1 streams in real time')
+    parser.add_argument('--duration', type=float, default=30, help='wall clock seconds of streaming per run')
+    parser.add_argument('--frame-seconds', type=float, default=0.25, help='EEG per binary frame')
+    parser.add_argument('--sampling-frequency', type=float, default=100, help='of the synthetic EEG')
+    parser.add_argument('--edf', nargs='+', default=None, help='PhysioNet PSG files to replay instead of synthetic EEG')
+    parser.add_argument('--loss', type=float, default=0.0, help='fraction of frames the clients skip, to exercise gap reporting')
+    parser.add_argument('--bundle', default=None, help='model bundle the server scores with, a synthetic one trained with MODEL_PARAMS by default')
+    parser.add_argument('--output', default=None, help='write the results as JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        bundle = args.bundle
+        if bundle is None:
+            import xgboost as xgb
+            from model_training import FEATURES, MODEL_PARAMS
+            from model_bundle import save_model_bundle
+            rng = np.random.default_rng(1)
+            X = rng.dirichlet(np.ones(len(FEATURES)), size=20000).astype(np.float32)
+            y = ((X[:, 1] - X[:, 4] + rng.normal(0, 0.1, len(X))) > 0).astype(int)
+            bundle = save_model_bundle(xgb.XGBClassifier(**MODEL_PARAMS).fit(X, y), FEATURES, model_params=MODEL_PARAMS, path=os.path.join(workdir, 'bundle'))
+        bundle = os.path.abspath(bundle)
+
+        from model_bundle import load_model_bundle
+        channels = load_model_bundle(bundle).feature_set.channels
+        hours = args.duration * args.speed / 3600 + 0.1
+        signals, sampling_frequency = load_signals(args.edf, channels, hours, args.sampling_frequency)
+
+        results = []
+        for n_clients in args.clients:
+            port = free_port()
+            url = f'ws://localhost:{port}'
+            # the server's log goes to a file, a pipe nobody reads would fill up and stall its event loop on writes
+            log_path = os.path.join(workdir, f'server-{n_clients}.log')
+            with open(log_path, 'wb') as server_log:
+                server = subprocess.Popen([sys.executable, os.path.join(PYTHON_DIR, 'mainProcess.py'), '--port', str(port)], cwd=workdir, stdout=subprocess.DEVNULL, stderr=server_log)
+            try:
+                asyncio.run(wait_for_server(url, server, log_path))
+                results.append(asyncio.run(run_level(url, server.pid, bundle, signals, sampling_frequency, args, n_clients)))
+            except Exception:
+                print(f'Server log ({n_clients} clients):\n{log_tail(log_path)}', file=sys.stderr)
+                raise
+            finally:
+                server.terminate()
+                server.wait()
+
+    print(f"{args.frame_seconds:g} s frames at {args.speed:g}x real time for {args.duration:g} s, {'replayed ' + str(len(args.edf)) + ' recordings' if args.edf else 'synthetic EEG'} at {sampling_frequency:g} Hz")
+    print(f"{'Clients':>7}{'Frames/s':>10}{'Epochs/s':>10}{'Frame RTT p50/p95/p99 (ms)':>29}{'Epoch p50/p95/p99 (ms)':>25}{'Late':>7}{'Dropped':>9}{'Server CPU mean/max %':>23}{'RSS (MB)':>10}{'Harness CPU %':>15}")
+    for result in results:
+        frame_rtt = '/'.join(f"{result['frame_rtt'][f'p{q}_ms']:.1f}" for q in (50, 95, 99))
+        epoch_latency = '/'.join(f"{result['epoch_latency'][f'p{q}_ms']:.1f}" for q in (50, 95, 99))
+        server = result['server']
+        cpu = f"{server['cpu_mean_percent']:.0f}/{server['cpu_max_percent']:.0f}" if server['cpu_mean_percent'] is not None else 'n/a'
+        rss = f"{server['rss_peak_mb']:.0f}" if server['rss_peak_mb'] is not None else 'n/a'
+        print(f"{result['clients']:>7}{result['frames_per_second']:>10.0f}{result['epochs_per_second']:>10.1f}{frame_rtt:>29}{epoch_latency:>25}"
+              f"{result['late_frames']:>7}{result['dropped_frames'] + result['dropped_epochs']:>9}{cpu:>23}{rss:>10}{result['harness_cpu_percent']:>15.0f}")
+    if any(result['client_behind_frames'] for result in results):
+        print('Warning: the harness could not keep up with its own send schedule, latencies include client-side delay')
+    if any(result['errors'] for result in results):
+        print(f"Server errors: {[result['errors'] for result in results]}")
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'parameters': vars(args), 'results': results}, f, indent=1)
+        print(f'Results written to {args.output}')
@@ -0,0 +1,150 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
+from dataset_storage import STORAGE_BACKENDS, DEFAULT_STORAGE_FORMAT, write_json
+from model_bundle import load_model_bundle, latest_model_bundle, MODEL_DIR
+from preprocessing_functions import read_eeg_signals, compute_night_features
+from instrumentation import span, count
+
+# applies a model bundle to a directory of recordings: each night is decoded, featurized with the bundle's feature set
+# (compute_night_features, exactly like the training datasets) and scored in a worker, which writes its hypnogram and only
+# returns a summary, so memory stays at one night per worker however many nights there are
+
+SCORES_DIR = os.path.join('data', 'scores')
+MANIFEST_FILE = 'scores.json'
+
+_predictor = None # loaded once per worker process
+
+def recording_files(paths):
+    # EDF recordings in the given files and directories (recursively), hypnogram annotation files left out
+    edf_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, files in sorted(os.walk(path)):
+                edf_files.extend(os.path.join(directory, file) for file in sorted(files) if file.lower().endswith('.edf') and 'Hypnogram' not in file)
+        else:
+            edf_files.append(path)
+    return edf_files
+
+def recording_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+def _load_predictor(bundle, evaluator):
+    global _predictor
+    _predictor = load_model_bundle(bundle, evaluator=evaluator)
+
+def score_night(path, output_path, storage_format=DEFAULT_STORAGE_FORMAT):
+    # one night through the loaded predictor, the hypnogram is written by the worker itself
+    start_time = time.perf_counter()
+    signals, sampling_frequency = read_eeg_signals(path, _predictor.feature_set.channels)
+    epoch_numbers, columns = compute_night_features(signals, sampling_frequency, _predictor.feature_set)
+    with span('scoring.predict'):
+        probabilities = _predictor.predict_positive_proba(np.column_stack([columns[feature] for feature in _predictor.features]))
+    count('scoring.inferences', len(probabilities))
+
+    hypnogram = {'epoch': np.asarray(epoch_numbers, dtype=np.int32)}
+    if 'start_time' in columns:
+        hypnogram['start_time'] = columns['start_time'].astype(np.float32)
+    hypnogram['probability'] = probabilities.astype(np.float32)
+    hypnogram['stage'] = (probabilities > 0.5).astype(np.int8) # index into the bundle's label_mapping classes
+    with span('scoring.save'):
+        STORAGE_BACKENDS[storage_format].save(pd.DataFrame(hypnogram), output_path)
+    return {'epochs': len(probabilities), 'hours': signals.shape[1] / sampling_frequency / 3600, 'seconds': time.perf_counter() - start_time}
+
+class BatchScorer:
+    # output directory of per-night hypnograms plus a manifest; nights whose recording and bundle are unchanged are skipped
+
+    def __init__(self, bundle=None, output_dir=SCORES_DIR, storage_format=DEFAULT_STORAGE_FORMAT, evaluator=None):
+        self.bundle = latest_model_bundle(MODEL_DIR) if bundle is None else bundle
+        self.output_dir = output_dir
+        self.storage_format = storage_format
+        self.evaluator = evaluator
+        self.manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'nights': {}}
+
+    def output_path(self, name):
+        return os.path.join(self.output_dir, name + STORAGE_BACKENDS[self.storage_format].extension)
+
+    def _source(self, path):
+        stat = os.stat(path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'bundle': os.path.abspath(self.bundle), 'format': self.storage_format}
+
+    def pending(self, edf_files, force=False):
+        names = [recording_name(path) for path in edf_files]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f'Recordings with the same name would overwrite each other: {duplicates}')
+        return [path for path in edf_files if force or self.manifest['nights'].get(recording_name(path), {}).get('source') != self._source(path)]
+
+    def score(self, edf_files, workers=1, force=False, progress=True):
+        # returns the summaries of the nights scored in this run and the failed recordings
+        os.makedirs(self.output_dir, exist_ok=True)
+        pending = self.pending(edf_files, force)
+        predictor = load_model_bundle(self.bundle, evaluator=self.evaluator)
+        self.manifest.update({'bundle': os.path.abspath(self.bundle), 'features': predictor.features, 'feature_set': predictor.feature_set.parameters(),
+                              'classes': predictor.metadata['label_mapping']['classes'], 'format': self.storage_format})
+
+        scored, failed = {}, {}
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_load_predictor, initargs=(self.bundle, self.evaluator)) if workers > 1 else None
+        if executor is None:
+            _load_predictor(self.bundle, self.evaluator)
+        try:
+            if executor is not None:
+                futures = {executor.submit(score_night, path, self.output_path(recording_name(path)), self.storage_format): path for path in pending}
+                results = ((futures[future], future) for future in as_completed(futures))
+            else:
+                results = ((path, None) for path in pending)
+            for path, future in tqdm(results, total=len(pending), desc='Scoring Nights', colour='GREEN', disable=not progress):
+                try:
+                    summary = future.result() if future is not None else score_night(path, self.output_path(recording_name(path)), self.storage_format)
+                except Exception as error:
+                    failed[path] = f'{type(error).__name__}: {error}'
+                    print(f"Failed to score {path}: {failed[path]}")
+                    continue
+                scored[recording_name(path)] = summary
+                self.manifest['nights'][recording_name(path)] = {'path': os.path.abspath(path), 'source': self._source(path), **summary}
+                # written after every night, an interrupted run resumes with the nights that are missing
+                write_json(self.manifest_path, self.manifest)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        write_json(self.manifest_path, self.manifest)
+        return scored, failed
+
+    def load(self, name):
+        return STORAGE_BACKENDS[self.storage_format].load(self.output_path(name))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Score recorded nights with a trained model bundle and write per-epoch hypnograms')
+    parser.add_argument('recordings', nargs='+', help='EDF files or directories searched recursively for them')
+    parser.add_argument('--bundle', default=None, help='model bundle directory, the latest in data/models by default')
+    parser.add_argument('--output', default=SCORES_DIR, help='directory of the hypnograms and scores.json')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='nights scored in parallel')
+    parser.add_argument('--format', default=DEFAULT_STORAGE_FORMAT, choices=sorted(STORAGE_BACKENDS), help='storage format of the hypnograms')
+    parser.add_argument('--evaluator', default=None, choices=['numpy', 'xgboost'])
+    parser.add_argument('--force', action='store_true', help='score nights again even if their hypnogram is up to date')
+    args = parser.parse_args()
+
+    scorer = BatchScorer(args.bundle, args.output, args.format, args.evaluator)
+    edf_files = recording_files(args.recordings)
+    start_time = time.perf_counter()
+    scored, failed = scorer.score(edf_files, workers=args.workers, force=args.force)
+    elapsed = time.perf_counter() - start_time
+
+    epochs = sum(summary['epochs'] for summary in scored.values())
+    hours = sum(summary['hours'] for summary in scored.values())
+    print(f"Scored {len(scored)} nights ({len(edf_files) - len(scored) - len(failed)} up to date, {len(failed)} failed) with {scorer.bundle} in {elapsed:.1f} s")
+    if scored:
+        print(f"{len(scored) / elapsed * 60:.1f} nights/min, {epochs / elapsed:.0f} epochs/s, {hours / elapsed * 3600:.0f}x real time on {args.workers} workers")
+    print(f'Hypnograms in {scorer.output_dir}, classes {scorer.manifest["classes"]}')
+    sys.exit(1 if failed else 0)
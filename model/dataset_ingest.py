@@ -0,0 +1,225 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import pandas as pd
+from tqdm import tqdm
+from dataset_storage import DATA_DIR, STORAGE_BACKENDS, DEFAULT_STORAGE_FORMAT, write_json
+from feature_sets import DEFAULT_FEATURE_SET, get_feature_set
+from epoch_keys import DATA_TYPES, with_epoch_keys, stored_columns
+from preprocessing_functions import physionet_files, edf_file_info, read_eeg_signals, read_annotations, compute_power_bands_for_night, generate_labels, label_epochs, label_parameters
+
+NIGHTS_DIR = os.path.join('data', 'physionet', 'nights')
+
+def file_fingerprint(path, known=None):
+    # the sha256 is only recomputed when the size or mtime differ from the known fingerprint
+    stat = os.stat(path)
+    if known is not None and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+        return known
+
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(block)
+    return {'file': os.path.basename(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256.hexdigest()}
+
+def night_id(data_type, subject_number, night_number):
+    return f'{data_type}-{subject_number}-{night_number}'
+
+class NightDataset:
+    # labelled epochs partitioned into one file per night, <root>/<feature set>/<type>/<subject>/<night><extension>
+    # manifest.json lists every night with the hashes of its source files, rows and stage counts, so ingesting a night again
+    # does nothing unless its files or the feature set changed, and subsets are picked without opening any partition
+
+    def __init__(self, root=NIGHTS_DIR, feature_set=None, storage_format=None):
+        self.feature_set = get_feature_set(feature_set)
+        self.storage_format = DEFAULT_STORAGE_FORMAT if storage_format is None else storage_format
+        self.directory = os.path.join(root, self.feature_set.name)
+        self.manifest_path = os.path.join(self.directory, 'manifest.json')
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'nights': {}}
+        # nights extracted with other parameters (an older version of the set) are stale until ingested again
+        self.parameters = {'features': self.feature_set.parameters(), 'labels': label_parameters()}
+        self.parameters_hash = hashlib.sha256(json.dumps(self.parameters, sort_keys=True).encode()).hexdigest()[:12]
+
+    def _save_manifest(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.manifest['feature_set'] = self.parameters['features']
+        write_json(self.manifest_path, self.manifest)
+
+    def _remove_partition(self, entry):
+        path = os.path.join(self.directory, entry['path'])
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def ingest(self, psg_path, hypnogram_path=None, data_type=None, subject_number=None, night_number=None, force=False):
+        # one PSG and optionally its hypnogram; returns 'added', 'updated' or 'unchanged' and the manifest entry
+        # type/subject/night default to the ones in a Sleep-EDF file name, recordings of our own need all three given
+        given = [value is not None for value in (data_type, subject_number, night_number)]
+        if any(given) and not all(given):
+            raise ValueError(f'type, subject and night are given together or not at all, got {data_type!r}, {subject_number!r}, {night_number!r}')
+        if not any(given):
+            _, data_type, subject_number, night_number = edf_file_info(os.path.basename(psg_path))
+        # subject and night are numbers packed into the epoch keys, the type one of epoch_keys.DATA_TYPES
+        if data_type not in DATA_TYPES or not str(subject_number).isdigit() or not str(night_number).isdigit():
+            raise ValueError(f"type must be one of {', '.join(DATA_TYPES)} and subject and night numbers, got {data_type!r}, {subject_number!r}, {night_number!r}")
+        subject_number, night_number = f'{int(subject_number):02d}', str(int(night_number))
+
+        night = night_id(data_type, subject_number, night_number)
+        entry = self.manifest['nights'].get(night)
+        psg = file_fingerprint(psg_path, entry['psg'] if entry is not None else None)
+        hypnogram = file_fingerprint(hypnogram_path, entry['hypnogram'] if entry is not None else None) if hypnogram_path is not None else None
+        description = {'psg': psg['sha256'], 'hypnogram': hypnogram['sha256'] if hypnogram is not None else None, 'parameters': self.parameters_hash}
+        key = hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()[:32]
+
+        if entry is not None and entry['key'] == key and not force and os.path.exists(os.path.join(self.directory, entry['path'])):
+            # same contents, only a touched file: keep the new mtime so it is not hashed again
+            if (psg, hypnogram) != (entry['psg'], entry['hypnogram']):
+                entry.update(psg=psg, hypnogram=hypnogram)
+                self._save_manifest()
+            return 'unchanged', entry
+
+        signals, sampling_frequency = read_eeg_signals(psg_path, self.feature_set.channels)
+        night_df = compute_power_bands_for_night(signals, sampling_frequency, data_type, subject_number, night_number, feature_set=self.feature_set)
+        if hypnogram is not None:
+            labels_df = generate_labels(read_annotations(hypnogram_path, data_type, subject_number, night_number), data_type, subject_number, night_number)
+            night_df = label_epochs(night_df, labels_df)
+        else:
+            night_df['sleep_stage'] = 'N'
+
+        path = os.path.join(data_type, subject_number, night_number + STORAGE_BACKENDS[self.storage_format].extension)
+        if entry is not None and entry['path'] != path:
+            self._remove_partition(entry)
+        os.makedirs(os.path.dirname(os.path.join(self.directory, path)), exist_ok=True)
+        STORAGE_BACKENDS[self.storage_format].save(night_df, os.path.join(self.directory, path))
+
+        self.manifest['nights'][night] = {
+            'type': data_type,
+            'subject': subject_number,
+            'night': night_number,
+            'path': path,
+            'storage_format': self.storage_format,
+            'psg': psg,
+            'hypnogram': hypnogram,
+            'key': key,
+            'parameters': self.parameters_hash,
+            'sampling_frequency': sampling_frequency,
+            'rows': len(night_df),
+            'labelled': hypnogram is not None,
+            'stages': {str(stage): int(count) for stage, count in night_df['sleep_stage'].value_counts().items()},
+            'ingested': time.time()
+        }
+        self._save_manifest()
+        return 'added' if entry is None else 'updated', self.manifest['nights'][night]
+
+    def select(self, types=None, subjects=None, nights=None, labelled=None):
+        # night ids of the manifest matching every given filter, in sorted order
+        selected = []
+        for night, entry in sorted(self.manifest['nights'].items()):
+            if types is not None and entry['type'] not in types:
+                continue
+            if subjects is not None and entry['subject'] not in subjects:
+                continue
+            if nights is not None and night not in nights:
+                continue
+            if labelled is not None and entry['labelled'] != labelled:
+                continue
+            selected.append(night)
+        return selected
+
+    def stale(self):
+        return [night for night, entry in sorted(self.manifest['nights'].items()) if entry['parameters'] != self.parameters_hash]
+
+    def load(self, columns=None, **selection):
+        # concatenated epochs of the selected nights (all of them by default), only the requested columns are read
+        selected = self.select(**selection)
+        stale = [night for night in selected if self.manifest['nights'][night]['parameters'] != self.parameters_hash]
+        if stale:
+            raise ValueError(f"Nights extracted with other {self.feature_set.name} parameters, ingest them again: {', '.join(stale)}")
+        if not selected:
+            raise FileNotFoundError(f"No ingested nights in {self.directory} match {selection}")
+
+        frames = []
+        for night in selected:
+            entry = self.manifest['nights'][night]
+            backend, path = STORAGE_BACKENDS[entry['storage_format']], os.path.join(self.directory, entry['path'])
+            frames.append(with_epoch_keys(backend.load(path, columns=stored_columns(columns, backend.columns(path)))))
+        return pd.concat(frames, ignore_index=True)
+
+    def remove(self, night):
+        if night not in self.manifest['nights']:
+            raise ValueError(f"No ingested night {night!r}, the ingested nights are: {', '.join(sorted(self.manifest['nights'])) or 'none'}")
+        entry = self.manifest['nights'].pop(night)
+        self._remove_partition(entry)
+        self._save_manifest()
+        return entry
+
+    def entries(self):
+        rows = [{'night': night, **{field: entry[field] for field in ('type', 'subject', 'rows', 'labelled', 'storage_format')}, 'stale': entry['parameters'] != self.parameters_hash, 'ingested': entry['ingested']}
+                for night, entry in sorted(self.manifest['nights'].items())]
+        entries_df = pd.DataFrame(rows, columns=['night', 'type', 'subject', 'rows', 'labelled', 'storage_format', 'stale', 'ingested'])
+        entries_df['ingested'] = pd.to_datetime(entries_df['ingested'], unit='s')
+        return entries_df
+
+def physionet_nights(directory=DATA_DIR):
+    # (psg, hypnogram) paths of every downloaded Sleep-EDF night, paired by the recording prefix, e.g. SC4001
+    def path(edf_file):
+        return os.path.join(directory, f'sleep-{edf_file_info(edf_file)[1]}', edf_file)
+    hypnograms = {edf_file[:6]: path(edf_file) for edf_file in physionet_files(hypnograms=True, directory=directory)}
+    return [(path(edf_file), hypnograms.get(edf_file[:6])) for edf_file in physionet_files(directory=directory) if edf_file.endswith('PSG.edf')]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Ingest single nights into the partitioned, labelled dataset without rebuilding it')
+    parser.add_argument('--root', default=NIGHTS_DIR)
+    parser.add_argument('--feature-set', default=DEFAULT_FEATURE_SET)
+    parser.add_argument('--format', choices=list(STORAGE_BACKENDS), default=DEFAULT_STORAGE_FORMAT, help='storage format of new partitions')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    ingest_parser = subparsers.add_parser('ingest', help='ingest one recording, with or without a hypnogram')
+    ingest_parser.add_argument('psg', help='EDF with the EEG channels of the feature set')
+    ingest_parser.add_argument('--hypnogram', default=None, help='EDF+ with the sleep stage annotations, the night is stored unlabelled without one')
+    ingest_parser.add_argument('--type', default=None, help='e.g. headband, taken from Sleep-EDF file names by default')
+    ingest_parser.add_argument('--subject', default=None, help='subject number')
+    ingest_parser.add_argument('--night', default=None, help='night number')
+    ingest_parser.add_argument('--force', action='store_true', help='extract again even if nothing changed')
+    physionet_parser = subparsers.add_parser('physionet', help='ingest every downloaded Sleep-EDF night')
+    physionet_parser.add_argument('--force', action='store_true')
+    subparsers.add_parser('list', help='list the ingested nights')
+    remove_parser = subparsers.add_parser('remove', help='remove nights by id, e.g. cassette-00-1')
+    remove_parser.add_argument('nights', nargs='+')
+    args = parser.parse_args(argv)
+
+    dataset = NightDataset(args.root, args.feature_set, args.format)
+    if args.command == 'ingest':
+        if (args.type, args.subject, args.night).count(None) not in (0, 3):
+            parser.error('--type, --subject and --night are given together or not at all')
+        status, entry = dataset.ingest(args.psg, args.hypnogram, args.type, args.subject, args.night, force=args.force)
+        print(f"{night_id(entry['type'], entry['subject'], entry['night'])}: {status}, {entry['rows']} epochs {entry['stages']}")
+    elif args.command == 'physionet':
+        statuses = {'added': 0, 'updated': 0, 'unchanged': 0}
+        for psg_path, hypnogram_path in tqdm(physionet_nights(), desc='Ingesting Nights', colour='GREEN'):
+            status, _ = dataset.ingest(psg_path, hypnogram_path, force=args.force)
+            statuses[status] += 1
+        print(', '.join(f'{count} {status}' for status, count in statuses.items()))
+    elif args.command == 'list':
+        entries_df = dataset.entries()
+        print(entries_df.to_string(index=False))
+        print(f"{len(entries_df)} nights, {entries_df['rows'].sum()} epochs, {entries_df['stale'].sum()} stale")
+    elif args.command == 'remove':
+        # every id is checked before anything is removed
+        unknown = [night for night in args.nights if night not in dataset.manifest['nights']]
+        if unknown:
+            parser.error(f"no ingested nights {', '.join(unknown)}; the ingested nights are: {', '.join(sorted(dataset.manifest['nights'])) or 'none'}")
+        for night in args.nights:
+            dataset.remove(night)
+        print(f"Removed {len(args.nights)} nights")
+
+if __name__ == "__main__":
+    sys.exit(main())
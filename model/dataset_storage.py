@@ -0,0 +1,132 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+DATA_DIR = os.path.join('data', 'physionet')
+
+def write_json(path, data):
+    # indexes and manifests are replaced atomically, an interrupted write leaves the previous version in place
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+class NpyStorage:
+    # one .npy file per column plus a meta.json with the column order and dtypes
+    # reads are memory-mapped, so only the requested columns are ever paged in
+    extension = '.npy.d'
+
+    def save(self, df, path):
+        tmp_path = path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        dtypes = {}
+        for i, column in enumerate(df.columns):
+            if pd.api.types.is_numeric_dtype(df[column]) or pd.api.types.is_bool_dtype(df[column]):
+                values = df[column].to_numpy()
+                dtypes[column] = str(values.dtype)
+            else:
+                values = df[column].to_numpy(dtype=str)
+                dtypes[column] = 'str'
+            np.save(os.path.join(tmp_path, f'{i:03d}.npy'), values)
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump({'columns': list(df.columns), 'dtypes': dtypes, 'rows': len(df)}, f, indent=1)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    def load(self, path, columns=None):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        columns = meta['columns'] if columns is None else columns
+        missing = [column for column in columns if column not in meta['columns']]
+        if missing:
+            raise KeyError(f'Columns not in {path}: {missing}')
+
+        data = {}
+        for column in columns:
+            values = np.load(os.path.join(path, f"{meta['columns'].index(column):03d}.npy"), mmap_mode='r')
+            data[column] = values.astype(object) if meta['dtypes'][column] == 'str' else values
+        return pd.DataFrame(data, copy=False)
+
+    def columns(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            return json.load(f)['columns']
+
+class ParquetStorage:
+    extension = '.parquet'
+
+    def save(self, df, path):
+        df.to_parquet(path, index=False)
+
+    def load(self, path, columns=None):
+        return pd.read_parquet(path, columns=columns, memory_map=True)
+
+    def columns(self, path):
+        from pyarrow import parquet
+        return parquet.read_schema(path).names
+
+class FeatherStorage:
+    # written uncompressed so that memory-mapped reads are zero copy
+    extension = '.feather'
+
+    def save(self, df, path):
+        df.reset_index(drop=True).to_feather(path, compression='uncompressed')
+
+    def load(self, path, columns=None):
+        from pyarrow import feather
+        return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+    def columns(self, path):
+        from pyarrow import feather
+        return feather.read_table(path, memory_map=True).schema.names
+
+class CsvStorage:
+    # kept for exports and for datasets written before the binary formats existed
+    extension = '.csv'
+
+    def save(self, df, path):
+        df.to_csv(path, index=False)
+
+    def load(self, path, columns=None):
+        return pd.read_csv(path, usecols=columns)[columns] if columns is not None else pd.read_csv(path)
+
+    def columns(self, path):
+        return list(pd.read_csv(path, nrows=0).columns)
+
+STORAGE_BACKENDS = {
+    'npy': NpyStorage(),
+    'parquet': ParquetStorage(),
+    'feather': FeatherStorage(),
+    'csv': CsvStorage()
+}
+DEFAULT_STORAGE_FORMAT = 'npy'
+
+def register_storage_backend(storage_format, backend):
+    # backend needs an extension attribute and save(df, path) / load(path, columns=None) / columns(path) methods
+    STORAGE_BACKENDS[storage_format] = backend
+
+def dataset_path(name, storage_format):
+    return os.path.join(DATA_DIR, name + STORAGE_BACKENDS[storage_format].extension)
+
+def find_dataset(name):
+    # first format the dataset exists in, binary formats before csv
+    for storage_format in STORAGE_BACKENDS:
+        if os.path.exists(dataset_path(name, storage_format)):
+            return storage_format
+    raise FileNotFoundError(f"No stored dataset named {name} in {DATA_DIR}")
+
+def save_dataset(df, name, storage_format=None):
+    storage_format = DEFAULT_STORAGE_FORMAT if storage_format is None else storage_format
+    path = dataset_path(name, storage_format)
+    STORAGE_BACKENDS[storage_format].save(df, path)
+    return path
+
+def load_dataset(name, columns=None, storage_format=None):
+    storage_format = find_dataset(name) if storage_format is None else storage_format
+    return STORAGE_BACKENDS[storage_format].load(dataset_path(name, storage_format), columns=columns)
+
+def dataset_columns(name, storage_format=None):
+    storage_format = find_dataset(name) if storage_format is None else storage_format
+    return STORAGE_BACKENDS[storage_format].columns(dataset_path(name, storage_format))
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+# epochs are identified by one int64 instead of the 'cassette-01-1-0042' string:
+# bits 56-62 recording type, 40-55 subject, 32-39 night, 0-31 epoch number
+# keys sort like the legacy strings within a night and (keys >> 32) / (keys >> 40) identify the night / person
+EPOCH_KEY = 'epochKey'
+LEGACY_EPOCH_ID = 'epochId'
+
+# codes are stored in every dataset, so a type keeps its code once registered
+DATA_TYPES = {'cassette': 1, 'telemetry': 2, 'headband': 3}
+DATA_TYPE_NAMES = {code: data_type for data_type, code in DATA_TYPES.items()}
+
+def register_data_type(data_type, code):
+    if not 0 < code < 128 or DATA_TYPE_NAMES.get(code, data_type) != data_type:
+        raise ValueError(f'Data type code {code} is out of range or taken by {DATA_TYPE_NAMES.get(code)}')
+    DATA_TYPES[data_type] = code
+    DATA_TYPE_NAMES[code] = data_type
+
+def data_type_code(data_type):
+    if data_type not in DATA_TYPES:
+        raise ValueError(f"Unknown data type {data_type}, register it with register_data_type first")
+    return DATA_TYPES[data_type]
+
+def pack_epoch_keys(data_type, subject_number, night_number, epochs):
+    # subject and night are the digit strings of the file names (or ints), epochs one number or an array
+    subject_number, night_number = int(subject_number), int(night_number)
+    if not 0 <= subject_number < 1 << 16 or not 0 <= night_number < 1 << 8:
+        raise ValueError(f'Subject {subject_number} or night {night_number} out of range')
+    night_key = (data_type_code(data_type) << 24) | (subject_number << 8) | night_number
+    return (np.int64(night_key) << 32) | np.asarray(epochs, dtype=np.int64)
+
+def epoch_numbers(keys):
+    return np.asarray(keys, dtype=np.int64) & 0xFFFFFFFF
+
+def night_keys(keys):
+    return np.asarray(keys, dtype=np.int64) >> 32
+
+def person_keys(keys):
+    return np.asarray(keys, dtype=np.int64) >> 40
+
+def _night_prefix(night_key):
+    return f"{DATA_TYPE_NAMES[night_key >> 24]}-{(night_key >> 8) & 0xFFFF:02d}-{night_key & 0xFF}"
+
+def format_epoch_ids(keys):
+    # legacy 'type-subject-night-epoch' strings, only for exports; each night's prefix is formatted once
+    keys = np.asarray(keys, dtype=np.int64)
+    nights, inverse = np.unique(night_keys(keys), return_inverse=True)
+    prefixes = np.array([_night_prefix(int(night)) + '-' for night in nights], dtype=object)
+    return prefixes[inverse.reshape(-1)] + pd.Series(epoch_numbers(keys)).astype(str).str.zfill(4).to_numpy(dtype=object)
+
+def parse_epoch_ids(epoch_ids):
+    # inverse of format_epoch_ids, for datasets and caches written before the keys; each night's prefix is parsed once
+    parts = pd.Series(epoch_ids, dtype=object).str.rpartition('-')
+    prefixes, inverse = np.unique(parts[0].to_numpy(dtype=str), return_inverse=True)
+    night_key_values = np.array([pack_epoch_keys(*prefix.split('-'), 0) for prefix in prefixes], dtype=np.int64)
+    return night_key_values[inverse.reshape(-1)] | parts[2].to_numpy(dtype=np.int64)
+
+def with_epoch_keys(df):
+    # frames with the legacy string column get the key in its place, frames with keys are returned as they are
+    if EPOCH_KEY in df.columns or LEGACY_EPOCH_ID not in df.columns:
+        return df
+    df = df.rename(columns={LEGACY_EPOCH_ID: EPOCH_KEY})
+    df[EPOCH_KEY] = parse_epoch_ids(df[EPOCH_KEY])
+    return df
+
+def with_epoch_ids(df):
+    # the export layout: the key replaced by the legacy string column
+    if EPOCH_KEY not in df.columns:
+        return df
+    df = df.rename(columns={EPOCH_KEY: LEGACY_EPOCH_ID})
+    df[LEGACY_EPOCH_ID] = format_epoch_ids(df[LEGACY_EPOCH_ID])
+    return df
+
+def stored_columns(columns, available):
+    # the columns to read from a dataset that may still store the legacy string instead of the key
+    if columns is None or EPOCH_KEY in available or LEGACY_EPOCH_ID not in available:
+        return columns
+    return [LEGACY_EPOCH_ID if column == EPOCH_KEY else column for column in columns]
+
+def _categorical(codes, names):
+    # categories formatted once per distinct code instead of once per row
+    categories, inverse = np.unique(codes, return_inverse=True)
+    return pd.Categorical.from_codes(inverse.reshape(-1), [names(int(code)) for code in categories])
+
+def epoch_categories(keys):
+    # categorical type/subject/night/person columns of the keys, person is the legacy type initial + subject, e.g. c01
+    keys = np.asarray(keys, dtype=np.int64)
+    nights = night_keys(keys)
+    return pd.DataFrame({
+        'type': _categorical(nights >> 24, lambda code: DATA_TYPE_NAMES[code]),
+        'subject': _categorical((nights >> 8) & 0xFFFF, lambda subject: f'{subject:02d}'),
+        'night': _categorical(nights & 0xFF, str),
+        'person': _categorical(person_keys(keys), lambda person: f'{DATA_TYPE_NAMES[person >> 16][0]}{person & 0xFFFF:02d}')
+    })
+
+def factorize_persons(keys):
+    # person code of every epoch in order of first appearance and the person labels, like pd.factorize on the legacy strings
+    person_codes, persons = pd.factorize(person_keys(keys))
+    return person_codes, [f'{DATA_TYPE_NAMES[person >> 16][0]}{person & 0xFFFF:02d}' for person in persons.tolist()]
@@ -0,0 +1,181 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import contextlib
+import numpy as np
+import pandas as pd
+from dataset_storage import write_json
+try:
+    import fcntl
+except ImportError: # no advisory locks on windows, the merge on save still keeps concurrent entries
+    fcntl = None
+
+CACHE_DIR = os.path.join('data', 'physionet', 'feature_cache')
+MAX_CACHE_BYTES = 2 * 1024**3
+
+class FeatureCache:
+    # per-night cache of extracted frames, keyed by the sha256 of the source EDF plus the extraction parameters
+    # index.json tracks entry sizes and last use for LRU eviction, and memoizes file hashes by size and mtime
+    # lookups and puts only change the index in memory, save() merges it with the file under a lock once per batch
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = self._read_index()
+        self.removed = set()
+
+    def _read_index(self):
+        if not os.path.exists(self.index_path):
+            return {'entries': {}, 'hashes': {}}
+        with open(self.index_path) as f:
+            return json.load(f)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with open(os.path.join(self.cache_dir, 'index.lock'), 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(self, max_bytes=None):
+        # other processes may have saved since this index was read: their entries and hashes are kept (unless removed here),
+        # entries whose file another process removed are dropped, the later last use wins, and the LRU eviction runs on the merged index
+        with self._locked():
+            saved = self._read_index()
+            self.index['entries'] = {key: entry for key, entry in self.index['entries'].items() if os.path.exists(self._entry_path(key))}
+            for key, entry in saved['entries'].items():
+                if key in self.removed or not os.path.exists(self._entry_path(key)):
+                    continue
+                if key not in self.index['entries']:
+                    self.index['entries'][key] = entry
+                else:
+                    self.index['entries'][key]['last_used'] = max(self.index['entries'][key]['last_used'], entry['last_used'])
+            self.index['hashes'] = {**saved['hashes'], **self.index['hashes']}
+            evicted = self._evict(self.max_bytes if max_bytes is None else max_bytes)
+            write_json(self.index_path, self.index)
+            self.removed.clear()
+        return evicted
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.npz')
+
+    def file_hash(self, path):
+        stat = os.stat(path)
+        known = self.index['hashes'].get(os.path.abspath(path))
+        if known is not None and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['sha256']
+
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha256.update(block)
+        self.index['hashes'][os.path.abspath(path)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256.hexdigest()}
+        return sha256.hexdigest()
+
+    def key(self, kind, path, parameters):
+        description = json.dumps({'kind': kind, 'file': self.file_hash(path), 'parameters': parameters}, sort_keys=True)
+        return hashlib.sha256(description.encode()).hexdigest()[:32]
+
+    def get(self, key):
+        entry = self.index['entries'].get(key)
+        if entry is None or not os.path.exists(self._entry_path(key)):
+            return None
+
+        with np.load(self._entry_path(key), allow_pickle=False) as arrays:
+            df = pd.DataFrame({column: arrays[column] for column in entry['columns']})
+        entry['last_used'] = time.time()
+        return df
+
+    def put(self, key, df, kind, source):
+        # string columns are stored as fixed width unicode so the archive never needs pickle
+        arrays = {column: df[column].to_numpy() if pd.api.types.is_numeric_dtype(df[column]) else df[column].to_numpy(dtype=str) for column in df.columns}
+        tmp_path = self._entry_path(key) + '.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, self._entry_path(key))
+
+        now = time.time()
+        self.index['entries'][key] = {
+            'kind': kind,
+            'source': os.path.basename(source),
+            'columns': list(df.columns),
+            'rows': len(df),
+            'size': os.path.getsize(self._entry_path(key)),
+            'created': now,
+            'last_used': now
+        }
+
+    def _remove(self, key):
+        self.index['entries'].pop(key, None)
+        self.removed.add(key)
+        if os.path.exists(self._entry_path(key)):
+            os.remove(self._entry_path(key))
+
+    def _evict(self, max_bytes):
+        # least recently used entries go first until the cache fits
+        entries = sorted(self.index['entries'].items(), key=lambda item: item[1]['last_used'])
+        total_size = sum(entry['size'] for _, entry in entries)
+        evicted = 0
+        for key, entry in entries:
+            if total_size <= max_bytes:
+                break
+            total_size -= entry['size']
+            self._remove(key)
+            evicted += 1
+        return evicted
+
+    def evict(self, max_bytes=None):
+        return self.save(max_bytes)
+
+    def invalidate(self, source=None, kind=None):
+        # drops every entry matching the source file name and/or kind, everything if neither is given
+        keys = [key for key, entry in self.index['entries'].items() if (source is None or entry['source'] == os.path.basename(source)) and (kind is None or entry['kind'] == kind)]
+        for key in keys:
+            self._remove(key)
+        self.save()
+        return len(keys)
+
+    def entries(self):
+        rows = [{'key': key, **{field: entry[field] for field in ('kind', 'source', 'rows', 'size', 'created', 'last_used')}} for key, entry in self.index['entries'].items()]
+        entries_df = pd.DataFrame(rows, columns=['key', 'kind', 'source', 'rows', 'size', 'created', 'last_used'])
+        for column in ('created', 'last_used'):
+            entries_df[column] = pd.to_datetime(entries_df[column], unit='s')
+        return entries_df.sort_values(['kind', 'source'], ignore_index=True)
+
+    def total_size(self):
+        return sum(entry['size'] for entry in self.index['entries'].values())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inspect and invalidate the per-night feature cache')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help='list cache entries')
+    invalidate_parser = subparsers.add_parser('invalidate', help='remove entries by source file and/or kind')
+    invalidate_parser.add_argument('--source', help='EDF file name, e.g. SC4001E0-PSG.edf')
+    invalidate_parser.add_argument('--kind', choices=['features', 'labels'])
+    subparsers.add_parser('clear', help='remove every entry')
+    evict_parser = subparsers.add_parser('evict', help='evict least recently used entries down to a size')
+    evict_parser.add_argument('--max-mb', type=float, required=True)
+    args = parser.parse_args(argv)
+
+    cache = FeatureCache(args.cache_dir)
+    if args.command == 'list':
+        print(cache.entries().to_string(index=False))
+        print(f"{len(cache.index['entries'])} entries, {cache.total_size() / 1e6:.2f} MB")
+    elif args.command == 'invalidate':
+        print(f"Removed {cache.invalidate(source=args.source, kind=args.kind)} entries")
+    elif args.command == 'clear':
+        print(f"Removed {cache.invalidate()} entries")
+    elif args.command == 'evict':
+        print(f"Evicted {cache.evict(max_bytes=args.max_mb * 1e6)} entries")
+
+if __name__ == "__main__":
+    sys.exit(main())
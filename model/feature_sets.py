@@ -0,0 +1,217 @@
+import numpy as np
+from functools import lru_cache
+from numpy.lib.stride_tricks import sliding_window_view
+
+EPOCH_SECONDS = 30
+
+# (lower, upper) edges in Hz, lower inclusive and upper exclusive, None means up to nyquist
+POWER_BANDS = {
+    'subdelta': (0, 0.5),
+    'delta': (0.5, 4),
+    'theta': (4, 8),
+    'alpha': (8, 12),
+    'beta': (12, 30),
+    'gamma': (30, None)
+}
+
+EEG_CHANNELS = {
+    'anterior': 'EEG Fpz-Cz',
+    'posterior': 'EEG Pz-Oz'
+}
+
+PSD_METHODS = ('periodogram', 'welch', 'multitaper')
+
+@lru_cache(maxsize=None)
+def band_bin_edges(n_samples, sampling_frequency, bands=None):
+    # rfft bin index range [start, stop) of every band for an n_samples long transform
+    # bands is a tuple of (name, (low, high)) items so the result can be cached, POWER_BANDS by default
+    freqs = np.fft.rfftfreq(n_samples, d=1/sampling_frequency)
+    edges = {}
+    for band, (low, high) in (tuple(POWER_BANDS.items()) if bands is None else bands):
+        start = int(np.searchsorted(freqs, low, side='left'))
+        stop = len(freqs) if high is None else int(np.searchsorted(freqs, high, side='left'))
+        edges[band] = (start, stop)
+    return edges
+
+@lru_cache(maxsize=None)
+def spectral_windows(method, n_samples, bandwidth):
+    # (tapers x n_samples) window functions, a single rectangular window for the periodogram
+    if method == 'periodogram':
+        return np.ones((1, n_samples)) # only used for scaling, the periodogram skips the multiply
+    if method == 'welch':
+        return np.hanning(n_samples + 1)[:-1][None, :] # periodic hann, as scipy.signal.welch uses
+    from scipy.signal.windows import dpss
+    return dpss(n_samples, bandwidth, Kmax=max(1, int(2 * bandwidth) - 1))
+
+class FeatureSet:
+    # named, versioned recipe turning (channels x samples) EEG into per-epoch spectral features
+    # parameters() goes into the feature cache key and into every model bundle trained on the set,
+    # so bump the version whenever the definition of a registered set changes
+    #
+    # per channel prefix the columns are
+    #   {prefix}_{band}              relative power, the band's share of the summed spectrum
+    #   {prefix}_{band}_abs          absolute band power in uV^2 (one-sided, sums to the epoch's mean square)
+    #   {prefix}_{numerator}_{denominator}   band power ratio, e.g. anterior_theta_delta
+
+    def __init__(self, name, version, bands=POWER_BANDS, channels=EEG_CHANNELS, psd='periodogram', relative=True, absolute=False, ratios=(),
+                 epoch_seconds=EPOCH_SECONDS, hop_seconds=None, welch_seconds=4, welch_overlap=0.5, multitaper_bandwidth=2, decimals=None):
+        if psd not in PSD_METHODS:
+            raise ValueError(f"Unknown psd method {psd}, expected one of {', '.join(PSD_METHODS)}")
+        hop_seconds = epoch_seconds if hop_seconds is None else hop_seconds
+        if not 0 < hop_seconds <= epoch_seconds:
+            raise ValueError('hop_seconds must be between 0 and epoch_seconds')
+        for numerator, denominator in ratios:
+            if numerator not in bands or denominator not in bands:
+                raise ValueError(f'Ratio {numerator}/{denominator} uses a band that is not defined')
+
+        self.name = name
+        self.version = version
+        self.bands = {band: tuple(edges) for band, edges in bands.items()}
+        self.channels = dict(channels)
+        self.psd = psd
+        self.relative = relative
+        self.absolute = absolute
+        self.ratios = [tuple(ratio) for ratio in ratios]
+        self.epoch_seconds = epoch_seconds
+        self.hop_seconds = hop_seconds
+        self.welch_seconds = welch_seconds
+        self.welch_overlap = welch_overlap
+        self.multitaper_bandwidth = multitaper_bandwidth
+        self.decimals = decimals
+
+    def parameters(self):
+        return {
+            'name': self.name,
+            'version': self.version,
+            'bands': self.bands,
+            'channels': self.channels,
+            'psd': self.psd,
+            'relative': self.relative,
+            'absolute': self.absolute,
+            'ratios': self.ratios,
+            'epoch_seconds': self.epoch_seconds,
+            'hop_seconds': self.hop_seconds,
+            'welch_seconds': self.welch_seconds,
+            'welch_overlap': self.welch_overlap,
+            'multitaper_bandwidth': self.multitaper_bandwidth,
+            'decimals': self.decimals
+        }
+
+    @classmethod
+    def from_parameters(cls, parameters):
+        # rebuilds a set from the parameters recorded in a cache entry or model bundle
+        parameters = dict(parameters)
+        return cls(parameters.pop('name'), parameters.pop('version'), **parameters)
+
+    def columns(self):
+        columns = []
+        for prefix in self.channels:
+            columns.extend(f'{prefix}_{band}' for band in self.bands if self.relative)
+            columns.extend(f'{prefix}_{band}_abs' for band in self.bands if self.absolute)
+            columns.extend(f'{prefix}_{numerator}_{denominator}' for numerator, denominator in self.ratios)
+        return columns
+
+    def overlapping(self):
+        return self.hop_seconds != self.epoch_seconds
+
+    def epoch_offsets(self, n_samples, sampling_frequency):
+        # sample offset and length of every epoch; non-overlapping epochs keep a truncated last epoch like the
+        # original 30 s split, sliding epochs only include windows that fit completely
+        epoch_samples = int(round(self.epoch_seconds * sampling_frequency))
+        hop_samples = int(round(self.hop_seconds * sampling_frequency))
+        last_start = n_samples - 1 if not self.overlapping() else n_samples - epoch_samples
+        epoch_starts = np.arange(0, max(last_start + 1, 0), hop_samples)
+        epoch_lengths = np.minimum(epoch_samples, n_samples - epoch_starts)
+        return epoch_starts, epoch_lengths
+
+    def spectrum(self, windows, sampling_frequency):
+        # power per rfft bin of (... x samples) windows, all leading axes are transformed in one call
+        # returns the unscaled power (relative power and ratios are computed from it, as in compute_power_bands)
+        # and the per-bin weights converting it to one-sided absolute power
+        n_samples = windows.shape[-1]
+        if self.psd == 'periodogram':
+            power = np.abs(np.fft.rfft(windows, axis=-1))**2
+        elif self.psd == 'welch':
+            n_samples = min(n_samples, int(round(self.welch_seconds * sampling_frequency)))
+            step = max(1, int(round(n_samples * (1 - self.welch_overlap))))
+            segments = sliding_window_view(windows, n_samples, axis=-1)[..., ::step, :]
+            power = np.mean(np.abs(np.fft.rfft(segments * spectral_windows('welch', n_samples, None)[0], axis=-1))**2, axis=-2)
+        else:
+            tapers = spectral_windows('multitaper', n_samples, self.multitaper_bandwidth)
+            power = np.mean(np.abs(np.fft.rfft(windows[..., None, :] * tapers, axis=-1))**2, axis=-2)
+
+        window = spectral_windows(self.psd, n_samples, self.multitaper_bandwidth)[0]
+        weights = np.full(power.shape[-1], 2 / (n_samples * np.sum(window**2)))
+        weights[0] /= 2 # dc and nyquist have no negative frequency twin
+        if n_samples % 2 == 0:
+            weights[-1] /= 2
+        return power, n_samples, weights
+
+    def features(self, windows, sampling_frequency):
+        # windows is (channels x epochs x samples) of equal length epochs, returns {column: values}
+        windows = np.asarray(windows, dtype=np.float64)
+        power, n_samples, weights = self.spectrum(windows, sampling_frequency)
+        edges = band_bin_edges(n_samples, float(sampling_frequency), tuple(self.bands.items()))
+        total_power = np.sum(power, axis=-1)
+
+        columns = {}
+        for i, prefix in enumerate(self.channels):
+            band_power = {band: np.sum(power[i, :, start:stop], axis=1) for band, (start, stop) in edges.items()}
+            if self.relative:
+                columns.update({f'{prefix}_{band}': self._round(band_power[band] / total_power[i]) for band in self.bands})
+            if self.absolute:
+                columns.update({f'{prefix}_{band}_abs': self._round(power[i, :, start:stop] @ weights[start:stop]) for band, (start, stop) in edges.items()})
+            with np.errstate(divide='ignore', invalid='ignore'):
+                columns.update({f'{prefix}_{numerator}_{denominator}': self._round(band_power[numerator] / band_power[denominator]) for numerator, denominator in self.ratios})
+        return columns
+
+    def _round(self, values):
+        return values if self.decimals is None else np.round(values, self.decimals)
+
+    def extract(self, signals, sampling_frequency, epoch_starts=None, epoch_lengths=None, chunk_epochs=1024):
+        # signals is (channels x samples) in self.channels order; all channels and full epochs go through one
+        # transform per chunk of epochs (chunks only bound the memory of very long recordings)
+        if epoch_starts is None:
+            epoch_starts, epoch_lengths = self.epoch_offsets(signals.shape[1], sampling_frequency)
+        epoch_starts = np.asarray(epoch_starts, dtype=np.int64)
+        epoch_lengths = np.asarray(epoch_lengths, dtype=np.int64)
+        epoch_samples = int(round(self.epoch_seconds * sampling_frequency))
+        full = np.flatnonzero(epoch_lengths == epoch_samples)
+        windows = sliding_window_view(signals, epoch_samples, axis=1) if signals.shape[1] >= epoch_samples else None
+
+        columns = {column: np.empty(len(epoch_starts)) for column in self.columns()}
+        for chunk in range(0, len(full), chunk_epochs):
+            index = full[chunk:chunk + chunk_epochs]
+            for column, values in self.features(windows[:, epoch_starts[index]], sampling_frequency).items():
+                columns[column][index] = values
+
+        # truncated epochs (normally only the last one of a night) have their own frequency resolution
+        for i in np.flatnonzero(epoch_lengths != epoch_samples):
+            window = signals[:, None, epoch_starts[i]:epoch_starts[i] + epoch_lengths[i]]
+            for column, values in self.features(window, sampling_frequency).items():
+                columns[column][i] = values[0]
+
+        return columns
+
+FEATURE_SETS = {}
+
+def register_feature_set(feature_set):
+    FEATURE_SETS[feature_set.name] = feature_set
+    return feature_set
+
+def get_feature_set(name=None, version=None):
+    # accepts a registered name (the default set for None) or an already built FeatureSet
+    if isinstance(name, FeatureSet):
+        return name
+    feature_set = FEATURE_SETS[DEFAULT_FEATURE_SET if name is None else name]
+    if version is not None and version != feature_set.version:
+        raise ValueError(f'Feature set {feature_set.name} is at version {feature_set.version}, version {version} was requested')
+    return feature_set
+
+# the original six relative band powers per channel from one periodogram of each 30 s epoch
+register_feature_set(FeatureSet('power_bands', 1, decimals=5))
+
+# welch spectrum with absolute and relative power plus the usual sleep ratios
+register_feature_set(FeatureSet('spectrum', 1, psd='welch', absolute=True, ratios=[('theta', 'delta'), ('alpha', 'theta'), ('delta', 'beta'), ('theta', 'beta')]))
+
+DEFAULT_FEATURE_SET = 'power_bands'
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import itertools
+import numpy as np
+import xgboost as xgb
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from preprocessing_functions import preprocess_labels
+from feature_sets import DEFAULT_FEATURE_SET, get_feature_set
+from model_training import LABEL, split_metrics, training_columns
+from epoch_keys import EPOCH_KEY, factorize_persons
+
+SWEEP_DIR = os.path.join('data', 'sweeps')
+
+# grid searched by default, every combination is one trial unless --trials samples a subset
+SEARCH_SPACE = {
+    'max_depth': [3, 5, 7],
+    'learning_rate': [0.03, 0.1, 0.3],
+    'min_child_weight': [1, 5],
+    'subsample': [0.8, 1.0],
+    'colsample_bytree': [0.8, 1.0]
+}
+
+# data and per-fold matrices of a worker process, set once by init_sweep_worker; the QuantileDMatrix of every
+# fold is built on the first trial that needs it and reused by all later trials in the same process
+sweep_data = {}
+
+def init_sweep_worker(X, y, folds, n_threads, max_bin):
+    sweep_data.update(X=X, y=y, folds=folds, n_threads=n_threads, max_bin=max_bin, matrices={})
+
+def fold_matrices(fold):
+    if fold not in sweep_data['matrices']:
+        X, y = sweep_data['X'], sweep_data['y']
+        train_index, valid_index, _ = sweep_data['folds'][fold]
+        dtrain = xgb.QuantileDMatrix(X[train_index], label=y[train_index], max_bin=sweep_data['max_bin'], nthread=sweep_data['n_threads'])
+        dvalid = xgb.QuantileDMatrix(X[valid_index], label=y[valid_index], ref=dtrain, nthread=sweep_data['n_threads'])
+        sweep_data['matrices'][fold] = (dtrain, dvalid)
+    return sweep_data['matrices'][fold]
+
+def make_folds(persons, person_codes, validation_fraction, seed=0):
+    # leave one subject out; early stopping watches a few other training subjects so the test subject stays unseen
+    rng = np.random.default_rng(seed)
+    folds = []
+    for code in range(len(persons)):
+        others = np.array([other for other in range(len(persons)) if other != code])
+        n_valid = max(1, int(round(len(others) * validation_fraction)))
+        valid_persons = rng.choice(others, size=n_valid, replace=False)
+        valid_mask = np.isin(person_codes, valid_persons)
+        test_mask = person_codes == code
+        folds.append((np.flatnonzero(~valid_mask & ~test_mask), np.flatnonzero(valid_mask), np.flatnonzero(test_mask)))
+    return folds
+
+def sweep_settings(feature_set, y, persons, max_rounds, early_stopping_rounds, max_bin, validation_fraction, validation_seed=0):
+    # everything besides the booster params that changes a trial's result, hashed into every trial id so a log
+    # is only resumed by a sweep over the same data with the same settings
+    return {
+        'feature_set': get_feature_set(feature_set).parameters(),
+        'epochs': int(len(y)),
+        'positives': int(np.sum(y)),
+        'subjects': [str(person) for person in persons],
+        'max_rounds': max_rounds,
+        'early_stopping_rounds': early_stopping_rounds,
+        'max_bin': max_bin,
+        'validation_fraction': validation_fraction,
+        'validation_seed': validation_seed
+    }
+
+def trial_id(params, settings):
+    return hashlib.sha256(json.dumps({'params': params, 'settings': settings}, sort_keys=True).encode()).hexdigest()[:12]
+
+def run_trial(params, max_rounds, early_stopping_rounds):
+    # all folds of one configuration with hist trees and early stopping, returns the fold-averaged test metrics
+    start_time = time.time()
+    X, y = sweep_data['X'], sweep_data['y']
+    booster_params = {'objective': 'binary:logistic', 'eval_metric': 'logloss', 'tree_method': 'hist', 'max_bin': sweep_data['max_bin'], 'nthread': sweep_data['n_threads'], **params}
+
+    fold_metrics = []
+    best_iterations = []
+    for fold, (_, _, test_index) in enumerate(sweep_data['folds']):
+        dtrain, dvalid = fold_matrices(fold)
+        booster = xgb.train(booster_params, dtrain, num_boost_round=max_rounds, evals=[(dvalid, 'valid')], early_stopping_rounds=early_stopping_rounds, verbose_eval=False)
+        y_test_prob = booster.inplace_predict(X[test_index], iteration_range=(0, booster.best_iteration + 1))
+        fold_metrics.append(split_metrics(y[test_index], y_test_prob)[0])
+        best_iterations.append(booster.best_iteration + 1)
+
+    folds = len(fold_metrics)
+    return {
+        'params': params,
+        'test': {metric: sum(metrics[metric] for metrics in fold_metrics) / folds for metric in fold_metrics[0]},
+        'best_iterations': best_iterations,
+        'seconds': time.time() - start_time
+    }
+
+def sweep_configurations(search_space, trials=None, seed=0):
+    configurations = [dict(zip(search_space, values)) for values in itertools.product(*search_space.values())]
+    if trials is not None and trials < len(configurations):
+        rng = np.random.default_rng(seed)
+        configurations = [configurations[i] for i in sorted(rng.choice(len(configurations), size=trials, replace=False))]
+    return configurations
+
+def read_log(log_path):
+    # finished trials by id; a partially written last line (interrupted run) is ignored and its trial rerun
+    results = {}
+    if os.path.exists(log_path):
+        with open(log_path) as log:
+            for line in log:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                results[result['trial']] = result
+    return results
+
+def load_sweep_data(feature_set=None):
+    # features and labels are read once, only the needed columns, and handed to every worker as numpy arrays
+    features = get_feature_set(feature_set).columns()
+    df = preprocess_labels(None, preprocess_labels=False, download_files=False, columns=training_columns(features), feature_set=feature_set)
+    df = df[~df[LABEL].isin(['N', '?', 'M'])]
+    X = df[features].to_numpy(dtype=np.float32)
+    y = df[LABEL].isin(['1', '2']).to_numpy(dtype=np.float32)
+    person_codes, persons = factorize_persons(df[EPOCH_KEY])
+    return X, y, person_codes, persons
+
+def run_sweep(X, y, person_codes, persons, configurations, log_path, workers=1, threads=None, max_rounds=1000, early_stopping_rounds=20, max_bin=256, validation_fraction=0.1, feature_set=None):
+    # trials already in the log with the same settings are skipped, new ones are appended (one json line each) as soon as they finish
+    n_threads = max(1, (os.cpu_count() or 1) // workers) if threads is None else threads
+    settings = sweep_settings(feature_set, y, persons, max_rounds, early_stopping_rounds, max_bin, validation_fraction)
+    done = read_log(log_path)
+    pending = [params for params in configurations if trial_id(params, settings) not in done]
+    print(f"{len(configurations) - len(pending)} of {len(configurations)} trials already in {log_path}, running {len(pending)} with {workers} workers x {n_threads} threads")
+
+    folds = make_folds(persons, person_codes, validation_fraction, settings['validation_seed'])
+    os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+    with open(log_path, 'a+') as log, ProcessPoolExecutor(max_workers=workers, initializer=init_sweep_worker, initargs=(X, y, folds, n_threads, max_bin)) as executor:
+        # an interrupted run can leave a partial last line, the next result has to start on a line of its own
+        if log.tell() > 0:
+            log.seek(log.tell() - 1)
+            if log.read(1) != '\n':
+                log.write('\n')
+        futures = {executor.submit(run_trial, params, max_rounds, early_stopping_rounds): params for params in pending}
+        for i, future in enumerate(as_completed(futures)):
+            result = {'trial': trial_id(futures[future], settings), **future.result(), 'settings': settings}
+            log.write(json.dumps(result, default=float) + '\n')
+            log.flush()
+            done[result['trial']] = result
+            print(f"[{i + 1}/{len(pending)}] {result['params']} mcc {result['test']['mcc']:.4f} auc_pr {result['test']['auc_pr']:.4f} ({result['seconds']:.1f} s)")
+
+    return [done[trial_id(params, settings)] for params in configurations]
+
+def best_trials(results, metric='mcc', top=5):
+    # ranked by the chosen test metric, the other one of mcc/auc_pr breaks ties
+    other = 'auc_pr' if metric == 'mcc' else 'mcc'
+    return sorted(results, key=lambda result: (result['test'][metric], result['test'][other]), reverse=True)[:top]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Leave-one-subject-out hyperparameter sweep of the sleep stage booster')
+    parser.add_argument('--feature-set', default=DEFAULT_FEATURE_SET)
+    parser.add_argument('--search-space', default=None, help='json file mapping parameter names to lists of values, SEARCH_SPACE by default')
+    parser.add_argument('--trials', type=int, default=None, help='random subset of the grid, all combinations by default')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) // 4), help='trials run in parallel')
+    parser.add_argument('--threads', type=int, default=None, help='xgboost threads per trial, cpu_count // workers by default')
+    parser.add_argument('--max-rounds', type=int, default=1000)
+    parser.add_argument('--early-stopping', type=int, default=20)
+    parser.add_argument('--max-bin', type=int, default=256)
+    parser.add_argument('--log', default=None, help='results log, data/sweeps/sweep.<feature set>.jsonl by default; rerunning with the same log and settings resumes the sweep')
+    parser.add_argument('--metric', choices=['mcc', 'auc_pr'], default='mcc')
+    args = parser.parse_args()
+    if args.log is None:
+        args.log = os.path.join(SWEEP_DIR, f'sweep.{get_feature_set(args.feature_set).name}.jsonl')
+
+    search_space = SEARCH_SPACE
+    if args.search_space is not None:
+        with open(args.search_space) as f:
+            search_space = json.load(f)
+
+    X, y, person_codes, persons = load_sweep_data(args.feature_set)
+    configurations = sweep_configurations(search_space, args.trials, args.seed)
+    results = run_sweep(X, y, person_codes, persons, configurations, args.log, args.workers, args.threads, args.max_rounds, args.early_stopping, args.max_bin, feature_set=args.feature_set)
+
+    print(f"\nBest trials by test {args.metric} ({len(persons)} subjects, {len(y)} epochs)")
+    print(f"{'MCC':>8}{'AUC-PR':>8}{'Rounds':>8}  Parameters")
+    ranked = best_trials(results, args.metric)
+    for result in ranked:
+        print(f"{result['test']['mcc']:>8.4f}{result['test']['auc_pr']:>8.4f}{int(np.median(result['best_iterations'])):>8}  {result['params']}")
+
+    # model params for train_model: the best configuration with n_estimators set to its median early stopping round
+    best = ranked[0]
+    best_params = {'objective': 'binary:logistic', 'tree_method': 'hist', 'max_bin': args.max_bin, 'n_estimators': int(np.median(best['best_iterations'])), **best['params']}
+    best_path = os.path.splitext(args.log)[0] + '.best.json'
+    with open(best_path, 'w') as f:
+        json.dump(best_params, f, indent=1)
+    print(f"Best parameters saved to {best_path}, train with: python main.py --model-params {best_path}")
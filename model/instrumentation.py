@@ -0,0 +1,383 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import argparse
+import threading
+import functools
+from bisect import bisect_left
+from multiprocessing import util
+
+# spans, counters and latency histograms for the pipeline stages and the server loop, all off unless configured:
+#   ALAREM_TRACE=trace.jsonl      every span as a Chrome trace event line, plus each process's counters when it exits
+#   ALAREM_METRICS=metrics.prom   Prometheus text of the configuring process's metrics, rewritten on flush() and at exit
+#   ALAREM_PROFILE=span[,span]    cProfile every ALAREM_PROFILE_EVERY-th (default 10) run of these spans into ALAREM_PROFILE_DIR
+# configure() sets the same variables, so pool workers (fork or spawn) trace into the same file; disabled, span() returns
+# one shared no-op context manager and count()/observe() return after a single attribute check
+
+TRACE_VARIABLE = 'ALAREM_TRACE'
+METRICS_VARIABLE = 'ALAREM_METRICS'
+PROFILE_VARIABLE = 'ALAREM_PROFILE'
+PROFILE_EVERY_VARIABLE = 'ALAREM_PROFILE_EVERY'
+PROFILE_DIR_VARIABLE = 'ALAREM_PROFILE_DIR'
+OWNER_VARIABLE = 'ALAREM_METRICS_PID' # only this process writes the metrics file, workers report through the trace
+
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300) # seconds
+TRACE_BUFFER = 1000 # events kept before they are appended to the trace file
+
+class Histogram:
+    # Prometheus style cumulative buckets are computed on export, observe() only bumps one bin
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self):
+        return {'counts': self.counts, 'sum': self.sum, 'count': self.count}
+
+class _NoopSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NOOP_SPAN = _NoopSpan()
+
+class _Span:
+    __slots__ = ('name', 'labels', 'start', 'profile')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.profile = _state.start_profile(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self.start
+        if self.profile is not None:
+            _state.stop_profile(self.profile)
+        _state.record_span(self.name, self.labels, duration, exc_type is not None)
+        return False
+
+class Instrumentation:
+
+    def __init__(self):
+        self.enabled = False
+        self.trace_path = None
+        self.metrics_path = None
+        self.profile_spans = set()
+        self.profile_every = 10
+        self.profile_dir = '.'
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.counters = {}
+        self.histograms = {}
+        self.events = []
+        self.span_runs = {}
+        self.profiles = {}
+        self.profiling = False
+
+    def configure(self, trace=None, metrics=None, profile=None, profile_every=10, profile_dir='.', enabled=None):
+        self.trace_path = trace
+        self.metrics_path = metrics if os.environ.get(OWNER_VARIABLE, str(os.getpid())) == str(os.getpid()) else None
+        self.profile_spans = set(profile or [])
+        self.profile_every = max(1, int(profile_every))
+        self.profile_dir = profile_dir
+        self.enabled = bool(trace or metrics or profile) if enabled is None else enabled
+
+    def configure_from_environment(self):
+        # the first process to see ALAREM_METRICS owns the file, processes it starts inherit the claim
+        if os.environ.get(METRICS_VARIABLE) and OWNER_VARIABLE not in os.environ:
+            os.environ[OWNER_VARIABLE] = str(os.getpid())
+        profile = os.environ.get(PROFILE_VARIABLE)
+        self.configure(os.environ.get(TRACE_VARIABLE), os.environ.get(METRICS_VARIABLE), profile.split(',') if profile else None,
+                       os.environ.get(PROFILE_EVERY_VARIABLE, 10), os.environ.get(PROFILE_DIR_VARIABLE, '.'))
+
+    def after_fork(self):
+        # runs in every multiprocessing child after its finalizers were cleared; a forked worker starts empty,
+        # otherwise the parent's counts would be reported twice
+        if self.pid != os.getpid():
+            self.reset()
+            self.metrics_path = None
+        util.Finalize(None, flush, exitpriority=10)
+
+    def start_profile(self, name):
+        if name not in self.profile_spans:
+            return None
+        with self.lock:
+            runs = self.span_runs[name] = self.span_runs.get(name, 0) + 1
+            # one profiler at a time, nested or concurrent sampled spans are timed but not profiled
+            if (runs - 1) % self.profile_every or self.profiling:
+                return None
+            self.profiling = True
+            profile = self.profiles.setdefault(name, cProfile.Profile())
+        try:
+            profile.enable()
+        except ValueError:
+            self.profiling = False
+            return None
+        return profile
+
+    def stop_profile(self, profile):
+        profile.disable()
+        self.profiling = False
+
+    def record_span(self, name, labels, duration, error):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(duration)
+            if error:
+                error_key = ('span_errors', (('span', name),))
+                self.counters[error_key] = self.counters.get(error_key, 0) + 1
+            if self.trace_path is not None:
+                # complete ('X') events of the Chrome trace format, timestamps in microseconds
+                event = {'name': name, 'ph': 'X', 'ts': (time.time() - duration) * 1e6, 'dur': duration * 1e6, 'pid': self.pid, 'tid': threading.get_ident()}
+                if labels or error:
+                    event['args'] = {**dict(labels), **({'error': True} if error else {})}
+                self.events.append(event)
+                if len(self.events) >= TRACE_BUFFER:
+                    self.write_events()
+
+    def count(self, name, value, labels):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, labels):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def write_events(self, metrics=False):
+        # one O_APPEND write per flush, so lines of concurrent worker processes do not interleave
+        lines = [json.dumps(event) for event in self.events]
+        if metrics:
+            lines.append(json.dumps({'type': 'metrics', 'pid': self.pid, 'time': time.time(), **self.snapshot()}))
+        self.events = []
+        if lines:
+            fd = os.open(self.trace_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, ('\n'.join(lines) + '\n').encode())
+            finally:
+                os.close(fd)
+
+    def snapshot(self):
+        return {
+            'counters': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in self.counters.items()],
+            'histograms': [{'name': name, 'labels': dict(labels), **histogram.to_dict()} for (name, labels), histogram in self.histograms.items()]
+        }
+
+    def flush(self):
+        if not self.enabled:
+            return
+        with self.lock:
+            if self.trace_path is not None:
+                self.write_events(metrics=True)
+            if self.metrics_path is not None:
+                tmp_path = self.metrics_path + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    f.write(prometheus_text(self.snapshot()))
+                os.replace(tmp_path, self.metrics_path)
+            for name, profile in self.profiles.items():
+                profile.dump_stats(os.path.join(self.profile_dir, f'{name}.{self.pid}.prof'))
+
+_state = Instrumentation()
+
+def configure(trace=None, metrics=None, profile=None, profile_every=10, profile_dir='.'):
+    # also exported to the environment, so processes started from here are instrumented the same way
+    for variable, value in ((TRACE_VARIABLE, trace and os.path.abspath(trace)), (METRICS_VARIABLE, metrics and os.path.abspath(metrics)),
+                            (PROFILE_VARIABLE, profile and ','.join(profile)), (PROFILE_EVERY_VARIABLE, str(profile_every)), (PROFILE_DIR_VARIABLE, os.path.abspath(profile_dir))):
+        if value:
+            os.environ[variable] = value
+        else:
+            os.environ.pop(variable, None)
+    os.environ[OWNER_VARIABLE] = str(os.getpid())
+    _state.configure_from_environment()
+
+def enabled():
+    return _state.enabled
+
+def span(name, **labels):
+    if not _state.enabled:
+        return NOOP_SPAN
+    return _Span(name, tuple(sorted(labels.items())))
+
+def traced(name):
+    # decorator form of span(), the function stays picklable for process pools
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return function(*args, **kwargs)
+            with _Span(name, ()):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def count(name, value=1, **labels):
+    if _state.enabled:
+        _state.count(name, value, tuple(sorted(labels.items())))
+
+def observe(name, seconds, **labels):
+    if _state.enabled:
+        _state.observe(name, seconds, tuple(sorted(labels.items())))
+
+def snapshot():
+    with _state.lock:
+        return _state.snapshot()
+
+def flush():
+    _state.flush()
+
+def _metric_name(name):
+    return 'alarem_' + ''.join(character if character.isalnum() else '_' for character in name)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _label_text(labels, **extra):
+    labels = {**labels, **extra}
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+def prometheus_text(metrics=None):
+    # text exposition format: counters as <name>_total, spans and observations as <name>_seconds histograms
+    metrics = snapshot() if metrics is None else metrics
+    lines = []
+    typed = set()
+    for counter in sorted(metrics['counters'], key=lambda counter: counter['name']):
+        metric = _metric_name(counter['name']) + '_total'
+        if metric not in typed:
+            lines.append(f'# TYPE {metric} counter')
+            typed.add(metric)
+        lines.append(f"{metric}{_label_text(counter['labels'])} {counter['value']}")
+    for histogram in sorted(metrics['histograms'], key=lambda histogram: histogram['name']):
+        metric = _metric_name(histogram['name']) + '_seconds'
+        if metric not in typed:
+            lines.append(f'# TYPE {metric} histogram')
+            typed.add(metric)
+        cumulative = 0
+        for bound, bin_count in zip([*BUCKETS, '+Inf'], histogram['counts']):
+            cumulative += bin_count
+            lines.append(f"{metric}_bucket{_label_text(histogram['labels'], le=bound)} {cumulative}")
+        lines.append(f"{metric}_sum{_label_text(histogram['labels'])} {histogram['sum']}")
+        lines.append(f"{metric}_count{_label_text(histogram['labels'])} {histogram['count']}")
+    return '\n'.join(lines) + '\n'
+
+def start_metrics_server(port, host='localhost'):
+    # Prometheus scrape endpoint on a daemon thread, GET /metrics; serving them turns collection on in this process
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    _state.enabled = True
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            found = self.path.split('?')[0] in ('/', '/metrics')
+            body = prometheus_text().encode() if found else b'not found\n'
+            self.send_response(200 if found else 404)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def read_trace(paths):
+    # span events and the last counters of every process in one or more trace files
+    events, metrics = [], {}
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get('type') == 'metrics':
+                    metrics[record['pid']] = record
+                else:
+                    events.append(record)
+    return events, list(metrics.values())
+
+def summarize(paths):
+    # per span (and label set) count, total and latency percentiles, and the counters summed over processes
+    import numpy as np
+    events, metrics = read_trace(paths)
+    durations = {}
+    for event in events:
+        key = event['name'] + _label_text({key: value for key, value in event.get('args', {}).items() if key != 'error'})
+        durations.setdefault(key, []).append(event['dur'] / 1e3)
+    spans = {key: {
+        'count': len(values),
+        'total_s': float(np.sum(values)) / 1e3,
+        **{f'p{q}_ms': float(np.percentile(values, q)) for q in (50, 95, 99)},
+        'max_ms': float(np.max(values))
+    } for key, values in durations.items()}
+    # observe() latencies only exist as histograms, their percentiles are bucket upper bounds
+    span_names = {event['name'] for event in events}
+    observed = {}
+    for record in metrics:
+        for histogram in record['histograms']:
+            if histogram['name'] not in span_names:
+                merged = observed.setdefault(histogram['name'] + _label_text(histogram['labels']), {'counts': np.zeros(len(BUCKETS) + 1), 'sum': 0.0})
+                merged['counts'] += histogram['counts']
+                merged['sum'] += histogram['sum']
+    bounds = np.array([*BUCKETS, np.inf]) * 1e3
+    for key, merged in observed.items():
+        cumulative = np.cumsum(merged['counts']) / merged['counts'].sum()
+        spans[key] = {'count': int(merged['counts'].sum()), 'total_s': merged['sum'], **{f'p{q}_ms': float(bounds[np.searchsorted(cumulative, q / 100)]) for q in (50, 95, 99)}, 'max_ms': float('nan')}
+
+    counters = {}
+    for record in metrics:
+        for counter in record['counters']:
+            key = counter['name'] + _label_text(counter['labels'])
+            counters[key] = counters.get(key, 0) + counter['value']
+    return spans, counters, events
+
+util.Finalize(None, flush, exitpriority=10) # runs at interpreter exit and when a multiprocessing worker exits
+util.register_after_fork(_state, Instrumentation.after_fork)
+_state.configure_from_environment()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Summarize trace files written with ALAREM_TRACE: span latencies and counters')
+    parser.add_argument('traces', nargs='+')
+    parser.add_argument('--chrome', default=None, help='also write the spans as a Chrome trace (chrome://tracing, Perfetto)')
+    args = parser.parse_args()
+
+    spans, counters, events = summarize(args.traces)
+    width = max([len(key) for key in [*spans, *counters]] + [4]) + 2
+    print(f"{'Span':<{width}}{'Count':>8}{'Total (s)':>11}{'p50 (ms)':>11}{'p95 (ms)':>11}{'p99 (ms)':>11}{'Max (ms)':>11}")
+    for key, summary in sorted(spans.items(), key=lambda item: -item[1]['total_s']):
+        print(f"{key:<{width}}{summary['count']:>8}{summary['total_s']:>11.3f}{summary['p50_ms']:>11.3f}{summary['p95_ms']:>11.3f}{summary['p99_ms']:>11.3f}{summary['max_ms']:>11.3f}")
+    if counters:
+        print()
+        for key, value in sorted(counters.items()):
+            print(f'{key:<{width}}{value:>12g}')
+    if args.chrome is not None:
+        with open(args.chrome, 'w') as f:
+            json.dump({'traceEvents': events}, f)
+        print(f'Chrome trace written to {args.chrome}')
+    sys.exit(0)
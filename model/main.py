@@ -1,18 +1,65 @@
 from preprocessing_functions import *
 from model_training import *
+import json
+import argparse
+from feature_sets import FEATURE_SETS
+from model_bundle import save_model_bundle, label_positive_rate
+from dataset_ingest import NightDataset
+import instrumentation
 
-def main():
-    all_epochs_power_bands_df = preprocess_features(preprocess_features=False, download_files=False)
-    labelled_epochs_power_bands_df = preprocess_labels(all_epochs_power_bands_df, preprocess_labels=False, download_files=False)
+FEATURE_SET = DEFAULT_FEATURE_SET
+
+def main(headless=False, model_params=None, ingested=False, types=None, subjects=None, feature_set=None, features=None):
+    # the original six anterior powers by default, other columns of the feature set ('all' for every column, both channels)
+    # only when asked for; only the used columns are read from the stored datasets
+    feature_set = get_feature_set(FEATURE_SET if feature_set is None else feature_set)
+    features = FEATURES if features is None else feature_set.columns() if list(features) == ['all'] else list(features)
+    missing = [feature for feature in features if feature not in feature_set.columns()]
+    if missing:
+        raise ValueError(f'Feature set {feature_set.name} has no columns {missing}, it has {feature_set.columns()}')
+    columns = training_columns(features)
+    if ingested:
+        # labelled nights of the partitioned dataset (dataset_ingest.py), picked from its manifest
+        labelled_epochs_power_bands_df = NightDataset(feature_set=feature_set).load(columns=columns, types=types, subjects=subjects, labelled=True)
+    else:
+        all_epochs_power_bands_df = preprocess_features(preprocess_features=False, download_files=False, columns=columns[:-1], feature_set=feature_set)
+        labelled_epochs_power_bands_df = preprocess_labels(all_epochs_power_bands_df, preprocess_labels=False, download_files=False, columns=columns, feature_set=feature_set)
 
     # print(labelled_epochs_power_bands_df)
     # print(labelled_epochs_power_bands_df.describe().T)
     # print(labelled_epochs_power_bands_df['sleep_stage'].value_counts())
 
-    # Train the model
-    model = train_model(labelled_epochs_power_bands_df, train_type='cross_validation')
+    # Train the model, headless runs skip the printed summary and the report window
+    result = train_model(labelled_epochs_power_bands_df, train_type='cross_validation', features=features, headless=headless, model_params=model_params)
+
+    # Save the model so it can be loaded for inference without retraining, the result is kept for rendering the report later
+    model_path = save_model_bundle(result.model, features, metrics=result.metrics(), model_params=MODEL_PARAMS if model_params is None else model_params,
+                                   feature_set=feature_set, positive_rate=label_positive_rate(labelled_epochs_power_bands_df[LABEL]))
+    result_path = result.save(os.path.join(model_path, 'training_result.json'))
+    print(f'Model saved to {model_path}')
+    if headless:
+        print(f"Test MCC {result.test_metrics['mcc']:.4f}, AUC-PR {result.test_metrics['auc_pr']:.4f}; report: python training_report.py {result_path}")
 
     return
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Train the sleep stage model on the stored datasets and save it as a bundle')
+    parser.add_argument('--headless', action='store_true', help='no summary printout or plot window, e.g. on training hosts')
+    parser.add_argument('--model-params', default=None, help='json file of XGBClassifier parameters, e.g. the .best.json of a hyperparameter sweep')
+    parser.add_argument('--feature-set', default=FEATURE_SET, choices=sorted(FEATURE_SETS), help='feature set of the stored datasets to train on')
+    parser.add_argument('--features', nargs='+', default=None, help="columns of the feature set to train on, 'all' for every one; the six anterior band powers by default")
+    parser.add_argument('--ingested', action='store_true', help='train on the nights ingested with dataset_ingest.py instead of the full labelled dataset')
+    parser.add_argument('--types', nargs='+', default=None, help='with --ingested, only these recording types, e.g. cassette headband')
+    parser.add_argument('--subjects', nargs='+', default=None, help='with --ingested, only these subjects')
+    parser.add_argument('--trace', default=None, help='write stage spans and counters to this JSONL file, summarize with instrumentation.py')
+    parser.add_argument('--metrics', default=None, help='write Prometheus text metrics to this file at exit')
+    parser.add_argument('--profile', nargs='+', default=None, help='cProfile a sample of these spans, e.g. training.fit')
+    args = parser.parse_args()
+    if args.trace or args.metrics or args.profile:
+        instrumentation.configure(trace=args.trace, metrics=args.metrics, profile=args.profile)
+
+    model_params = None
+    if args.model_params is not None:
+        with open(args.model_params) as f:
+            model_params = json.load(f)
+    main(args.headless, model_params, args.ingested, args.types, args.subjects, args.feature_set, args.features)
\ No newline at end of file
@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import numpy as np
+from feature_sets import FeatureSet, get_feature_set
+from tree_model import TREES_FILE, TreeEnsemble
+
+# serving side of the model, deliberately free of pandas/sklearn/matplotlib/seaborn imports of its own
+# xgboost is only imported to save a bundle or to score with the booster itself: its package __init__ also pulls in
+# sklearn and scipy, so the alarm runtime scores with the numpy evaluator of tree_model.py instead
+
+BUNDLE_VERSION = 1
+MODEL_DIR = os.path.join('data', 'models')
+MODEL_FILE = 'model.ubj'
+METADATA_FILE = 'metadata.json'
+
+LABEL_MAPPING = {
+    'positive_stages': ['1', '2'], # N1/N2 light sleep, the class the alarm waits for
+    'excluded_stages': ['N', '?', 'M'],
+    'classes': ['Other', 'N1/N2 Sleep']
+}
+
+def label_positive_rate(stages):
+    # share of the positive class among the labelled epochs the model is trained on, the prior its probabilities are calibrated to
+    stages = np.asarray(stages)
+    labelled = stages[~np.isin(stages, LABEL_MAPPING['excluded_stages'])]
+    return float(np.isin(labelled, LABEL_MAPPING['positive_stages']).mean())
+
+def save_model_bundle(model, features, metrics=None, model_params=None, path=None, feature_set=None, positive_rate=None):
+    # writes the booster as UBJSON and its flattened trees for the numpy evaluator next to a metadata.json describing how its inputs were made
+    import xgboost as xgb
+    feature_set = get_feature_set(feature_set)
+    path = os.path.join(MODEL_DIR, time.strftime('alarem-%Y%m%d-%H%M%S')) if path is None else path
+    os.makedirs(path, exist_ok=True)
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    booster.save_model(os.path.join(path, MODEL_FILE))
+    TreeEnsemble.from_booster(booster).save(os.path.join(path, TREES_FILE))
+
+    metadata = {
+        'bundle_version': BUNDLE_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'xgboost_version': xgb.__version__,
+        'features': list(features),
+        'feature_set': feature_set.parameters(),
+        'bands': feature_set.bands,
+        'channels': feature_set.channels,
+        'epoch_seconds': feature_set.epoch_seconds,
+        'label_mapping': LABEL_MAPPING,
+        'positive_rate': positive_rate,
+        'model_params': model_params,
+        'metrics': metrics
+    }
+    with open(os.path.join(path, METADATA_FILE), 'w') as f:
+        json.dump(metadata, f, indent=1, default=float)
+
+    return path
+
+class SleepStagePredictor:
+    # thin wrapper around a raw Booster or a TreeEnsemble, scores (epochs x features) arrays without building DataFrames or DMatrix objects
+
+    def __init__(self, booster, metadata, n_threads=1):
+        self.booster = booster
+        self.metadata = metadata
+        self.features = metadata['features']
+        # bundles written before feature sets were recorded all used the original power bands
+        self.feature_set = FeatureSet.from_parameters(metadata['feature_set']) if 'feature_set' in metadata else get_feature_set('power_bands', 1)
+        self.evaluator = 'numpy' if isinstance(booster, TreeEnsemble) else 'xgboost'
+        if self.evaluator == 'xgboost':
+            self.booster.set_param({'nthread': n_threads})
+
+    def predict_positive_proba(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != len(self.features):
+            raise ValueError(f'Expected a (n, {len(self.features)}) array with columns {self.features}, got {X.shape}')
+        if self.evaluator == 'numpy':
+            return self.booster.predict_positive_proba(X)
+        return self.booster.inplace_predict(X, validate_features=False)
+
+    def predict_proba(self, X):
+        # same layout as XGBClassifier.predict_proba so either can be passed to StreamingSleepStager
+        positive = self.predict_positive_proba(X)
+        return np.column_stack([1 - positive, positive])
+
+    def predict(self, X):
+        return (self.predict_positive_proba(X) > 0.5).astype(int)
+
+def load_model_bundle(path, n_threads=1, evaluator=None):
+    # evaluator 'numpy' scores with the exported trees, 'xgboost' with the booster; by default the trees when the bundle has them
+    # (bundles saved before the exporter get them with: python tree_model.py <bundle>)
+    with open(os.path.join(path, METADATA_FILE)) as f:
+        metadata = json.load(f)
+    if metadata['bundle_version'] > BUNDLE_VERSION:
+        raise ValueError(f"Model bundle version {metadata['bundle_version']} is newer than supported version {BUNDLE_VERSION}")
+
+    evaluator = ('numpy' if os.path.exists(os.path.join(path, TREES_FILE)) else 'xgboost') if evaluator is None else evaluator
+    if evaluator == 'numpy':
+        return SleepStagePredictor(TreeEnsemble.load(os.path.join(path, TREES_FILE)), metadata)
+    if evaluator != 'xgboost':
+        raise ValueError(f"Unknown evaluator {evaluator}, expected 'numpy' or 'xgboost'")
+
+    import xgboost as xgb
+    booster = xgb.Booster()
+    booster.load_model(os.path.join(path, MODEL_FILE))
+    return SleepStagePredictor(booster, metadata, n_threads=n_threads)
+
+def latest_model_bundle(model_dir=MODEL_DIR):
+    bundles = sorted(name for name in os.listdir(model_dir) if os.path.exists(os.path.join(model_dir, name, METADATA_FILE)))
+    if not bundles:
+        raise FileNotFoundError(f'No model bundles in {model_dir}')
+    return os.path.join(model_dir, bundles[-1])
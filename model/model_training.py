@@ -1,22 +1,178 @@
+import os
+import json
 import time
-import pandas as pd
+import numpy as np
 import xgboost as xgb
 from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score, roc_auc_score, roc_curve, precision_score, recall_score, f1_score, log_loss, confusion_matrix, precision_recall_curve, auc, matthews_corrcoef
-import matplotlib.pyplot as plt
-import seaborn as sns
+from sklearn.metrics import accuracy_score, roc_auc_score, precision_score, recall_score, f1_score, log_loss, confusion_matrix, precision_recall_curve, auc, matthews_corrcoef
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor
+from epoch_keys import EPOCH_KEY, factorize_persons
+from instrumentation import span, traced, count
+
+FEATURES = ['anterior_subdelta', 'anterior_delta', 'anterior_theta', 'anterior_alpha', 'anterior_beta', 'anterior_gamma']
+LABEL = 'sleep_stage'
+TRAINING_COLUMNS = [EPOCH_KEY, *FEATURES, LABEL]
+MODEL_PARAMS = {'objective': 'binary:logistic', 'n_estimators': 100, 'learning_rate': 0.1, 'max_depth': 5}
+
+# dataset shared by every fold of a worker process, set once by init_fold_worker instead of pickled per fold
+fold_data = {}
+
+def init_fold_worker(X, y, n_threads, model_params=None):
+    fold_data.update(X=X, y=y, n_threads=n_threads, model_params=MODEL_PARAMS if model_params is None else model_params)
+
+def split_metrics(y_true, y_prob):
+    # predict() of a binary XGBClassifier is predict_proba()[:, 1] > 0.5, so the model is only evaluated once
+    y_pred = (y_prob > 0.5).astype(int)
+
+    precision, recall, _ = precision_recall_curve(y_true, y_prob)
+    recall, precision = zip(*sorted(zip(recall, precision)))
+    metrics = {
+        'accuracy': accuracy_score(y_true, y_pred),
+        'roc_auc': roc_auc_score(y_true, y_prob),
+        'precision': precision_score(y_true, y_pred),
+        'recall': recall_score(y_true, y_pred),
+        'f1': f1_score(y_true, y_pred),
+        'log_loss': log_loss(y_true, y_prob),
+        'auc_pr': auc(recall, precision),
+        'mcc': matthews_corrcoef(y_true, y_pred)
+    }
 
-def train_model(labelled_epochs_power_bands_df, train_type):
-    start_time = time.time()
-    train_df = labelled_epochs_power_bands_df.copy(deep=True)
-    train_df['person'] = train_df['epochId'].apply(lambda x: x.split('-')[0][0] + x.split('-')[1])
-    train_df = train_df[~train_df['sleep_stage'].isin(['N', '?', 'M'])]
+    return metrics, confusion_matrix(y_true, y_pred)
+
+@traced('training.fold')
+def run_fold(test_index, return_model=False):
+    X, y = fold_data['X'], fold_data['y']
+    train_mask = np.ones(len(y), dtype=bool)
+    train_mask[test_index] = False
+
+    model = xgb.XGBClassifier(**fold_data['model_params'], n_jobs=fold_data['n_threads'])
+    with span('training.fit'):
+        model.fit(X[train_mask], y[train_mask])
+
+    with span('training.predict'):
+        y_train_prob = model.predict_proba(X[train_mask])[:, 1]
+        y_test_prob = model.predict_proba(X[test_index])[:, 1]
+    with span('training.metrics'):
+        train_fold_metrics, train_conf_matrix = split_metrics(y[train_mask], y_train_prob)
+        test_fold_metrics, test_conf_matrix = split_metrics(y[test_index], y_test_prob)
+    count('training.folds')
+    count('training.inferences', len(y))
+
+    return {
+        'train_metrics': train_fold_metrics,
+        'test_metrics': test_fold_metrics,
+        'train_conf_matrix': train_conf_matrix,
+        'test_conf_matrix': test_conf_matrix,
+        'y_test': y[test_index],
+        'y_test_prob': y_test_prob,
+        'model': model if return_model else None
+    }
 
-    features = ['anterior_subdelta', 'anterior_delta', 'anterior_theta', 'anterior_alpha', 'anterior_beta', 'anterior_gamma']
-    label = 'sleep_stage'
+def run_folds(X, y, test_indices, workers, progress=True, model_params=None):
+    # folds run concurrently, each with cpu_count // workers xgboost threads so the pool does not oversubscribe the cores
+    # results are returned in fold order, only the last fold's fitted model is sent back
+    n_threads = max(1, (os.cpu_count() or 1) // workers)
+    last_fold = len(test_indices) - 1
+
+    if workers <= 1:
+        init_fold_worker(X, y, None, model_params)
+        return [run_fold(test_index, return_model=i == last_fold) for i, test_index in enumerate(tqdm(test_indices, disable=not progress))]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_fold_worker, initargs=(X, y, n_threads, model_params)) as executor:
+        futures = [executor.submit(run_fold, test_index, i == last_fold) for i, test_index in enumerate(test_indices)]
+        return [future.result() for future in tqdm(futures, disable=not progress)]
+
+METRIC_NAMES = {
+    'accuracy': 'Accuracy',
+    'roc_auc': 'ROC AUC',
+    'precision': 'Precision',
+    'recall': 'Recall',
+    'f1': 'F1-score',
+    'log_loss': 'Log Loss',
+    'auc_pr': 'AUC-PR',
+    'mcc': 'MCC'
+}
+SUMMARY_METRICS = ['mcc', 'auc_pr', 'roc_auc', 'f1', 'precision', 'recall', 'log_loss', 'accuracy']
+
+class TrainingResult:
+    # everything a training run produces: the model, averaged train/test metrics, summed confusion matrices,
+    # the per-fold metrics and the test labels/probabilities the report curves are drawn from (last fold for cross validation)
+
+    def __init__(self, train_type, features, model, train_metrics, test_metrics, train_conf_matrix, test_conf_matrix, y_test, y_test_prob, training_time, fold_metrics=None):
+        self.train_type = train_type
+        self.features = list(features)
+        self.model = model
+        self.train_metrics = train_metrics
+        self.test_metrics = test_metrics
+        self.train_conf_matrix = np.asarray(train_conf_matrix)
+        self.test_conf_matrix = np.asarray(test_conf_matrix)
+        self.y_test = np.asarray(y_test)
+        self.y_test_prob = np.asarray(y_test_prob)
+        self.training_time = training_time
+        self.fold_metrics = fold_metrics
+
+    def metrics(self):
+        # the metrics dict stored in model bundles
+        return {
+            'train_type': self.train_type,
+            'train': {**self.train_metrics, 'confusion_matrix': self.train_conf_matrix.tolist()},
+            'test': {**self.test_metrics, 'confusion_matrix': self.test_conf_matrix.tolist()},
+            'training_time': self.training_time
+        }
+
+    def summary(self):
+        lines = ['-- TRAINING METRICS --']
+        for split, split_metrics, conf_matrix in (('Train', self.train_metrics, self.train_conf_matrix), ('Test', self.test_metrics, self.test_conf_matrix)):
+            if split == 'Test':
+                lines.append('\n-- TESTING METRICS --')
+            lines.extend(f"{split} {name}: {split_metrics[metric]}" for metric, name in METRIC_NAMES.items())
+            lines.append(f"{split} Confusion Matrix:\n{conf_matrix}")
+
+        # one csv-style line: test metrics, test tp/tn/fp/fn, the same for train, then the training time
+        lines.append('\n -- MODEL PERFORMANCE SUMMARY --')
+        row = []
+        for split_metrics, conf_matrix in ((self.test_metrics, self.test_conf_matrix), (self.train_metrics, self.train_conf_matrix)):
+            row.extend(split_metrics[metric] for metric in SUMMARY_METRICS)
+            row.extend([conf_matrix[1][1], conf_matrix[0][0], conf_matrix[0][1], conf_matrix[1][0]])
+        row.append(self.training_time)
+        lines.append(', '.join(str(value) for value in row) + '\n')
+        return '\n'.join(lines)
+
+    def save(self, path):
+        # json without the model, enough for training_report.py to render the report later
+        with open(path, 'w') as f:
+            json.dump({
+                **self.metrics(),
+                'features': self.features,
+                'fold_metrics': self.fold_metrics,
+                'y_test': self.y_test.tolist(),
+                'y_test_prob': self.y_test_prob.tolist()
+            }, f, default=float)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        train_conf_matrix = data['train'].pop('confusion_matrix')
+        test_conf_matrix = data['test'].pop('confusion_matrix')
+        return cls(data['train_type'], data['features'], None, data['train'], data['test'], train_conf_matrix, test_conf_matrix,
+                   data['y_test'], data['y_test_prob'], data['training_time'], data.get('fold_metrics'))
+
+def training_columns(features):
+    return [EPOCH_KEY, *features, LABEL]
+
+@traced('training.train_model')
+def train_model(labelled_epochs_power_bands_df, train_type, workers=None, features=None, headless=False, model_params=None):
+    # returns a TrainingResult; unless headless the summary is printed and the report figure shown,
+    # headless runs never import matplotlib/seaborn and can render the report to a file later (training_report.py)
+    start_time = time.time()
+    train_df = labelled_epochs_power_bands_df[~labelled_epochs_power_bands_df['sleep_stage'].isin(['N', '?', 'M'])]
 
-    model = xgb.XGBClassifier(objective='binary:logistic', n_estimators=100, learning_rate=0.1, max_depth=5)
+    features = FEATURES if features is None else list(features)
+    label = LABEL
+    fold_metrics = None
 
     if train_type == 'rapid':
 
@@ -26,207 +182,50 @@ def train_model(labelled_epochs_power_bands_df, train_type):
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2)
 
+        model = xgb.XGBClassifier(**(MODEL_PARAMS if model_params is None else model_params))
         model.fit(X_train, y_train)
 
-        y_train_pred = model.predict(X_train)
-        y_test_pred = model.predict(X_test)
-        y_train_prob = model.predict_proba(X_train)[:, 1]
         y_test_prob = model.predict_proba(X_test)[:, 1]
-
-        train_accuracy = accuracy_score(y_train, y_train_pred)
-        train_roc_auc = roc_auc_score(y_train, y_train_prob)
-        train_precision = precision_score(y_train, y_train_pred)
-        train_recall = recall_score(y_train, y_train_pred)
-        train_f1 = f1_score(y_train, y_train_pred)
-        train_log_loss = log_loss(y_train, y_train_prob)
-        train_conf_matrix = confusion_matrix(y_train, y_train_pred)
-        train_precision_lst, train_recall_lst, _ = precision_recall_curve(y_train, y_train_prob)
-        train_auc_pr = auc(train_recall_lst, train_precision_lst)
-        train_mcc = matthews_corrcoef(y_train, y_train_pred)
-
-        test_accuracy = accuracy_score(y_test, y_test_pred)
-        test_roc_auc = roc_auc_score(y_test, y_test_prob)
-        test_precision = precision_score(y_test, y_test_pred)
-        test_recall = recall_score(y_test, y_test_pred)
-        test_f1 = f1_score(y_test, y_test_pred)
-        test_log_loss = log_loss(y_test, y_test_prob)
-        test_conf_matrix = confusion_matrix(y_test, y_test_pred)
-        test_precision_lst, test_recall_lst, _ = precision_recall_curve(y_test, y_test_prob)
-        test_auc_pr = auc(test_recall_lst, test_precision_lst)
-        test_mcc = matthews_corrcoef(y_test, y_test_pred)
+        train_metrics, train_conf_matrix = split_metrics(y_train, model.predict_proba(X_train)[:, 1])
+        test_metrics, test_conf_matrix = split_metrics(y_test, y_test_prob)
 
     elif train_type == 'cross_validation':
-        train_df = train_df.sample(frac=0.35, random_state=42) ### DELETE THIS
-
-        # initialize lists to store metrics for each fold
-        train_metrics = {'accuracy': [], 'roc_auc': [], 'precision': [], 'recall': [], 'f1': [], 'log_loss': [], 'auc_pr': [], 'mcc': []}
-        test_metrics = {'accuracy': [], 'roc_auc': [], 'precision': [], 'recall': [], 'f1': [], 'log_loss': [], 'auc_pr': [], 'mcc': []}
-        train_conf_matrices = []
-        test_conf_matrices = []
+        # labels and the row indices of every person are computed once and shared by all folds
+        X = train_df[features].to_numpy()
+        y = train_df[label].isin(['1', '2']).to_numpy(dtype=int)
+        person_codes, persons = factorize_persons(train_df[EPOCH_KEY])
+        test_indices = [np.flatnonzero(person_codes == code) for code in range(len(persons))]
 
         # perform LOOCV variant
-        folds = 0
-        for person in tqdm(train_df['person'].unique()):
-            folds += 1
-            X_train = train_df[train_df['person'] != person][features]
-            y_train = train_df[train_df['person'] != person][label].apply(lambda x: 1 if x in ('1', '2') else 0)
-            X_test = train_df[train_df['person'] == person][features]
-            y_test = train_df[train_df['person'] == person][label].apply(lambda x: 1 if x in ('1', '2') else 0)
-
-            model.fit(X_train, y_train)
-
-            y_train_pred = model.predict(X_train)
-            y_test_pred = model.predict(X_test)
-            y_train_prob = model.predict_proba(X_train)[:, 1]
-            y_test_prob = model.predict_proba(X_test)[:, 1]
-
-            precision, recall, _ = precision_recall_curve(y_train, y_train_prob)
-            recall, precision = zip(*sorted(zip(recall, precision)))
-            train_metrics['auc_pr'].append(auc(recall, precision))
-
-            train_metrics['accuracy'].append(accuracy_score(y_train, y_train_pred))
-            train_metrics['roc_auc'].append(roc_auc_score(y_train, y_train_prob))
-            train_metrics['precision'].append(precision_score(y_train, y_train_pred))
-            train_metrics['recall'].append(recall_score(y_train, y_train_pred))
-            train_metrics['f1'].append(f1_score(y_train, y_train_pred))
-            train_metrics['log_loss'].append(log_loss(y_train, y_train_prob))
-            train_metrics['mcc'].append(matthews_corrcoef(y_train, y_train_pred))
-
-            precision, recall, _ = precision_recall_curve(y_test, y_test_prob)
-            recall, precision = zip(*sorted(zip(recall, precision)))
-            test_metrics['auc_pr'].append(auc(recall, precision))
-
-            test_metrics['accuracy'].append(accuracy_score(y_test, y_test_pred))
-            test_metrics['roc_auc'].append(roc_auc_score(y_test, y_test_prob))
-            test_metrics['precision'].append(precision_score(y_test, y_test_pred))
-            test_metrics['recall'].append(recall_score(y_test, y_test_pred))
-            test_metrics['f1'].append(f1_score(y_test, y_test_pred))
-            test_metrics['log_loss'].append(log_loss(y_test, y_test_prob))
-            test_metrics['mcc'].append(matthews_corrcoef(y_test, y_test_pred))
-
-            train_conf_matrices.append(confusion_matrix(y_train, y_train_pred))
-            test_conf_matrices.append(confusion_matrix(y_test, y_test_pred))
-
-        # Calculate average metrics
-        train_accuracy = sum(train_metrics['accuracy']) / folds
-        train_roc_auc = sum(train_metrics['roc_auc']) / folds
-        train_precision = sum(train_metrics['precision']) / folds
-        train_recall = sum(train_metrics['recall']) / folds
-        train_f1 = sum(train_metrics['f1']) / folds
-        train_log_loss = sum(train_metrics['log_loss']) / folds
-        train_auc_pr = sum(train_metrics['auc_pr']) / folds
-        train_mcc = sum(train_metrics['mcc']) / folds
-
-        test_accuracy = sum(test_metrics['accuracy']) / folds
-        test_roc_auc = sum(test_metrics['roc_auc']) / folds
-        test_precision = sum(test_metrics['precision']) / folds
-        test_recall = sum(test_metrics['recall']) / folds
-        test_f1 = sum(test_metrics['f1']) / folds
-        test_log_loss = sum(test_metrics['log_loss']) / folds
-        test_auc_pr = sum(test_metrics['auc_pr']) / folds
-        test_mcc = sum(test_metrics['mcc']) / folds
-
-        # Calculate average confusion matrices
-        train_conf_matrix = sum(train_conf_matrices)
-        test_conf_matrix = sum(test_conf_matrices)
-
-    print('-- TRAINING METRICS --')
-    print(f"Train Accuracy: {train_accuracy}")
-    print(f"Train ROC AUC: {train_roc_auc}")
-    print(f"Train Precision: {train_precision}")
-    print(f"Train Recall: {train_recall}")
-    print(f"Train F1-score: {train_f1}")
-    print(f"Train Log Loss: {train_log_loss}")
-    print(f"Train AUC-PR: {train_auc_pr}")
-    print(f"Train MCC: {train_mcc}")
-    print(f"Train Confusion Matrix:\n{train_conf_matrix}")
-
-    print('\n-- TESTING METRICS --')
-    print(f"Test Accuracy: {test_accuracy}")
-    print(f"Test ROC AUC: {test_roc_auc}")
-    print(f"Test Precision: {test_precision}")
-    print(f"Test Recall: {test_recall}")
-    print(f"Test F1-score: {test_f1}")
-    print(f"Test Log Loss: {test_log_loss}")
-    print(f"Test AUC-PR: {test_auc_pr}")
-    print(f"Test MCC: {test_mcc}")
-    print(f"Test Confusion Matrix:\n{test_conf_matrix}")
-
-    # Model performance summary metadata
-    print('\n -- MODEL PERFORMANCE SUMMARY --')
-    test_tp = test_conf_matrix[1][1]
-    test_tn = test_conf_matrix[0][0]
-    test_fp = test_conf_matrix[0][1]
-    test_fn = test_conf_matrix[1][0]
-    train_tp = train_conf_matrix[1][1]
-    train_tn = train_conf_matrix[0][0]
-    train_fp = train_conf_matrix[0][1]
-    train_fn = train_conf_matrix[1][0]
-    end_time = time.time()
-    training_time = end_time - start_time
-    print(f"{test_mcc}, {test_auc_pr}, {test_roc_auc}, {test_f1}, {test_precision}, {test_recall}, {test_log_loss}, {test_accuracy}, {test_tp}, {test_tn}, {test_fp}, {test_fn}, {train_mcc}, {train_auc_pr}, {train_roc_auc}, {train_f1}, {train_precision}, {train_recall}, {train_log_loss}, {train_accuracy}, {train_tp}, {train_tn}, {train_fp}, {train_fn}, {training_time}\n")
-
-    fpr, tpr, _ = roc_curve(y_test, y_test_prob)
-    precision, recall, _ = precision_recall_curve(y_test, y_test_prob)
-    auc_pr = auc(recall, precision)
-
-    fig, axes = plt.subplots(2, 2, figsize=(12, 8))
-
-    # ROC Curve
-    axes[0, 0].plot(fpr, tpr, color='darkorange', lw=2, label='ROC curve (AUC = %0.3f)' % test_roc_auc)
-    axes[0, 0].plot([0, 1], [0, 1], color='navy', lw=2, linestyle='--')
-    axes[0, 0].set_xlim([0.0, 1.0])
-    axes[0, 0].set_ylim([0.0, 1.05])
-    axes[0, 0].set_xlabel('False Positive Rate')
-    axes[0, 0].set_ylabel('True Positive Rate')
-    axes[0, 0].set_title('ROC Curve')
-    axes[0, 0].legend(loc="lower right")
-
-    # Precision-Recall Curve
-    axes[0, 1].plot(recall, precision, color='blue', lw=2, label='Precision-Recall Curve (AUC = %0.3f)' % auc_pr)
-    axes[0, 1].set_xlabel('Recall')
-    axes[0, 1].set_ylabel('Precision')
-    axes[0, 1].set_title('Precision-Recall Curve')
-    axes[0, 1].legend(loc="lower left")
-
-    # Confusion Matrix
-    sns.heatmap(test_conf_matrix, annot=True, fmt='d', cmap='Blues', xticklabels=['Other', 'N1/N2 Sleep'], yticklabels=['Other', 'N1/N2 Sleep'], ax=axes[1, 0], cbar=False)
-    axes[1, 0].set_xlabel('Predicted')
-    axes[1, 0].set_ylabel('Actual')
-    axes[1, 0].set_title('Confusion Matrix')
-
-    # Metrics Table
-    metrics_data = {
-        'Metric': ['MCC', 'AUC-PR', 'F1-Score', 'ROC AUC', 'Log Loss', 'Precision', 'Recall', 'Accuracy'],
-        'Testing': [round(test_mcc, 4), round(test_auc_pr, 4), round(test_f1, 4), round(test_roc_auc, 4), round(test_log_loss, 4), round(test_precision, 4), round(test_recall, 4), round(test_accuracy, 4)],
-        'Training': [round(train_mcc, 4), round(train_auc_pr, 4), round(train_f1, 4), round(train_roc_auc, 4), round(train_log_loss, 4), round(train_precision, 4), round(train_recall, 4), round(train_accuracy, 4)],
-        'GenRatio': [
-            round(test_mcc / train_mcc, 4),
-            round(test_auc_pr / train_auc_pr, 4),
-            round(test_f1 / train_f1, 4),
-            round(test_roc_auc / train_roc_auc, 4),
-            round(test_log_loss / train_log_loss, 4),
-            round(test_precision / train_precision, 4),
-            round(test_recall / train_recall, 4),
-            round(test_accuracy / train_accuracy, 4)
-        ]
-    }
-    metrics_df = pd.DataFrame(metrics_data)
-    axes[1, 1].axis('tight')
-    axes[1, 1].axis('off')
-    table = axes[1, 1].table(cellText=metrics_df.values, colLabels=metrics_df.columns, cellLoc='center', loc='center', colColours=['#f2f2f2']*4)
-    table.auto_set_font_size(False)
-    table.set_fontsize(12)
-    table.scale(1.2, 1.2)
-    for (i, j), cell in table.get_celld().items():
-        cell.set_edgecolor('black')
-        if i == 0:
-            cell.set_text_props(weight='bold', color='white')
-            cell.set_facecolor('#40466e')
-        cell.set_height(0.1)
-    axes[1, 1].set_title('Metrics Summary')
-
-    plt.tight_layout(pad=3.0)
-    plt.show()
-
-    return model
\ No newline at end of file
+        workers = os.cpu_count() if workers is None else workers
+        fold_results = run_folds(X, y, test_indices, min(workers, len(test_indices)), progress=not headless, model_params=model_params)
+        folds = len(fold_results)
+
+        fold_metrics = {
+            'persons': list(persons),
+            'train': {metric: [result['train_metrics'][metric] for result in fold_results] for metric in fold_results[0]['train_metrics']},
+            'test': {metric: [result['test_metrics'][metric] for result in fold_results] for metric in fold_results[0]['test_metrics']}
+        }
+
+        # the returned model and the plotted curves come from the last fold, as in the serial loop
+        model = fold_results[-1]['model']
+        y_test = fold_results[-1]['y_test']
+        y_test_prob = fold_results[-1]['y_test_prob']
+
+        # average metrics and summed confusion matrices over the folds
+        train_metrics = {metric: sum(values) / folds for metric, values in fold_metrics['train'].items()}
+        test_metrics = {metric: sum(values) / folds for metric, values in fold_metrics['test'].items()}
+        train_conf_matrix = sum(result['train_conf_matrix'] for result in fold_results)
+        test_conf_matrix = sum(result['test_conf_matrix'] for result in fold_results)
+
+    else:
+        raise ValueError(f"Unknown train_type {train_type}, expected 'rapid' or 'cross_validation'")
+
+    result = TrainingResult(train_type, features, model, train_metrics, test_metrics, train_conf_matrix, test_conf_matrix, y_test, y_test_prob, time.time() - start_time, fold_metrics)
+
+    if not headless:
+        from training_report import render_report
+        print(result.summary())
+        render_report(result, show=True)
+
+    return result
@@ -2,7 +2,13 @@ import os
 import mne
 import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
+from feature_cache import FeatureCache
+from instrumentation import span, traced, count
+from dataset_storage import DATA_DIR, save_dataset, load_dataset, dataset_columns
+from epoch_keys import EPOCH_KEY, pack_epoch_keys, with_epoch_keys, with_epoch_ids, stored_columns
+from feature_sets import EPOCH_SECONDS, POWER_BANDS, EEG_CHANNELS, DEFAULT_FEATURE_SET, band_bin_edges, get_feature_set
 
 def compute_power_bands(signal, sampling_frequency):
     freqs = np.fft.rfftfreq(len(signal), d=1/sampling_frequency)
@@ -26,86 +32,250 @@ def load_edf_files(edf_files):
             continue
         yield edf_file
 
-def process_edf_file(edf_file):
+def physionet_files(hypnograms=False, directory=DATA_DIR):
+    # names of the downloaded Sleep-EDF recordings (or of their hypnograms), cassette before telemetry, each sorted
+    edf_files = []
+    for data_type in ('cassette', 'telemetry'):
+        type_directory = os.path.join(directory, f'sleep-{data_type}')
+        if os.path.isdir(type_directory):
+            edf_files.extend(sorted(edf_file for edf_file in os.listdir(type_directory) if ('Hypnogram' in edf_file) == hypnograms))
+    return edf_files
+
+def edf_file_info(edf_file):
     if edf_file[1] == 'T':
-        raw = mne.io.read_raw_edf(os.path.join('data', 'physionet', 'sleep-telemetry', edf_file), preload=True, verbose=False)
         data_type = 'telemetry'
     elif edf_file[1] == 'C':
-        raw = mne.io.read_raw_edf(os.path.join('data', 'physionet', 'sleep-cassette', edf_file), preload=True, verbose=False)
         data_type = 'cassette'
     else:
         raise ValueError('Invalid file name')
-    
-    sampling_frequency = raw.info['sfreq']
+
+    path = os.path.join('data', 'physionet', f'sleep-{data_type}', edf_file)
     subject_number = edf_file[3:5]
     night_number = edf_file[5]
+
+    return path, data_type, subject_number, night_number
+
+@traced('edf.to_data_frame')
+def process_edf_file(edf_file):
+    path, data_type, subject_number, night_number = edf_file_info(edf_file)
+    raw = mne.io.read_raw_edf(path, preload=True, verbose=False)
+    
+    sampling_frequency = raw.info['sfreq']
     
     df = raw.to_data_frame()
     df = df[['time', 'EEG Fpz-Cz', 'EEG Pz-Oz']]
     df.columns = ['time', 'eegAnterior', 'eegPosterior']
-    df['type'] = data_type
-    df['subject'] = subject_number
-    df['night'] = night_number
+    # constant per night, so categorical instead of one string per sample
+    for column, value in (('type', data_type), ('subject', subject_number), ('night', night_number)):
+        df[column] = pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), [value])
     df['epochNum'] = ((df['time'] - df['time'][0]) // 30).astype(int) # new epoch assigned for every 30 seconds
-    df['epochId'] = data_type + '-' + subject_number + '-' + night_number + '-' + df['epochNum'].apply(lambda x: f"{x:04d}")
+    df[EPOCH_KEY] = pack_epoch_keys(data_type, subject_number, night_number, df['epochNum'].to_numpy())
 
     return df, sampling_frequency
 
+@traced('edf.decode')
+def read_eeg_signals(path, channels=EEG_CHANNELS):
+    # only the EEG channels are read from disk, one at a time, and kept as float32 in uV like to_data_frame
+    raw = mne.io.read_raw_edf(path, include=list(channels.values()), preload=False, verbose=False)
+
+    sampling_frequency = raw.info['sfreq']
+    signals = np.empty((len(channels), raw.n_times), dtype=np.float32)
+    for i, channel in enumerate(channels.values()):
+        signals[i] = raw.get_data(picks=[channel], units='uV')[0]
+
+    return signals, sampling_frequency
+
+def read_edf_signals(edf_file, channels=EEG_CHANNELS):
+    path, data_type, subject_number, night_number = edf_file_info(edf_file)
+    return (*read_eeg_signals(path, channels), data_type, subject_number, night_number)
+
+def epoch_offsets(n_samples, sampling_frequency):
+    # sample offset and length of every 30 second epoch, the last one may be truncated
+    epoch_samples = int(round(EPOCH_SECONDS * sampling_frequency))
+    epoch_starts = np.arange(0, n_samples, epoch_samples)
+    epoch_lengths = np.minimum(epoch_samples, n_samples - epoch_starts)
+    return epoch_starts, epoch_lengths
+
+def compute_power_bands_batch(epochs, sampling_frequency):
+    # epochs is a 2-D (epochs x samples) array, returns one array of relative powers per band
+    epochs = np.asarray(epochs, dtype=np.float64)
+    fft_vals = np.abs(np.fft.rfft(epochs, axis=1))**2
+    total_power = np.sum(fft_vals, axis=1)
+    edges = band_bin_edges(epochs.shape[1], float(sampling_frequency))
+
+    return {band: np.round(np.sum(fft_vals[:, start:stop], axis=1) / total_power, 5) for band, (start, stop) in edges.items()}
+
+def compute_power_bands_for_signals(signals, epoch_starts, epoch_lengths, sampling_frequency):
+    # signals maps a column prefix to a 1-D signal, epochs are given as sample offsets and lengths
+    epoch_starts = np.asarray(epoch_starts, dtype=np.int64)
+    epoch_lengths = np.asarray(epoch_lengths, dtype=np.int64)
+    epoch_samples = int(round(EPOCH_SECONDS * sampling_frequency))
+    full = epoch_lengths == epoch_samples
+    sample_index = epoch_starts[full][:, None] + np.arange(epoch_samples)
+
+    columns = {}
+    for prefix, signal in signals.items():
+        band_powers = {band: np.empty(len(epoch_starts)) for band in POWER_BANDS}
+        for band, powers in compute_power_bands_batch(signal[sample_index], sampling_frequency).items():
+            band_powers[band][full] = powers
+
+        # truncated epochs (normally only the last one of a night) have their own frequency resolution
+        for i in np.flatnonzero(~full):
+            epoch_power_bands = compute_power_bands(signal[epoch_starts[i]:epoch_starts[i] + epoch_lengths[i]], sampling_frequency)
+            for band, power in epoch_power_bands.items():
+                band_powers[band][i] = power
+
+        columns.update({f'{prefix}_{band}': powers for band, powers in band_powers.items()})
+
+    return columns
+
+@traced('features.epochs')
 def compute_power_bands_for_epochs(df, sampling_frequency):
-    epochs = df.groupby('epochId')
-    power_bands_list = []
+    # samples of an epoch are contiguous, so every epoch is a run of equal epoch keys
+    epoch_keys = df[EPOCH_KEY].to_numpy()
+    epoch_starts = np.flatnonzero(np.r_[True, epoch_keys[1:] != epoch_keys[:-1]])
+    epoch_lengths = np.diff(np.r_[epoch_starts, len(epoch_keys)])
+
+    columns = compute_power_bands_for_signals({
+        'anterior': df['eegAnterior'].to_numpy(dtype=np.float64),
+        'posterior': df['eegPosterior'].to_numpy(dtype=np.float64)
+    }, epoch_starts, epoch_lengths, sampling_frequency)
+
+    power_bands_df = pd.DataFrame({EPOCH_KEY: epoch_keys[epoch_starts], **columns})
+    return power_bands_df.sort_values(EPOCH_KEY, kind='stable', ignore_index=True)
+
+@traced('features.extract')
+def compute_night_features(signals, sampling_frequency, feature_set=None):
+    # signals is (channels x samples) in the feature set's channel order; returns the 30 s epoch number of every row
+    # and the feature columns, the same for training datasets and batch scoring
+    feature_set = get_feature_set(feature_set)
+    epoch_starts, epoch_lengths = feature_set.epoch_offsets(signals.shape[1], sampling_frequency)
+    columns = feature_set.extract(signals, sampling_frequency, epoch_starts, epoch_lengths)
 
-    for epoch_id, epoch_df in epochs:
-        eeg_anterior = epoch_df['eegAnterior'].values
-        eeg_posterior = epoch_df['eegPosterior'].values
+    # sliding epochs are labelled with the 30 s epoch their centre falls in and keep their start time to stay unique
+    epoch_numbers = (epoch_starts + epoch_lengths // 2) // int(round(EPOCH_SECONDS * sampling_frequency)) if feature_set.overlapping() else np.arange(len(epoch_starts))
+    if feature_set.overlapping():
+        columns = {'start_time': epoch_starts / sampling_frequency, **columns}
 
-        power_bands_anterior = compute_power_bands(eeg_anterior, sampling_frequency)
-        power_bands_posterior = compute_power_bands(eeg_posterior, sampling_frequency)
+    return epoch_numbers, columns
 
-        power_bands = {
-            'epochId': epoch_id,
-            **{f'anterior_{band}': power for band, power in power_bands_anterior.items()},
-            **{f'posterior_{band}': power for band, power in power_bands_posterior.items()}
-        }
-        power_bands_list.append(power_bands)
+def compute_power_bands_for_night(signals, sampling_frequency, data_type, subject_number, night_number, feature_set=None):
+    epoch_numbers, columns = compute_night_features(signals, sampling_frequency, feature_set)
+    return pd.DataFrame({EPOCH_KEY: pack_epoch_keys(data_type, subject_number, night_number, epoch_numbers), **columns})
 
-    return pd.DataFrame(power_bands_list)
+@traced('features.night')
+def process_night_features(edf_file, feature_set=None, archive=None):
+    # archive is a signal_archive directory to read the night from instead of decoding the EDF
+    feature_set = get_feature_set(feature_set)
+    if archive is not None:
+        from signal_archive import SignalArchive
+        return compute_power_bands_for_night(*SignalArchive(archive).read_edf_signals(edf_file, feature_set.channels), feature_set=feature_set)
+    return compute_power_bands_for_night(*read_edf_signals(edf_file, feature_set.channels), feature_set=feature_set)
 
-def preprocess_features(preprocess_features, download_files):
+def feature_parameters(feature_set=None):
+    # everything that changes the extracted features, part of the feature cache key
+    return get_feature_set(feature_set).parameters()
+
+def label_parameters():
+    return {'epoch_seconds': EPOCH_SECONDS}
+
+def dataset_name(name, feature_set=None):
+    # datasets of the default feature set keep their original names, other sets get theirs appended
+    feature_set = get_feature_set(feature_set)
+    return name if feature_set.name == DEFAULT_FEATURE_SET else f'{name}.{feature_set.name}'
+
+@traced('dataset.save')
+def save_epochs_dataset(df, name, storage_format=None):
+    # csv is the export format and keeps the legacy string epochId, the binary formats store the int64 key
+    return save_dataset(with_epoch_ids(df) if storage_format == 'csv' else df, name, storage_format)
+
+@traced('dataset.load')
+def load_epochs_dataset(name, columns=None):
+    # datasets saved before the epoch keys (and csv exports) have the string epochId, it is parsed into the key on load
+    return with_epoch_keys(load_dataset(name, columns=stored_columns(columns, dataset_columns(name))))
+
+def load_cached_nights(feature_cache, kind, files, parameters):
+    # returns the cache key of every file and the frames that are already cached
+    cache_keys = {file: feature_cache.key(kind, edf_file_info(file)[0], parameters) for file in files}
+    cached_frames = {file: feature_cache.get(key) for file, key in cache_keys.items()}
+    cached_frames = {file: with_epoch_keys(df) for file, df in cached_frames.items() if df is not None}
+    print(f"{len(cached_frames)} of {len(files)} nights ({kind}) loaded from {feature_cache.cache_dir}")
+    return cache_keys, cached_frames
+
+@traced('preprocess.features')
+def preprocess_features(preprocess_features, download_files, workers=1, cache=True, storage_format=None, columns=None, feature_set=None, archive=None):
 
     if preprocess_features:
-        edf_files = []
-        edf_files.extend(os.listdir(os.path.join('data', 'physionet', 'sleep-cassette')))
-        edf_files.extend(os.listdir(os.path.join('data', 'physionet', 'sleep-telemetry')))
-        edf_files = [edf_file for edf_file in edf_files if 'Hypnogram' not in edf_file]
+        if archive is not None:
+            # every night of the signal archive (signal_archive.py convert), slicing the memory map is cheap enough that the feature cache is skipped
+            from signal_archive import SignalArchive
+            edf_files = SignalArchive(archive).nights()
+            cache = False
+        else:
+            edf_files = physionet_files()
         all_epochs_power_bands_df = []
+        failed_files = []
 
-        for edf_file in tqdm(edf_files, desc='Processing Nights (Features)', colour='GREEN'):
-            raw_data_df, sampling_freq = process_edf_file(edf_file)
-            epochs_power_bands_df = compute_power_bands_for_epochs(raw_data_df, sampling_freq)
-            all_epochs_power_bands_df.append(epochs_power_bands_df)
+        # only nights whose file or feature parameters changed since the last run are recomputed
+        feature_cache = FeatureCache() if cache else None
+        cache_keys, cached_frames = load_cached_nights(feature_cache, 'features', edf_files, feature_parameters(feature_set)) if cache else ({}, {})
 
-        all_epochs_power_bands_df = pd.concat(all_epochs_power_bands_df, ignore_index=True)
+        # nights are independent, with workers > 1 each one is processed in its own process
+        # results are still collected in file order and a failing night is skipped instead of aborting the run
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            if executor is not None:
+                futures = {edf_file: executor.submit(process_night_features, edf_file, feature_set, archive) for edf_file in edf_files if edf_file not in cached_frames}
+            for edf_file in tqdm(edf_files, desc='Processing Nights (Features)', colour='GREEN'):
+                if edf_file in cached_frames:
+                    all_epochs_power_bands_df.append(cached_frames[edf_file])
+                    count('nights', stage='features', source='cache')
+                    count('epochs', len(cached_frames[edf_file]), stage='features')
+                    continue
+                try:
+                    epochs_power_bands_df = futures[edf_file].result() if executor is not None else process_night_features(edf_file, feature_set, archive)
+                except Exception as error:
+                    failed_files.append(edf_file)
+                    print(f"Failed to process {edf_file}: {type(error).__name__}: {error}")
+                    count('nights_failed', stage='features')
+                    continue
+                if feature_cache is not None:
+                    feature_cache.put(cache_keys[edf_file], epochs_power_bands_df, 'features', edf_file)
+                all_epochs_power_bands_df.append(epochs_power_bands_df)
+                count('nights', stage='features', source='computed')
+                count('epochs', len(epochs_power_bands_df), stage='features')
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            # one index write for the whole batch of lookups and new entries
+            if feature_cache is not None:
+                feature_cache.save()
+
+        if failed_files:
+            print(f"Skipped {len(failed_files)} of {len(edf_files)} nights: {', '.join(failed_files)}")
+        if not all_epochs_power_bands_df:
+            raise RuntimeError('No nights could be processed')
+
+        with span('preprocess.concat', stage='features'):
+            all_epochs_power_bands_df = pd.concat(all_epochs_power_bands_df, ignore_index=True)
 
         if download_files:
-            all_epochs_power_bands_df.to_csv(os.path.join('data', 'physionet', 'frequency_spectrum_data.csv'), index=False)
-            print('Data saved to data/physionet/frequency_spectrum_data.csv')
+            path = save_epochs_dataset(all_epochs_power_bands_df, dataset_name('frequency_spectrum_data', feature_set), storage_format)
+            print(f'Data saved to {path}')
             print(f"File Size: {all_epochs_power_bands_df.memory_usage(deep=True).sum() / 1e6:.2f} MB")
 
+        if columns is not None:
+            all_epochs_power_bands_df = all_epochs_power_bands_df[columns]
+
     else:
-        all_epochs_power_bands_df = pd.read_csv(os.path.join('data', 'physionet', 'frequency_spectrum_data.csv'))
+        # reads whichever format was saved, preferring the binary ones over csv
+        all_epochs_power_bands_df = load_epochs_dataset(dataset_name('frequency_spectrum_data', feature_set), columns=columns)
 
     return all_epochs_power_bands_df
 
-def extract_annotations(edfp_file):
-    if edfp_file[1] == 'T':
-        raw = mne.read_annotations(os.path.join('data', 'physionet', 'sleep-telemetry', edfp_file))
-        data_type = 'telemetry'
-    elif edfp_file[1] == 'C':
-        raw = mne.read_annotations(os.path.join('data', 'physionet', 'sleep-cassette', edfp_file))
-        data_type = 'cassette'
-    else:
-        raise ValueError('Invalid file name')
+@traced('labels.read')
+def read_annotations(path, data_type, subject_number, night_number):
+    raw = mne.read_annotations(path)
 
     annotations_df = pd.DataFrame({
         "onset": raw.onset,
@@ -113,61 +283,96 @@ def extract_annotations(edfp_file):
         "end": raw.onset + raw.duration,
         "sleep_stage": raw.description
     })
-    annotations_df['sleep_stage'] = annotations_df['sleep_stage'].apply(lambda x: 'M' if x == 'Movement time' else x.split(' ')[-1])
+    descriptions = annotations_df['sleep_stage'].astype(str)
+    annotations_df['sleep_stage'] = descriptions.str.split(' ').str[-1].where(descriptions != 'Movement time', 'M')
     
-    subject_number = edfp_file[3:5]
-    night_number = edfp_file[5]
-    annotations_df['epochId'] = annotations_df.apply(lambda row: f"{data_type}-{subject_number}-{night_number}-{int(row['onset'] // 30):04d}", axis=1)
+    annotations_df[EPOCH_KEY] = pack_epoch_keys(data_type, subject_number, night_number, (annotations_df['onset'] // 30).to_numpy(dtype=np.int64))
     
-    return annotations_df, data_type, subject_number, night_number
+    return annotations_df
+
+def extract_annotations(edfp_file):
+    path, data_type, subject_number, night_number = edf_file_info(edfp_file)
+    return read_annotations(path, data_type, subject_number, night_number), data_type, subject_number, night_number
 
+@traced('labels.generate')
 def generate_labels(annotations_df, data_type, subject_number, night_number):
-    labels_list = []
-    epochs = int((annotations_df.iloc[-1]['onset'] + annotations_df.iloc[-1]['duration']) // 30)
-
-    for epoch in range(epochs):
-        min_timestamp = epoch * 30
-        max_timestamp = (epoch + 1) * 30
-        epoch_id = f"{data_type}-{subject_number}-{night_number}-{epoch:04d}"
-        interval_epoch_annotations = annotations_df[(annotations_df['onset'] < max_timestamp) & (annotations_df['end'] > min_timestamp)]
-        if len(interval_epoch_annotations) == 0:
-            sleep_stage = 'N' # no label available
-        elif len(interval_epoch_annotations) == 1:
-            sleep_stage = interval_epoch_annotations.iloc[0]['sleep_stage']
-        else:
-            sleep_stage = 'T' # transition epoch
-        labels_list.append({
-            'epochId': epoch_id,
-            'sleep_stage': sleep_stage
-        })
+    epochs = int((annotations_df.iloc[-1]['onset'] + annotations_df.iloc[-1]['duration']) // EPOCH_SECONDS)
+    min_timestamps = np.arange(epochs) * EPOCH_SECONDS
+    max_timestamps = min_timestamps + EPOCH_SECONDS
+
+    order = np.argsort(annotations_df['onset'].values, kind='stable')
+    onsets = annotations_df['onset'].values[order]
+    ends = annotations_df['end'].values[order]
+    sleep_stages = annotations_df['sleep_stage'].values[order]
 
-    return labels_list
+    # an annotation overlaps an epoch when onset < max_timestamp and end > min_timestamp
+    # every annotation ending at or before min_timestamp also starts before max_timestamp, so the overlap count is a difference of two searches
+    started = np.searchsorted(onsets, max_timestamps, side='left')
+    overlapping = started - np.searchsorted(np.sort(ends), min_timestamps, side='right')
 
-def preprocess_labels(all_epochs_power_bands_df, preprocess_labels, download_files):
+    labels = np.full(epochs, 'N', dtype=object) # no label available
+    labels[overlapping > 1] = 'T' # transition epoch
 
-    labelled_epochs_power_bands_df = all_epochs_power_bands_df.copy(deep=True)
+    # with a single overlap it is normally the last annotation started before max_timestamp, unless annotations overlap each other
+    single = np.flatnonzero(overlapping == 1)
+    latest = started[single] - 1
+    found = ends[latest] > min_timestamps[single]
+    labels[single[found]] = sleep_stages[latest[found]]
+    for epoch in single[~found]:
+        labels[epoch] = sleep_stages[(onsets < max_timestamps[epoch]) & (ends > min_timestamps[epoch])][0]
+
+    return pd.DataFrame({
+        EPOCH_KEY: pack_epoch_keys(data_type, subject_number, night_number, np.arange(epochs)),
+        'sleep_stage': labels
+    })
+
+@traced('labels.join')
+def label_epochs(epochs_df, labels_df):
+    # epochs without a label (outside the hypnogram) get 'N'
+    labelled_df = epochs_df.merge(labels_df, on=EPOCH_KEY, how='left')
+    labelled_df['sleep_stage'] = labelled_df['sleep_stage'].fillna('N')
+    return labelled_df
+
+def process_night_labels(edfp_file):
+    return generate_labels(*extract_annotations(edfp_file))
+
+@traced('preprocess.labels')
+def preprocess_labels(all_epochs_power_bands_df, preprocess_labels, download_files, cache=True, storage_format=None, columns=None, feature_set=None):
 
     if preprocess_labels:
-        edfp_files = []
-        edfp_files.extend(os.listdir(os.path.join('data', 'physionet', 'sleep-cassette')))
-        edfp_files.extend(os.listdir(os.path.join('data', 'physionet', 'sleep-telemetry')))
-        edfp_files = [edf_file for edf_file in edfp_files if 'Hypnogram' in edf_file]
+        edfp_files = physionet_files(hypnograms=True)
+
+        feature_cache = FeatureCache() if cache else None
+        cache_keys, cached_frames = load_cached_nights(feature_cache, 'labels', edfp_files, label_parameters()) if cache else ({}, {})
 
         labels_list = []
         for edfp_file in tqdm(edfp_files, desc='Processing Nights (Labels)', colour='GREEN'):
-            annotations_df, data_type, subject_number, night_number = extract_annotations(edfp_file)
-            labels_list.extend(generate_labels(annotations_df, data_type, subject_number, night_number))
+            if edfp_file in cached_frames:
+                labels_list.append(cached_frames[edfp_file])
+                count('nights', stage='labels', source='cache')
+                continue
+            night_labels_df = process_night_labels(edfp_file)
+            if feature_cache is not None:
+                feature_cache.put(cache_keys[edfp_file], night_labels_df, 'labels', edfp_file)
+            labels_list.append(night_labels_df)
+            count('nights', stage='labels', source='computed')
+        if feature_cache is not None:
+            feature_cache.save()
 
-        labels_df = pd.DataFrame(labels_list)
-        labelled_epochs_power_bands_df = labelled_epochs_power_bands_df.merge(labels_df, on='epochId', how='left')
-        labelled_epochs_power_bands_df['sleep_stage'] = labelled_epochs_power_bands_df['sleep_stage'].fillna('N')
+        labels_df = pd.concat(labels_list, ignore_index=True)
+        labelled_epochs_power_bands_df = label_epochs(all_epochs_power_bands_df, labels_df)
+        count('epochs', len(labelled_epochs_power_bands_df), stage='labels')
 
     else:
-        labelled_epochs_power_bands_df = pd.read_csv(os.path.join('data', 'physionet', 'labelled_frequency_spectrum_data.csv'))
+        # all columns are needed when the dataset is re-saved, e.g. converting an old csv to a binary format
+        labelled_epochs_power_bands_df = load_epochs_dataset(dataset_name('labelled_frequency_spectrum_data', feature_set), columns=None if download_files else columns)
 
     # Save the merged dataframe if needed
     if download_files:
-        labelled_epochs_power_bands_df.to_csv(os.path.join('data', 'physionet', 'labelled_frequency_spectrum_data.csv'), index=False)
-        print('Data with labels saved to data/physionet/labelled_frequency_spectrum_data.csv')
+        path = save_epochs_dataset(labelled_epochs_power_bands_df, dataset_name('labelled_frequency_spectrum_data', feature_set), storage_format)
+        print(f'Data with labels saved to {path}')
+
+    if columns is not None:
+        labelled_epochs_power_bands_df = labelled_epochs_power_bands_df[columns]
 
-    return labelled_epochs_power_bands_df
\ No newline at end of file
+    return labelled_epochs_power_bands_df
@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+from tqdm import tqdm
+from feature_sets import EEG_CHANNELS, EPOCH_SECONDS, DEFAULT_FEATURE_SET, get_feature_set
+from dataset_storage import write_json
+from preprocessing_functions import physionet_files, edf_file_info, read_eeg_signals
+
+ARCHIVE_DIR = os.path.join('data', 'physionet', 'signal_archive')
+SIGNALS_FILE = 'signals.f32'
+INDEX_FILE = 'index.json'
+
+class SignalArchive:
+    # the EEG channels of every night decoded once into one flat float32 file (uV, exactly what read_edf_signals returns)
+    # each night is a contiguous (channels x samples) block; index.json holds its offset, length, sampling rate and
+    # type/subject/night, so reading a night or a range of epochs is a slice of a memory map and never touches the EDF
+
+    def __init__(self, directory=ARCHIVE_DIR, channels=EEG_CHANNELS):
+        self.directory = directory
+        self.signals_path = os.path.join(directory, SIGNALS_FILE)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {'channels': channels, 'dtype': 'float32', 'nights': {}}
+        self.channels = self.index['channels']
+        self._memmap = None
+
+    def _save_index(self):
+        write_json(self.index_path, self.index)
+        self._memmap = None # the file may have grown
+
+    def memmap(self):
+        if self._memmap is None:
+            self._memmap = np.memmap(self.signals_path, dtype=np.float32, mode='r')
+        return self._memmap
+
+    def nights(self, types=None, subjects=None):
+        return [edf_file for edf_file, entry in sorted(self.index['nights'].items()) if (types is None or entry['type'] in types) and (subjects is None or entry['subject'] in subjects)]
+
+    def __contains__(self, edf_file):
+        return edf_file in self.index['nights']
+
+    def convert(self, edf_files, rebuild=False, progress=True):
+        # appends the nights that are new or whose EDF changed (size or mtime); rebuild rewrites the whole archive,
+        # which also drops the blocks of nights that were converted again
+        os.makedirs(self.directory, exist_ok=True)
+        if rebuild:
+            self.index['nights'] = {}
+        converted = 0
+        with open(self.signals_path, 'wb' if rebuild else 'ab') as signals_file:
+            for edf_file in tqdm(edf_files, desc='Archiving Nights', colour='GREEN', disable=not progress):
+                path, data_type, subject_number, night_number = edf_file_info(edf_file)
+                stat = os.stat(path)
+                entry = self.index['nights'].get(edf_file)
+                if entry is not None and entry['source'] == {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}:
+                    continue
+
+                signals, sampling_frequency = read_eeg_signals(path, self.channels)
+                offset = signals_file.tell() // 4
+                signals_file.write(np.ascontiguousarray(signals, dtype=np.float32).tobytes())
+                signals_file.flush()
+                self.index['nights'][edf_file] = {
+                    'type': data_type,
+                    'subject': subject_number,
+                    'night': night_number,
+                    'offset': offset,
+                    'samples': signals.shape[1],
+                    'sampling_frequency': sampling_frequency,
+                    'source': {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+                }
+                # the index is only written once the block is on disk, an interrupted run leaves unreferenced bytes at most
+                self._save_index()
+                converted += 1
+        self._save_index()
+        return converted
+
+    def read_signals(self, edf_file, channels=None, start_sample=0, stop_sample=None):
+        # (channels x samples) view into the memory map; a copy is only made when the channels are a reordered subset
+        entry = self.index['nights'][edf_file]
+        n_channels = len(self.channels)
+        block = self.memmap()[entry['offset']:entry['offset'] + n_channels * entry['samples']].reshape(n_channels, entry['samples'])
+        signals = block[:, start_sample:stop_sample]
+        if channels is not None and list(channels.values()) != list(self.channels.values()):
+            missing = [channel for channel in channels.values() if channel not in self.channels.values()]
+            if missing:
+                raise KeyError(f'Channels not in the signal archive: {missing}')
+            names = list(self.channels.values())
+            signals = signals[[names.index(channel) for channel in channels.values()]]
+        return signals, entry['sampling_frequency']
+
+    def read_epochs(self, edf_file, start_epoch, stop_epoch=None, channels=None):
+        # the samples of 30 s epochs [start_epoch, stop_epoch) of one night
+        sampling_frequency = self.index['nights'][edf_file]['sampling_frequency']
+        epoch_samples = int(round(EPOCH_SECONDS * sampling_frequency))
+        stop_sample = None if stop_epoch is None else stop_epoch * epoch_samples
+        return self.read_signals(edf_file, channels, start_epoch * epoch_samples, stop_sample)
+
+    def read_edf_signals(self, edf_file, channels=EEG_CHANNELS):
+        # drop-in for preprocessing_functions.read_edf_signals
+        entry = self.index['nights'][edf_file]
+        return (*self.read_signals(edf_file, channels), entry['type'], entry['subject'], entry['night'])
+
+    def entries(self):
+        return [{'file': edf_file, **{field: entry[field] for field in ('type', 'subject', 'night', 'samples', 'sampling_frequency')}} for edf_file, entry in sorted(self.index['nights'].items())]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert the PhysioNet EDFs once into a memory-mapped float32 signal archive and extract features from it')
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert_parser = subparsers.add_parser('convert', help='archive every downloaded night that is new or changed')
+    convert_parser.add_argument('--rebuild', action='store_true', help='rewrite the archive from scratch')
+    subparsers.add_parser('list', help='list the archived nights')
+    features_parser = subparsers.add_parser('features', help='extract and save the feature dataset of a feature set from the archive')
+    features_parser.add_argument('--feature-set', default=DEFAULT_FEATURE_SET)
+    features_parser.add_argument('--workers', type=int, default=1)
+    features_parser.add_argument('--format', default=None, help='storage format of the saved dataset')
+    args = parser.parse_args(argv)
+
+    archive = SignalArchive(args.archive_dir)
+    if args.command == 'convert':
+        converted = archive.convert(physionet_files(), rebuild=args.rebuild)
+        print(f"Archived {converted} nights, {len(archive.index['nights'])} in {archive.signals_path} ({os.path.getsize(archive.signals_path) / 1e9:.2f} GB)")
+    elif args.command == 'list':
+        for entry in archive.entries():
+            print(f"{entry['file']:<24}{entry['type']:<11}{entry['subject']:>4}{entry['night']:>3}{entry['samples'] / entry['sampling_frequency'] / 3600:>8.2f} h")
+        print(f"{len(archive.index['nights'])} nights")
+    elif args.command == 'features':
+        from preprocessing_functions import preprocess_features
+        preprocess_features(preprocess_features=True, download_files=True, workers=args.workers, storage_format=args.format, feature_set=get_feature_set(args.feature_set), archive=archive.directory)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import numpy as np
+from feature_sets import EPOCH_SECONDS, get_feature_set
+
+class RingBuffer:
+    # fixed-size (channels x capacity) sample buffer, memory stays constant however long the session runs
+
+    def __init__(self, channels, capacity, dtype=np.float32):
+        self.buffer = np.zeros((channels, capacity), dtype=dtype)
+        self.capacity = capacity
+        self.position = 0 # next write index
+        self.total_samples = 0
+
+    def extend(self, samples):
+        self.total_samples += samples.shape[1]
+        samples = samples[:, -self.capacity:]
+        n = samples.shape[1]
+        first = min(n, self.capacity - self.position)
+        self.buffer[:, self.position:self.position + first] = samples[:, :first]
+        self.buffer[:, :n - first] = samples[:, first:]
+        self.position = (self.position + n) % self.capacity
+
+    def filled(self):
+        return min(self.total_samples, self.capacity)
+
+    def latest(self, n):
+        # the most recent n samples in time order
+        if n > self.filled():
+            raise ValueError(f'Only {self.filled()} samples buffered, {n} requested')
+        start = (self.position - n) % self.capacity
+        if start + n <= self.capacity:
+            return self.buffer[:, start:start + n].copy()
+        return np.concatenate([self.buffer[:, start:], self.buffer[:, :self.position]], axis=1)
+
+class StreamingSleepStager:
+    # turns EEG chunks of any size into per-epoch features and N1/N2 probabilities
+    # an epoch is the last 30 s of signal, emitted every hop_seconds (30 s, i.e. non-overlapping, by default)
+    # features match compute_power_bands_for_night with the same feature set, which defaults to the model bundle's,
+    # their order defaults to the model bundle's too
+
+    def __init__(self, model, sampling_frequency, hop_seconds=EPOCH_SECONDS, features=None, feature_set=None):
+        self.model = model
+        self.sampling_frequency = sampling_frequency
+        self.feature_set = get_feature_set(getattr(model, 'feature_set', None) if feature_set is None else feature_set)
+        self.features = (model.features if model is not None else self.feature_set.columns()) if features is None else features
+        self.epoch_samples = int(round(self.feature_set.epoch_seconds * sampling_frequency))
+        self.hop_samples = int(round(hop_seconds * sampling_frequency))
+        if not 0 < self.hop_samples <= self.epoch_samples:
+            raise ValueError('hop_seconds must be between 0 and the epoch length')
+        self.buffer = RingBuffer(len(self.feature_set.channels), self.epoch_samples)
+        self.samples_until_epoch = self.epoch_samples
+        self.epochs_emitted = 0
+
+    def epoch_features(self, windows):
+        # windows is (epochs x channels x samples), returns the feature matrix in self.features order
+        columns = self.feature_set.features(windows.transpose(1, 0, 2), self.sampling_frequency)
+        return np.column_stack([columns[feature] for feature in self.features]), columns
+
+    def push(self, samples):
+        # samples is (channels x n) in the feature set's channel order, returns the epochs completed by this chunk
+        samples = np.asarray(samples, dtype=np.float32)
+        channels = len(self.feature_set.channels)
+        if samples.ndim != 2 or samples.shape[0] != channels:
+            raise ValueError(f'Expected a ({channels}, n) array of samples, got {samples.shape}')
+
+        windows = []
+        end_samples = []
+        position = 0
+        while position < samples.shape[1]:
+            take = min(samples.shape[1] - position, self.samples_until_epoch)
+            self.buffer.extend(samples[:, position:position + take])
+            position += take
+            self.samples_until_epoch -= take
+            if self.samples_until_epoch == 0:
+                windows.append(self.buffer.latest(self.epoch_samples))
+                end_samples.append(self.buffer.total_samples)
+                self.samples_until_epoch = self.hop_samples
+
+        if not windows:
+            return []
+
+        # every epoch completed by one chunk is scored in a single batch
+        X, columns = self.epoch_features(np.stack(windows))
+        probabilities = self.model.predict_proba(X)[:, 1] if self.model is not None else np.full(len(windows), np.nan)
+
+        epochs = []
+        for i, end_sample in enumerate(end_samples):
+            epochs.append({
+                'epoch': self.epochs_emitted,
+                'start_time': (end_sample - self.epoch_samples) / self.sampling_frequency,
+                'end_time': end_sample / self.sampling_frequency,
+                'features': {name: float(values[i]) for name, values in columns.items()},
+                'probability': float(probabilities[i])
+            })
+            self.epochs_emitted += 1
+
+        return epochs
@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from wake_alarm import LightSleepFilter, WakeWindowScheduler, WakeAlarm, replay, replay_summary
+from epoch_keys import EPOCH_KEY, pack_epoch_keys
+
+def forward_filter(probabilities, transition, prior, initial):
+    # textbook matrix form of the HMM forward recursion, states (other, light)
+    belief = np.array([1 - initial, initial])
+    posteriors = []
+    for probability in probabilities:
+        belief = belief @ transition
+        belief = belief * np.array([(1 - probability) / (1 - prior), probability / prior])
+        belief /= belief.sum()
+        posteriors.append(belief[1])
+    return np.array(posteriors)
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    probabilities = rng.random(500)
+
+    # the scalar update is the forward recursion, also for hops shorter than an epoch (matrix power of the 30 s chain)
+    for hop_seconds in (30, 10):
+        light_sleep_filter = LightSleepFilter(enter_probability=0.1, leave_probability=0.2, prior=0.3, hop_seconds=hop_seconds)
+        values, vectors = np.linalg.eig(np.array([[0.9, 0.1], [0.2, 0.8]]))
+        transition = vectors @ np.diag(values ** (hop_seconds / 30)) @ np.linalg.inv(vectors)
+        expected = forward_filter(probabilities, transition, 0.3, light_sleep_filter.initial)
+        assert np.allclose([light_sleep_filter.update(p) for p in probabilities], expected), f'hop {hop_seconds}: filter differs from the forward recursion'
+
+    # a flickering classifier is smoothed: isolated spikes do not reach the threshold, sustained light sleep does
+    light_sleep_filter = LightSleepFilter(prior=0.5)
+    spikes = [light_sleep_filter.update(p) for p in [0.1, 0.1, 0.95, 0.1, 0.1]]
+    assert max(spikes) < 0.8
+    sustained = [light_sleep_filter.update(p) for p in [0.9] * 5]
+    assert sustained[-1] > 0.95
+
+    # the scheduler ignores epochs before the window, needs confirm_epochs in a row, and falls back to the deadline
+    scheduler = WakeWindowScheduler(600, 1200, threshold=0.8, confirm_epochs=2)
+    assert [scheduler.update(t, p) for t, p in [(570, 0.99), (600, 0.9), (630, 0.5), (660, 0.85), (690, 0.9), (720, 0.99)]] == [None, None, None, None, 'light_sleep', None]
+    assert scheduler.fired_time == 690
+    scheduler = WakeWindowScheduler(600, 1200)
+    assert [scheduler.update(t, 0.1) for t in range(600, 1260, 30)][-2:] == ['deadline', None] and scheduler.fired_time == 1200
+
+    # a full night of updates: constant memory and well under a millisecond per epoch
+    alarm = WakeAlarm(6 * 3600, 7 * 3600)
+    night = rng.random(960)
+    start_time = time.perf_counter()
+    for i, probability in enumerate(night.tolist()):
+        alarm.update((i + 1) * 30.0, probability)
+    elapsed = (time.perf_counter() - start_time) / len(night)
+    assert elapsed < 1e-4, f'{elapsed * 1e6:.1f} us per epoch'
+    # nothing accumulates: a second night allocates no more than the first
+    tracemalloc.start()
+    for i, probability in enumerate(night.tolist()):
+        alarm.update((i + 1) * 30.0, probability)
+    retained_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert retained_memory < 10_000, f'{retained_memory} bytes retained over a night'
+
+    # replay with a perfect, already smooth classifier: every window fires on its first light epoch (after confirmation)
+    stages = np.array(['W'] * 60 + ['2'] * 200 + ['3'] * 200 + ['R'] * 100 + ['1', 'W'] * 20 + ['2'] * 300 + ['W'] * 60)
+    frames = []
+    for subject in range(3):
+        frames.append(pd.DataFrame({EPOCH_KEY: pack_epoch_keys('cassette', subject, 1, np.arange(len(stages))), 'sleep_stage': stages}))
+    df = pd.concat(frames, ignore_index=True)
+    perfect = np.where(df['sleep_stage'].isin(['1', '2']), 0.99, 0.01)
+    rows, filter_seconds = replay(df, perfect, 0.5, window_minutes=30, step_minutes=60, earliest_hours=3, confirm_epochs=2)
+    summary = replay_summary(rows)
+    assert summary['windows'] == 3 * 4 and summary['false_trigger_rate'] == 0 and summary['missed_rate'] == 0
+    assert all(0 <= row['error_minutes'] <= 0.5 for row in rows), [row['error_minutes'] for row in rows]
+    assert rows[0]['person'] == 'c00' and rows[0]['night'] == 'cassette-00-1'
+
+    # isolated confident misclassifications in deep sleep fire the alarm without smoothing and confirmation, not with them
+    spiky = perfect.copy()
+    spiky[(df['sleep_stage'] == '3').to_numpy() & (np.arange(len(df)) % 17 == 0)] = 0.95
+    unsmoothed = replay(df, spiky, 0.5, earliest_hours=3, confirm_epochs=1, enter_probability=0.5, leave_probability=0.5)[0]
+    assert replay_summary(unsmoothed)['false_trigger_rate'] > 0
+    assert replay_summary(replay(df, spiky, 0.5, earliest_hours=3)[0])['false_trigger_rate'] == 0
+    print(f"Wake alarm verified: forward filter, scheduler, {elapsed * 1e6:.2f} us per epoch, replay over {summary['windows']} windows")
@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+import argparse
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from preprocessing_functions import compute_power_bands, compute_power_bands_for_epochs
+from epoch_keys import EPOCH_KEY
+from synthetic import synthetic_night_df
+
+def legacy_compute_power_bands_for_epochs(df, sampling_frequency):
+    # per-epoch groupby path that compute_power_bands_for_epochs used before the batched engine
+    epochs = df.groupby(EPOCH_KEY)
+    power_bands_list = []
+
+    for epoch_id, epoch_df in epochs:
+        power_bands_anterior = compute_power_bands(epoch_df['eegAnterior'].values, sampling_frequency)
+        power_bands_posterior = compute_power_bands(epoch_df['eegPosterior'].values, sampling_frequency)
+        power_bands_list.append({
+            EPOCH_KEY: epoch_id,
+            **{f'anterior_{band}': power for band, power in power_bands_anterior.items()},
+            **{f'posterior_{band}': power for band, power in power_bands_posterior.items()}
+        })
+
+    return pd.DataFrame(power_bands_list)
+
+def best_of(function, repeats):
+    timings = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start_time)
+    return result, min(timings)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Band power throughput, legacy groupby path vs batched engine')
+    parser.add_argument('--hours', type=float, default=8.0)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    df = synthetic_night_df(args.hours)
+    sampling_frequency = 100.0
+    n_epochs = df[EPOCH_KEY].nunique()
+
+    legacy_df, legacy_time = best_of(lambda: legacy_compute_power_bands_for_epochs(df, sampling_frequency), args.repeats)
+    batched_df, batched_time = best_of(lambda: compute_power_bands_for_epochs(df, sampling_frequency), args.repeats)
+
+    pd.testing.assert_frame_equal(legacy_df, batched_df, check_exact=False, atol=1e-5, rtol=0)
+
+    print(f"Epochs: {n_epochs} ({args.hours} h, 2 channels)")
+    print(f"Legacy groupby: {legacy_time:.3f} s, {n_epochs / legacy_time:,.0f} epochs/s")
+    print(f"Batched engine: {batched_time:.3f} s, {n_epochs / batched_time:,.0f} epochs/s")
+    print(f"Speedup: {legacy_time / batched_time:.1f}x")
@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+import json
+import argparse
+import resource
+import tempfile
+import subprocess
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from epoch_keys import EPOCH_KEY
+
+def peak_rss_mb():
+    # VmHWM is reset by exec, unlike ru_maxrss which a child inherits from the process that spawned it
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure(loader, edf_file):
+    # runs in a fresh interpreter so the peak RSS only reflects this loader
+    from preprocessing_functions import process_edf_file, read_edf_signals, compute_power_bands_for_epochs, compute_power_bands_for_night
+    baseline_rss = peak_rss_mb()
+    start_time = time.perf_counter()
+    if loader == 'to_data_frame':
+        df, sampling_frequency = process_edf_file(edf_file)
+        features_df = compute_power_bands_for_epochs(df, sampling_frequency)
+    else:
+        features_df = compute_power_bands_for_night(*read_edf_signals(edf_file))
+    elapsed = time.perf_counter() - start_time
+    print(json.dumps({'loader': loader, 'seconds': elapsed, 'peak_rss_mb': peak_rss_mb(), 'baseline_rss_mb': baseline_rss, 'epochs': len(features_df)}))
+    features_df.to_pickle(f'{loader}.pkl')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Peak RSS and time of process_edf_file vs read_edf_signals for one night')
+    parser.add_argument('--edf-file', default='SC4001E0-PSG.edf', help='PSG file name under data/physionet')
+    parser.add_argument('--synthetic-hours', type=float, default=None, help='benchmark a synthetic night of this length instead')
+    parser.add_argument('--measure', choices=['to_data_frame', 'picks'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.edf_file)
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.synthetic_hours is not None:
+            from synthetic import write_synthetic_psg
+            os.makedirs(os.path.join(workdir, 'data', 'physionet', 'sleep-cassette'))
+            write_synthetic_psg(os.path.join(workdir, 'data', 'physionet', 'sleep-cassette', args.edf_file), args.synthetic_hours)
+            cwd = workdir
+        else:
+            cwd = os.getcwd()
+
+        results = {}
+        for loader in ('to_data_frame', 'picks'):
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--edf-file', args.edf_file, '--measure', loader], cwd=cwd, check=True, capture_output=True, text=True).stdout
+            results[loader] = json.loads(output.strip().splitlines()[-1])
+            results[loader]['features'] = __import__('pandas').read_pickle(os.path.join(cwd, f'{loader}.pkl'))
+            os.remove(os.path.join(cwd, f'{loader}.pkl'))
+
+    legacy, picks = results['to_data_frame'], results['picks']
+    max_difference = np.abs(legacy['features'].iloc[:, 1:].values - picks['features'].iloc[:, 1:].values).max()
+    assert (legacy['features'][EPOCH_KEY].values == picks['features'][EPOCH_KEY].values).all()
+
+    print(f"{'Loader':<16}{'Time (s)':>10}{'Peak RSS (MB)':>16}{'Above baseline (MB)':>22}")
+    for name, result in (('to_data_frame', legacy), ('picks/float32', picks)):
+        print(f"{name:<16}{result['seconds']:>10.2f}{result['peak_rss_mb']:>16.0f}{result['peak_rss_mb'] - result['baseline_rss_mb']:>22.0f}")
+    print(f"Epochs: {picks['epochs']}, max band power difference: {max_difference:.1e}")
@@ -0,0 +1,157 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, ROOT)
+from preprocessing_functions import process_edf_file, read_edf_signals, compute_power_bands_for_epochs, compute_power_bands_for_night, extract_annotations, generate_labels
+from dataset_storage import STORAGE_BACKENDS, save_dataset, load_dataset
+from signal_archive import SignalArchive
+from model_training import FEATURES, LABEL, init_fold_worker, run_fold
+from epoch_keys import EPOCH_KEY, factorize_persons
+from synthetic import write_synthetic_psg, write_synthetic_hypnogram
+
+STAGES = ['edf_load', 'band_power', 'labels', 'dataset_io', 'training']
+
+def profile(function, repeats):
+    # best and mean wall time over the repeats, then one extra run under tracemalloc for the peak allocation
+    # (tracemalloc slows allocation heavy code down, so it is kept out of the timed runs)
+    runs = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        result = function()
+        runs.append(time.perf_counter() - start_time)
+    tracemalloc.start()
+    function()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {'seconds': min(runs), 'mean_seconds': sum(runs) / len(runs), 'runs': runs, 'peak_memory_mb': peak_memory / 1e6}
+
+def write_synthetic_dataset(nights, hours):
+    # one night per subject so training has a leave-one-subject-out fold per night
+    directory = os.path.join('data', 'physionet', 'sleep-cassette')
+    os.makedirs(directory, exist_ok=True)
+    psg_files, hypnogram_files = [], []
+    for night in range(nights):
+        psg_files.append(f'SC4{night:02d}1E0-PSG.edf')
+        hypnogram_files.append(f'SC4{night:02d}1EC-Hypnogram.edf')
+        write_synthetic_psg(os.path.join(directory, psg_files[-1]), hours, seed=night)
+        write_synthetic_hypnogram(os.path.join(directory, hypnogram_files[-1]), hours, seed=night)
+    return psg_files, hypnogram_files
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(args):
+    psg_files, hypnogram_files = write_synthetic_dataset(args.nights, args.hours)
+    results = {}
+    night_frames = {}
+
+    if 'edf_load' in args.stages or 'band_power' in args.stages:
+        night_frames, results['edf_load.process_edf_file'] = profile(lambda: [process_edf_file(f) for f in psg_files], args.repeats)
+        night_signals, results['edf_load.read_edf_signals'] = profile(lambda: [read_edf_signals(f) for f in psg_files], args.repeats)
+        # one-time conversion, then every night is a memory-mapped slice (copied here so the read is actually timed)
+        archive = SignalArchive()
+        _, results['edf_load.signal_archive_convert'] = profile(lambda: archive.convert(psg_files, rebuild=True, progress=False), 1)
+        _, results['edf_load.signal_archive_read'] = profile(lambda: [np.array(archive.read_edf_signals(f)[0]) for f in psg_files], args.repeats)
+
+    if 'band_power' in args.stages:
+        _, results['band_power.compute_power_bands_for_epochs'] = profile(lambda: [compute_power_bands_for_epochs(df, sampling_frequency) for df, sampling_frequency in night_frames], args.repeats)
+        _, results['band_power.compute_power_bands_for_night'] = profile(lambda: [compute_power_bands_for_night(*signals) for signals in night_signals], args.repeats)
+        _, results['band_power.from_signal_archive'] = profile(lambda: [compute_power_bands_for_night(*archive.read_edf_signals(f)) for f in psg_files], args.repeats)
+    del night_frames
+
+    features_df = pd.concat([compute_power_bands_for_night(*read_edf_signals(f)) for f in psg_files], ignore_index=True)
+
+    annotations, results['labels.extract_annotations'] = profile(lambda: [extract_annotations(f) for f in hypnogram_files], args.repeats)
+    labels, results['labels.generate_labels'] = profile(lambda: [generate_labels(*night) for night in annotations], args.repeats)
+    labelled_df = features_df.merge(pd.concat(labels, ignore_index=True), on=EPOCH_KEY, how='left')
+    labelled_df['sleep_stage'] = labelled_df['sleep_stage'].fillna('N')
+
+    if 'dataset_io' in args.stages:
+        for storage_format in args.formats:
+            _, results[f'dataset_io.save.{storage_format}'] = profile(lambda: save_dataset(labelled_df, 'benchmark_dataset', storage_format), args.repeats)
+            _, results[f'dataset_io.load.{storage_format}'] = profile(lambda: load_dataset('benchmark_dataset', storage_format=storage_format), args.repeats)
+            _, results[f'dataset_io.load_columns.{storage_format}'] = profile(lambda: load_dataset('benchmark_dataset', columns=[EPOCH_KEY, *FEATURES, LABEL], storage_format=storage_format), args.repeats)
+
+    if 'training' in args.stages:
+        # the folds of train_model's cross validation, timed one by one in this process
+        train_df = labelled_df[~labelled_df['sleep_stage'].isin(['N', '?', 'M'])]
+        X = train_df[FEATURES].to_numpy()
+        y = train_df[LABEL].isin(['1', '2']).to_numpy(dtype=int)
+        person_codes, persons = factorize_persons(train_df[EPOCH_KEY])
+        init_fold_worker(X, y, args.threads)
+        for code, person in enumerate(persons):
+            _, results[f'training.fold.{person}'] = profile(lambda: run_fold(np.flatnonzero(person_codes == code)), args.repeats)
+        fold_seconds = [result['seconds'] for stage, result in results.items() if stage.startswith('training.fold.')]
+        results['training.fold_mean'] = {'seconds': sum(fold_seconds) / len(fold_seconds), 'folds': len(fold_seconds), 'rows': len(y)}
+
+    return results, len(features_df)
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')})")
+    if baseline['parameters'] != results['parameters']:
+        print(f"Warning: baseline ran with {baseline['parameters']}, this run with {results['parameters']}")
+    print(f"{'Stage':<48}{'Baseline (s)':>14}{'Now (s)':>10}{'Ratio':>8}")
+    for stage, result in results['stages'].items():
+        if stage in baseline['stages']:
+            before = baseline['stages'][stage]['seconds']
+            print(f"{stage:<48}{before:>14.4f}{result['seconds']:>10.4f}{result['seconds'] / before:>8.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time and memory of every preprocessing and training stage on synthetic Sleep-EDF shaped nights')
+    parser.add_argument('--nights', type=int, default=3, help='synthetic nights, one subject each')
+    parser.add_argument('--hours', type=float, default=2.0, help='length of every synthetic night')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help='labelling always runs, the other stages need it')
+    parser.add_argument('--formats', nargs='+', choices=list(STORAGE_BACKENDS), default=list(STORAGE_BACKENDS))
+    parser.add_argument('--threads', type=int, default=None, help='xgboost threads per fold, all cores by default')
+    parser.add_argument('--output', default=None, help='write the results as JSON to this file')
+    parser.add_argument('--compare', default=None, help='JSON results of an earlier run to compare against')
+    args = parser.parse_args()
+
+    # the synthetic files live in a scratch data/physionet so nothing under the real one is touched
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            stage_results, epochs = run_benchmarks(args)
+        finally:
+            os.chdir(cwd)
+
+    results = {
+        'commit': git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'parameters': {'nights': args.nights, 'hours': args.hours, 'repeats': args.repeats, 'threads': args.threads, 'epochs': epochs},
+        'stages': stage_results
+    }
+
+    print(f"{args.nights} synthetic nights of {args.hours} h ({epochs} epochs), best of {args.repeats}")
+    print(f"{'Stage':<48}{'Time (s)':>10}{'Peak alloc (MB)':>17}")
+    for stage, result in stage_results.items():
+        peak_memory = f"{result['peak_memory_mb']:>17.1f}" if 'peak_memory_mb' in result else ''
+        print(f"{stage:<48}{result['seconds']:>10.4f}{peak_memory}")
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+        print(f"Results written to {args.output}")
+    if args.compare is not None:
+        compare(results, args.compare)
@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import numpy as np
+import xgboost as xgb
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from preprocessing_functions import compute_power_bands_for_night
+from model_training import FEATURES, MODEL_PARAMS
+from streaming_inference import StreamingSleepStager
+from synthetic import synthetic_signals
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Per-epoch latency and memory of the streaming sleep stager')
+    parser.add_argument('--hours', type=float, default=8.0)
+    parser.add_argument('--chunk-seconds', type=float, default=0.25, help='size of each pushed chunk')
+    parser.add_argument('--hop-seconds', type=float, default=30.0)
+    args = parser.parse_args()
+
+    sampling_frequency = 100.0
+    signals = synthetic_signals(args.hours, sampling_frequency)
+    features_df = compute_power_bands_for_night(signals, sampling_frequency, 'cassette', '00', '1')
+
+    # any fitted model will do for timing, this one is trained on the synthetic night's own features
+    model = xgb.XGBClassifier(**MODEL_PARAMS)
+    model.fit(features_df[FEATURES].to_numpy(), (features_df['anterior_delta'] > features_df['anterior_delta'].median()).astype(int))
+
+    stager = StreamingSleepStager(model, sampling_frequency, hop_seconds=args.hop_seconds, features=FEATURES)
+    chunk_samples = int(args.chunk_seconds * sampling_frequency)
+    epochs = []
+    epoch_latencies = []
+    chunk_latencies = []
+
+    tracemalloc.start()
+    for start in range(0, signals.shape[1], chunk_samples):
+        start_time = time.perf_counter()
+        emitted = stager.push(signals[:, start:start + chunk_samples])
+        elapsed = time.perf_counter() - start_time
+        if emitted:
+            epoch_latencies.append(elapsed / len(emitted))
+            epochs.extend(emitted)
+        else:
+            chunk_latencies.append(elapsed)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if args.hop_seconds == 30.0:
+        streamed = np.array([[epoch['features'][feature] for feature in FEATURES] for epoch in epochs])
+        batch = features_df[FEATURES].to_numpy()[:len(streamed)]
+        assert len(streamed) == signals.shape[1] // 3000
+        assert np.allclose(streamed, batch, atol=1e-5), 'streamed features differ from compute_power_bands_for_night'
+
+    epoch_latencies = np.array(epoch_latencies) * 1e3
+    print(f"Epochs emitted: {len(epochs)} ({args.hours} h, {args.chunk_seconds} s chunks, {args.hop_seconds} s hop)")
+    print(f"Per-epoch latency (ms): p50 {np.percentile(epoch_latencies, 50):.3f}, p95 {np.percentile(epoch_latencies, 95):.3f}, p99 {np.percentile(epoch_latencies, 99):.3f}, max {epoch_latencies.max():.3f}")
+    print(f"Chunk without epoch (ms): p50 {np.percentile(chunk_latencies, 50) * 1e3:.4f}")
+    print(f"Ring buffer: {stager.buffer.buffer.nbytes / 1e3:.0f} kB, peak traced allocation during stream: {peak_memory / 1e6:.2f} MB")
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+from epoch_keys import EPOCH_KEY, pack_epoch_keys
+
+def synthetic_signals(hours, sampling_frequency=100, channels=2, seed=0):
+    # pink-ish noise plus a few band-limited oscillations, shaped like the Sleep-EDF EEG channels (in volts)
+    rng = np.random.default_rng(seed)
+    n_samples = int(hours * 3600 * sampling_frequency)
+    t = np.arange(n_samples) / sampling_frequency
+    signals = np.empty((channels, n_samples), dtype=np.float32)
+    for channel in range(channels):
+        noise = np.cumsum(rng.standard_normal(n_samples)) * 0.02
+        noise -= np.convolve(noise, np.ones(101) / 101, mode='same')
+        oscillations = sum(np.sin(2 * np.pi * f * t + rng.uniform(0, 2 * np.pi)) * a for f, a in ((1.5, 2.0), (6.0, 1.0), (10.0, 0.7), (20.0, 0.3)))
+        signals[channel] = (noise + oscillations + rng.standard_normal(n_samples) * 0.2) * 1e-5
+    return signals
+
+def synthetic_night_df(hours, sampling_frequency=100, data_type='cassette', subject_number='00', night_number='1', seed=0):
+    # same layout as the dataframe returned by process_edf_file
+    signals = synthetic_signals(hours, sampling_frequency, seed=seed)
+    df = pd.DataFrame({
+        'time': np.arange(signals.shape[1]) / sampling_frequency,
+        'eegAnterior': signals[0].astype(np.float64) * 1e6,
+        'eegPosterior': signals[1].astype(np.float64) * 1e6
+    })
+    for column, value in (('type', data_type), ('subject', subject_number), ('night', night_number)):
+        df[column] = pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), [value])
+    df['epochNum'] = ((df['time'] - df['time'][0]) // 30).astype(int)
+    df[EPOCH_KEY] = pack_epoch_keys(data_type, subject_number, night_number, df['epochNum'].to_numpy())
+    return df
+
+def write_edf(path, signals, sampling_frequency, channel_names, record_seconds=30):
+    # minimal EDF writer (16-bit samples, one physical range per channel) so benchmarks run without the PhysioNet files
+    signals = np.asarray(signals, dtype=np.float64) * 1e6  # volts to uV, the unit used by Sleep-EDF
+    samples_per_record = int(record_seconds * sampling_frequency)
+    n_records = signals.shape[1] // samples_per_record
+    signals = signals[:, :n_records * samples_per_record]
+    n_signals = len(channel_names)
+
+    def field(value, width):
+        return str(value)[:width].ljust(width).encode('ascii')
+
+    physical_min = np.floor(signals.min(axis=1)) - 1
+    physical_max = np.ceil(signals.max(axis=1)) + 1
+    digital = np.round((signals - physical_min[:, None]) / (physical_max - physical_min)[:, None] * 65535 - 32768).astype('<i2')
+
+    header = b''.join([
+        field(0, 8), field('X X X X', 80), field('Startdate X X X X', 80), field('01.01.89', 8), field('00.00.00', 8),
+        field(256 * (n_signals + 1), 8), field('', 44), field(n_records, 8), field(record_seconds, 8), field(n_signals, 4)
+    ])
+    header += b''.join(field(name, 16) for name in channel_names)
+    header += b''.join(field('', 80) for _ in channel_names)
+    header += b''.join(field('uV', 8) for _ in channel_names)
+    header += b''.join(field(f'{value:g}', 8) for value in physical_min)
+    header += b''.join(field(f'{value:g}', 8) for value in physical_max)
+    header += b''.join(field(-32768, 8) for _ in channel_names)
+    header += b''.join(field(32767, 8) for _ in channel_names)
+    header += b''.join(field('', 80) for _ in channel_names)
+    header += b''.join(field(samples_per_record, 8) for _ in channel_names)
+    header += b''.join(field('', 32) for _ in channel_names)
+
+    records = digital.reshape(n_signals, n_records, samples_per_record).transpose(1, 0, 2)
+    with open(path, 'wb') as edf:
+        edf.write(header)
+        edf.write(records.tobytes())
+
+def write_synthetic_psg(path, hours, sampling_frequency=100, seed=0):
+    # four channel PSG-shaped EDF, the two EEG channels plus two that feature extraction should skip
+    eeg = synthetic_signals(hours, sampling_frequency, seed=seed)
+    signals = np.vstack([eeg, eeg[:1] * 3, eeg[1:] * 0.5])
+    write_edf(path, signals, sampling_frequency, ['EEG Fpz-Cz', 'EEG Pz-Oz', 'EOG horizontal', 'EMG submental'])
+
+def synthetic_stages(hours, seed=0):
+    # one sleep stage per 30 s epoch from a sticky random walk over the Sleep-EDF stage names
+    rng = np.random.default_rng(seed)
+    stages = ['W', '1', '2', '3', '4', 'R']
+    current = 0
+    epochs = []
+    for _ in range(int(hours * 120)):
+        if rng.random() < 0.1:
+            current = int(np.clip(current + rng.choice([-1, 1]), 0, len(stages) - 1))
+        epochs.append(stages[current])
+    return epochs
+
+def write_synthetic_hypnogram(path, hours, seed=0):
+    # EDF+ annotation file laid out like the Sleep-EDF Hypnograms, runs of equal stages become one annotation
+    epochs = synthetic_stages(hours, seed=seed)
+    annotations = []
+    onset = 0
+    for i, stage in enumerate(epochs):
+        if i + 1 == len(epochs) or epochs[i + 1] != stage:
+            end = (i + 1) * 30
+            annotations.append((onset, end - onset, f'Sleep stage {stage}'))
+            onset = end
+    annotations.append((onset, 30, 'Sleep stage ?'))
+
+    tals = b'+0\x14\x14\x00' + b''.join(f'+{onset}\x15{duration}\x14{description}\x14\x00'.encode('ascii') for onset, duration, description in annotations)
+    tals += b'\x00' * (len(tals) % 2)
+
+    def field(value, width):
+        return str(value)[:width].ljust(width).encode('ascii')
+
+    header = b''.join([
+        field(0, 8), field('X X X X', 80), field('Startdate X X X X', 80), field('01.01.89', 8), field('00.00.00', 8),
+        field(512, 8), field('EDF+C', 44), field(1, 8), field(0, 8), field(1, 4),
+        field('EDF Annotations', 16), field('', 80), field('', 8), field(0, 8), field(1, 8),
+        field(-32768, 8), field(32767, 8), field('', 80), field(len(tals) // 2, 8), field('', 32)
+    ])
+    with open(path, 'wb') as edf:
+        edf.write(header)
+        edf.write(tals)
@@ -0,0 +1,92 @@
+import os
+import sys
+import time
+import json
+import argparse
+import resource
+import tempfile
+import subprocess
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, ROOT)
+
+def peak_rss_mb():
+    # VmHWM is reset by exec, unlike ru_maxrss which a child inherits from the process that spawned it
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure(evaluator, bundle, calls, batch_size):
+    # runs in a fresh interpreter so import time and peak RSS only reflect this evaluator
+    baseline_rss = peak_rss_mb()
+    start_time = time.perf_counter()
+    from model_bundle import load_model_bundle
+    predictor = load_model_bundle(bundle, evaluator=evaluator)
+    load_seconds = time.perf_counter() - start_time
+
+    X = np.random.default_rng(0).dirichlet(np.ones(len(predictor.features)), size=max(calls, batch_size)).astype(np.float32)
+    single = []
+    for i in range(calls):
+        start_time = time.perf_counter()
+        predictor.predict_proba(X[i:i + 1])
+        single.append(time.perf_counter() - start_time)
+    batched = []
+    for _ in range(10):
+        start_time = time.perf_counter()
+        probabilities = predictor.predict_proba(X[:batch_size])
+        batched.append(time.perf_counter() - start_time)
+
+    np.save(f'{evaluator}.npy', probabilities)
+    print(json.dumps({
+        'evaluator': evaluator,
+        'load_seconds': load_seconds,
+        'single_ms': [float(np.percentile(single, q)) * 1e3 for q in (50, 95, 99)],
+        'batch_ms_per_epoch': min(batched) * 1e3 / batch_size,
+        'peak_rss_mb': peak_rss_mb(),
+        'baseline_rss_mb': baseline_rss,
+        'xgboost_imported': 'xgboost' in sys.modules
+    }))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Import time, memory and per-epoch latency of the numpy tree evaluator vs the xgboost booster')
+    parser.add_argument('--bundle', default=None, help='model bundle to score with, a synthetic one trained with MODEL_PARAMS by default')
+    parser.add_argument('--calls', type=int, default=2000, help='single-epoch predictions, like the alarm scoring one epoch every 30 s')
+    parser.add_argument('--batch-size', type=int, default=256, help='epochs per batched prediction, like the server micro-batcher')
+    parser.add_argument('--measure', choices=['numpy', 'xgboost'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.bundle, args.calls, args.batch_size)
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        bundle = args.bundle
+        if bundle is None:
+            import xgboost as xgb
+            from model_training import FEATURES, MODEL_PARAMS
+            from model_bundle import save_model_bundle
+            rng = np.random.default_rng(1)
+            X = rng.dirichlet(np.ones(len(FEATURES)), size=20000).astype(np.float32)
+            y = ((X[:, 1] - X[:, 4] + rng.normal(0, 0.1, len(X))) > 0).astype(int)
+            bundle = save_model_bundle(xgb.XGBClassifier(**MODEL_PARAMS).fit(X, y), FEATURES, model_params=MODEL_PARAMS, path=os.path.join(workdir, 'bundle'))
+
+        results = {}
+        for evaluator in ('xgboost', 'numpy'):
+            command = [sys.executable, os.path.abspath(__file__), '--bundle', os.path.abspath(bundle), '--calls', str(args.calls), '--batch-size', str(args.batch_size), '--measure', evaluator]
+            output = subprocess.run(command, cwd=workdir, check=True, capture_output=True, text=True).stdout
+            results[evaluator] = json.loads(output.strip().splitlines()[-1])
+            results[evaluator]['probabilities'] = np.load(os.path.join(workdir, f'{evaluator}.npy'))
+
+    difference = np.abs(results['numpy']['probabilities'] - results['xgboost']['probabilities']).max()
+    assert difference < 1e-5, f'numpy evaluator differs from xgboost by {difference}'
+    assert not results['numpy']['xgboost_imported']
+
+    print(f"{'Evaluator':<10}{'Import+load (s)':>16}{'Peak RSS (MB)':>15}{'1 epoch p50/p95/p99 (ms)':>28}{f'Batch {args.batch_size} (us/epoch)':>22}")
+    for evaluator, result in results.items():
+        single = '/'.join(f'{latency:.3f}' for latency in result['single_ms'])
+        print(f"{evaluator:<10}{result['load_seconds']:>16.3f}{result['peak_rss_mb']:>15.0f}{single:>28}{result['batch_ms_per_epoch'] * 1e3:>22.2f}")
+    print(f"Max probability difference: {difference:.1e}")
@@ -0,0 +1,58 @@
+import os
+import sys
+import numpy as np
+from scipy.signal import welch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+from preprocessing_functions import compute_power_bands, compute_power_bands_for_night
+from feature_sets import FeatureSet, POWER_BANDS, PSD_METHODS, get_feature_set
+from epoch_keys import EPOCH_KEY, format_epoch_ids
+from synthetic import synthetic_signals
+
+def legacy_night_features(signals, sampling_frequency):
+    # one compute_power_bands call per channel and 30 s epoch, the original definition of the power_bands set
+    columns = {}
+    for prefix, signal in zip(('anterior', 'posterior'), signals.astype(np.float64)):
+        epochs = [compute_power_bands(signal[start:start + 3000], sampling_frequency) for start in range(0, len(signal), 3000)]
+        columns.update({f'{prefix}_{band}': np.array([epoch[band] for epoch in epochs]) for band in POWER_BANDS})
+    return columns
+
+if __name__ == "__main__":
+    sampling_frequency = 100.0
+    signals = (synthetic_signals(2, sampling_frequency, seed=3) * 1e6).astype(np.float32)[:, :-1234] # uV, truncated last epoch
+
+    # the default set reproduces compute_power_bands exactly, including the truncated last epoch
+    expected = legacy_night_features(signals, sampling_frequency)
+    features_df = compute_power_bands_for_night(signals, sampling_frequency, 'cassette', '00', '1')
+    for column, values in expected.items():
+        assert np.array_equal(features_df[column].to_numpy(), values), f'power_bands: {column} differs from compute_power_bands'
+
+    # absolute band powers add up to the mean square of the epoch and welch matches scipy's band powers
+    for psd in PSD_METHODS:
+        feature_set = FeatureSet('test', 1, psd=psd, absolute=True, ratios=[('theta', 'delta')])
+        columns = feature_set.extract(signals, sampling_frequency)
+        assert list(columns) == feature_set.columns()
+        for i, prefix in enumerate(feature_set.channels):
+            mean_square = np.mean(signals[i, :3000].astype(np.float64)**2)
+            total = sum(columns[f'{prefix}_{band}_abs'][0] for band in POWER_BANDS)
+            assert abs(total / mean_square - 1) < 0.02, f'{psd}: absolute power {total} does not add up to {mean_square}'
+            assert np.allclose(sum(columns[f'{prefix}_{band}'] for band in POWER_BANDS), 1)
+            assert np.allclose(columns[f'{prefix}_theta_delta'], columns[f'{prefix}_theta_abs'] / columns[f'{prefix}_delta_abs'])
+
+        if psd == 'welch':
+            freqs, density = welch(signals[0, :3000].astype(np.float64), fs=sampling_frequency, nperseg=400, noverlap=200, detrend=False)
+            for band, (low, high) in POWER_BANDS.items():
+                mask = (freqs >= low) & ((freqs < high) if high is not None else True)
+                assert np.isclose(columns[f'anterior_{band}_abs'][0], density[mask].sum() * (freqs[1] - freqs[0])), f'welch: {band} differs from scipy'
+
+    # sliding epochs: every full window at the hop, labelled with the 30 s epoch of its centre
+    feature_set = FeatureSet('sliding', 1, hop_seconds=10)
+    features_df = compute_power_bands_for_night(signals, sampling_frequency, 'cassette', '00', '1', feature_set=feature_set)
+    assert len(features_df) == (signals.shape[1] - 3000) // 1000 + 1
+    assert format_epoch_ids(features_df[EPOCH_KEY].iloc[:4]).tolist() == ['cassette-00-1-0000', 'cassette-00-1-0000', 'cassette-00-1-0001', 'cassette-00-1-0001']
+    window = compute_power_bands(signals[0, 7000:10000].astype(np.float64), sampling_frequency)
+    assert np.allclose([features_df[f'anterior_{band}'].iloc[7] for band in POWER_BANDS], list(window.values()), atol=1e-5)
+
+    assert FeatureSet.from_parameters(get_feature_set('spectrum').parameters()).parameters() == get_feature_set('spectrum').parameters()
+    print(f"Feature sets verified on {signals.shape[1] / sampling_frequency / 3600:.2f} h of synthetic EEG ({', '.join(PSD_METHODS)})")
@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'testing', 'benchmarks'))
+from preprocessing_functions import physionet_files, read_edf_signals, preprocess_features
+from signal_archive import SignalArchive
+from feature_sets import FeatureSet, EEG_CHANNELS
+from synthetic import write_synthetic_psg
+
+if __name__ == "__main__":
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            for data_type, prefix in (('cassette', 'SC4'), ('telemetry', 'ST7')):
+                os.makedirs(os.path.join('data', 'physionet', f'sleep-{data_type}'))
+                for night in range(2):
+                    write_synthetic_psg(os.path.join('data', 'physionet', f'sleep-{data_type}', f'{prefix}{night:02d}1E0-PSG.edf'), 0.4 + 0.1 * night, seed=night)
+
+            archive = SignalArchive()
+            assert archive.convert(physionet_files(), progress=False) == 4
+            assert SignalArchive().convert(physionet_files(), progress=False) == 0, 'unchanged nights were archived again'
+
+            # the archive holds exactly what read_edf_signals decodes, and reads are views of the memory map
+            archive = SignalArchive()
+            for edf_file in physionet_files():
+                expected = read_edf_signals(edf_file)
+                archived = archive.read_edf_signals(edf_file)
+                assert np.array_equal(expected[0], archived[0]) and expected[1:] == archived[1:], f'{edf_file}: archived signals differ'
+                assert np.shares_memory(archived[0], archive.memmap())
+            epochs, _ = archive.read_epochs('SC4011E0-PSG.edf', 10, 12)
+            assert epochs.shape == (2, 6000) and np.array_equal(epochs, read_edf_signals('SC4011E0-PSG.edf')[0][:, 30000:36000])
+            posterior, _ = archive.read_signals('ST7001E0-PSG.edf', channels={'posterior': EEG_CHANNELS['posterior']})
+            assert np.array_equal(posterior[0], read_edf_signals('ST7001E0-PSG.edf')[0][1])
+            assert archive.nights(types=['telemetry'], subjects=['01']) == ['ST7011E0-PSG.edf']
+
+            # features from the archive are identical to the ones decoded from the EDFs, with and without workers
+            feature_set = FeatureSet('archive_test', 1, psd='welch', absolute=True)
+            from_edf = preprocess_features(True, False, cache=False, feature_set=feature_set)
+            for workers in (1, 2):
+                from_archive = preprocess_features(True, False, workers=workers, feature_set=feature_set, archive=archive.directory)
+                pd.testing.assert_frame_equal(from_edf, from_archive, check_exact=True)
+
+            # a changed EDF is appended again and its index entry moves to the new block
+            offset = archive.index['nights']['SC4001E0-PSG.edf']['offset']
+            write_synthetic_psg(os.path.join('data', 'physionet', 'sleep-cassette', 'SC4001E0-PSG.edf'), 0.4, seed=9)
+            assert archive.convert(physionet_files(), progress=False) == 1
+            assert archive.index['nights']['SC4001E0-PSG.edf']['offset'] > offset
+            assert np.array_equal(archive.read_edf_signals('SC4001E0-PSG.edf')[0], read_edf_signals('SC4001E0-PSG.edf')[0])
+            size = os.path.getsize(archive.signals_path)
+            archive.convert(physionet_files(), rebuild=True, progress=False)
+            assert os.path.getsize(archive.signals_path) < size
+        finally:
+            os.chdir(cwd)
+    print('Signal archive verified: identical signals and features, memory-mapped views, incremental and rebuilt conversion')
@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'testing', 'benchmarks'))
+from preprocessing_functions import process_night_features, process_night_labels, label_epochs
+from dataset_ingest import NightDataset, physionet_nights
+from feature_sets import FeatureSet
+from epoch_keys import EPOCH_KEY
+from synthetic import write_synthetic_psg, write_synthetic_hypnogram
+
+if __name__ == "__main__":
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            directory = os.path.join('data', 'physionet', 'sleep-cassette')
+            os.makedirs(directory)
+            for night in range(2):
+                write_synthetic_psg(os.path.join(directory, f'SC4{night:02d}1E0-PSG.edf'), 0.5, seed=night)
+                write_synthetic_hypnogram(os.path.join(directory, f'SC4{night:02d}1EC-Hypnogram.edf'), 0.5, seed=night)
+
+            # every night matches what the full preprocessing run produces for it
+            dataset = NightDataset()
+            pairs = physionet_nights()
+            assert [dataset.ingest(*pair)[0] for pair in pairs] == ['added', 'added']
+            for psg_path, hypnogram_path in pairs:
+                psg_file, hypnogram_file = os.path.basename(psg_path), os.path.basename(hypnogram_path)
+                expected = label_epochs(process_night_features(psg_file), process_night_labels(hypnogram_file))
+                ingested = NightDataset().load(subjects=[psg_file[3:5]])
+                assert ingested.equals(expected), f'{psg_file}: ingested night differs from preprocess_labels'
+
+            # ingesting again is a no-op, also after a touch; a changed hypnogram re-ingests only its night
+            os.utime(pairs[0][0], ns=(time.time_ns(), time.time_ns() + 10**9))
+            assert [NightDataset().ingest(*pair)[0] for pair in pairs] == ['unchanged', 'unchanged']
+            write_synthetic_hypnogram(pairs[1][1], 0.5, seed=5)
+            assert [NightDataset().ingest(*pair)[0] for pair in pairs] == ['unchanged', 'updated']
+
+            # a recording of our own without labels, next to the physionet nights but left out of labelled selections
+            shutil.copy(pairs[0][0], 'headband.edf')
+            status, entry = NightDataset(storage_format='parquet').ingest('headband.edf', data_type='headband', subject_number='1', night_number='3')
+            assert status == 'added' and not entry['labelled'] and entry['stages'] == {'N': entry['rows']}
+            dataset = NightDataset()
+            assert dataset.select(labelled=True) == ['cassette-00-1', 'cassette-01-1']
+            assert dataset.select(types=['headband']) == ['headband-01-3']
+            assert len(dataset.load(columns=[EPOCH_KEY, 'sleep_stage'])) == sum(entry['rows'] for entry in dataset.manifest['nights'].values())
+
+            # a new version of the feature set makes the nights stale until they are ingested again
+            other = NightDataset(feature_set=FeatureSet('power_bands', 2, decimals=4))
+            assert other.stale() == ['cassette-00-1', 'cassette-01-1', 'headband-01-3']
+            try:
+                other.load()
+                raise AssertionError('stale nights were loaded')
+            except ValueError:
+                pass
+
+            dataset.remove('headband-01-3')
+            assert not os.path.exists(os.path.join(dataset.directory, entry['path'])) and dataset.select() == ['cassette-00-1', 'cassette-01-1']
+
+            # unknown night ids and half given recording ids are refused with the valid choices, nothing is touched
+            for attempt in (lambda: dataset.remove('headband-01-3'), lambda: dataset.ingest('headband.edf', data_type='headband')):
+                try:
+                    attempt()
+                    raise AssertionError('an invalid night was accepted')
+                except ValueError as error:
+                    assert 'cassette-00-1' in str(error) or 'together' in str(error), error
+            assert dataset.select() == ['cassette-00-1', 'cassette-01-1']
+        finally:
+            os.chdir(cwd)
+    print('Night ingestion verified: matches the full preprocessing, idempotent, manifest selections and stale detection')
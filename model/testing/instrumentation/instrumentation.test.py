@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import tempfile
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import instrumentation
+from instrumentation import span, traced, count, observe
+
+@traced('test.work')
+def work(n):
+    with span('test.inner', size='small' if n < 100 else 'large'):
+        count('test.items', n)
+        return sum(range(n))
+
+def per_call_seconds(function, calls=200000):
+    start_time = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - start_time) / calls
+
+def disabled_span():
+    with span('test.disabled', cmd='push'):
+        pass
+
+if __name__ == "__main__":
+    # disabled, a span costs a function call and count()/observe() a single check
+    assert not instrumentation.enabled()
+    overhead = per_call_seconds(disabled_span) - per_call_seconds(lambda: None)
+    assert overhead < 1e-6, f'disabled span costs {overhead * 1e9:.0f} ns'
+    assert per_call_seconds(lambda: count('test.disabled')) < 1e-6
+    assert work(10) == 45 and instrumentation.snapshot() == {'counters': [], 'histograms': []}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        trace, metrics = os.path.join(workdir, 'trace.jsonl'), os.path.join(workdir, 'metrics.prom')
+        instrumentation.configure(trace=trace, metrics=metrics, profile=['test.work'], profile_every=2, profile_dir=workdir)
+        assert os.environ['ALAREM_TRACE'] == trace
+
+        for n in (10, 20, 1000):
+            work(n)
+        observe('test.latency', 0.003, cmd='push')
+        try:
+            with span('test.failing'):
+                raise ValueError('failed')
+        except ValueError:
+            pass
+
+        # pool workers start empty and report their spans and counters through the trace when they exit
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            assert list(executor.map(work, [10] * 6)) == [45] * 6
+        instrumentation.flush()
+
+        spans, counters, events = instrumentation.summarize([trace])
+        assert spans['test.work']['count'] == 9 and spans['test.inner{size="small"}']['count'] == 8 and spans['test.inner{size="large"}']['count'] == 1
+        assert counters['test.items'] == 10 + 20 + 1000 + 6 * 10, counters
+        assert counters['span_errors{span="test.failing"}'] == 1
+        assert len({event['pid'] for event in events}) >= 2
+        assert all(event['ph'] == 'X' and event['dur'] >= 0 for event in events)
+
+        # the metrics file only has this process's metrics, buckets are cumulative
+        with open(metrics) as f:
+            text = f.read()
+        assert 'alarem_test_items_total 1030' in text
+        assert 'alarem_test_latency_seconds_bucket{cmd="push",le="0.0025"} 0' in text and 'alarem_test_latency_seconds_bucket{cmd="push",le="0.005"} 1' in text
+        assert 'alarem_test_work_seconds_count 3' in text and 'alarem_test_work_seconds_bucket{le="+Inf"} 3' in text
+
+        # every profile_every-th run of a profiled span is sampled into one cProfile per span and process
+        assert os.path.exists(os.path.join(workdir, f'test.work.{os.getpid()}.prof'))
+        import pstats
+        assert any(function[2] == 'work' for function in pstats.Stats(os.path.join(workdir, f'test.work.{os.getpid()}.prof')).stats)
+
+        server = instrumentation.start_metrics_server(0)
+        with urllib.request.urlopen(f'http://localhost:{server.server_address[1]}/metrics') as response:
+            assert response.status == 200 and 'alarem_test_items_total 1030' in response.read().decode()
+        server.shutdown()
+        instrumentation.configure()
+
+    print(f'Instrumentation verified: {overhead * 1e9:.0f} ns per disabled span, worker traces merged, Prometheus text and endpoint, sampled profiles')
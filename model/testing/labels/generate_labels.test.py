@@ -0,0 +1,75 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from preprocessing_functions import edf_file_info, extract_annotations, generate_labels
+from epoch_keys import EPOCH_KEY, format_epoch_ids, with_epoch_ids
+import mne
+
+def legacy_extract_annotations(edfp_file):
+    path, data_type, subject_number, night_number = edf_file_info(edfp_file)
+    raw = mne.read_annotations(path)
+
+    annotations_df = pd.DataFrame({
+        "onset": raw.onset,
+        "duration": raw.duration,
+        "end": raw.onset + raw.duration,
+        "sleep_stage": raw.description
+    })
+    annotations_df['sleep_stage'] = annotations_df['sleep_stage'].apply(lambda x: 'M' if x == 'Movement time' else x.split(' ')[-1])
+    annotations_df['epochId'] = annotations_df.apply(lambda row: f"{data_type}-{subject_number}-{night_number}-{int(row['onset'] // 30):04d}", axis=1)
+
+    return annotations_df, data_type, subject_number, night_number
+
+def legacy_generate_labels(annotations_df, data_type, subject_number, night_number):
+    # the per-epoch boolean mask scan generate_labels used before searchsorted
+    labels_list = []
+    epochs = int((annotations_df.iloc[-1]['onset'] + annotations_df.iloc[-1]['duration']) // 30)
+
+    for epoch in range(epochs):
+        min_timestamp = epoch * 30
+        max_timestamp = (epoch + 1) * 30
+        epoch_id = f"{data_type}-{subject_number}-{night_number}-{epoch:04d}"
+        interval_epoch_annotations = annotations_df[(annotations_df['onset'] < max_timestamp) & (annotations_df['end'] > min_timestamp)]
+        if len(interval_epoch_annotations) == 0:
+            sleep_stage = 'N'
+        elif len(interval_epoch_annotations) == 1:
+            sleep_stage = interval_epoch_annotations.iloc[0]['sleep_stage']
+        else:
+            sleep_stage = 'T'
+        labels_list.append({'epochId': epoch_id, 'sleep_stage': sleep_stage})
+
+    return pd.DataFrame(labels_list)
+
+def assert_same_labels(annotations_df, data_type, subject_number, night_number, name):
+    expected = legacy_generate_labels(annotations_df, data_type, subject_number, night_number)
+    actual = generate_labels(annotations_df, data_type, subject_number, night_number)
+    assert expected['epochId'].tolist() == format_epoch_ids(actual[EPOCH_KEY]).tolist(), f'{name}: epoch ids differ'
+    assert expected['sleep_stage'].tolist() == actual['sleep_stage'].tolist(), f'{name}: labels differ'
+    return expected
+
+if __name__ == "__main__":
+    hypnogram_files = []
+    for data_type in ('cassette', 'telemetry'):
+        hypnogram_files.extend(sorted(f for f in os.listdir(os.path.join('data', 'physionet', f'sleep-{data_type}')) if 'Hypnogram' in f))
+
+    counts = pd.Series(dtype=int)
+    for hypnogram_file in hypnogram_files:
+        annotations = extract_annotations(hypnogram_file)
+        legacy_annotations = legacy_extract_annotations(hypnogram_file)
+        pd.testing.assert_frame_equal(legacy_annotations[0], with_epoch_ids(annotations[0]), check_dtype=False)
+        labels_df = assert_same_labels(*annotations, hypnogram_file)
+        counts = counts.add(labels_df['sleep_stage'].value_counts(), fill_value=0)
+
+    # overlapping, zero length and gapped annotations exercise the fallback paths
+    rng = np.random.default_rng(0)
+    for trial in range(200):
+        onsets = np.sort(rng.choice(np.arange(0, 3000, 5), size=rng.integers(1, 40), replace=False)).astype(float)
+        durations = rng.choice([0, 10, 30, 45, 60, 300], size=len(onsets)).astype(float)
+        annotations_df = pd.DataFrame({'onset': onsets, 'duration': durations, 'end': onsets + durations, 'sleep_stage': rng.choice(list('W123R'), size=len(onsets))})
+        assert_same_labels(annotations_df, 'cassette', '00', '1', f'synthetic annotations {trial}')
+
+    print(f"Identical labels for {len(hypnogram_files)} Hypnogram files and 200 synthetic annotation sets")
+    print(counts.astype(int).sort_index().to_string())
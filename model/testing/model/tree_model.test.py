@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+import subprocess
+import numpy as np
+import xgboost as xgb
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, ROOT)
+from tree_model import TreeEnsemble
+from model_bundle import save_model_bundle, load_model_bundle
+
+def synthetic_epochs(n, seed=0):
+    # six band-power like features with some missing values so default directions are exercised
+    rng = np.random.default_rng(seed)
+    X = rng.dirichlet(np.ones(6), size=n).astype(np.float32)
+    y = ((X[:, 1] - X[:, 4] + rng.normal(0, 0.1, n)) > 0).astype(int)
+    X[rng.random(X.shape) < 0.03] = np.nan
+    return X, y
+
+if __name__ == "__main__":
+    X, y = synthetic_epochs(6000)
+    X_test, _ = synthetic_epochs(2000, seed=1)
+
+    # the train_model default, deeper hist trees and a shallow forest
+    for params in ({'n_estimators': 100, 'learning_rate': 0.1, 'max_depth': 5}, {'n_estimators': 300, 'max_depth': 9, 'tree_method': 'hist'}, {'n_estimators': 20, 'max_depth': 1}):
+        model = xgb.XGBClassifier(**params).fit(X, y)
+        trees = TreeEnsemble.from_booster(model)
+        difference = np.abs(trees.predict_proba(X_test) - model.predict_proba(X_test)).max()
+        assert difference < 1e-5, f'{params}: differs from predict_proba by {difference}'
+
+    # early stopping: only the trees up to best_iteration are exported
+    dtrain, dvalid = xgb.DMatrix(X[:5000], label=y[:5000]), xgb.DMatrix(X[5000:], label=y[5000:])
+    booster = xgb.train({'objective': 'binary:logistic', 'max_depth': 6, 'eta': 0.3}, dtrain, 500, evals=[(dvalid, 'valid')], early_stopping_rounds=5, verbose_eval=False)
+    trees = TreeEnsemble.from_booster(booster)
+    assert len(trees.roots) == booster.best_iteration + 1
+    assert np.allclose(trees.predict_positive_proba(X_test), booster.predict(xgb.DMatrix(X_test), iteration_range=(0, booster.best_iteration + 1)), atol=1e-5)
+
+    # bundles carry the trees, and loading them for the numpy evaluator never imports xgboost
+    model = xgb.XGBClassifier(n_estimators=100, max_depth=5).fit(X, y)
+    with tempfile.TemporaryDirectory() as workdir:
+        path = save_model_bundle(model, [f'f{i}' for i in range(6)], path=os.path.join(workdir, 'bundle'))
+        numpy_predictor, xgboost_predictor = load_model_bundle(path), load_model_bundle(path, evaluator='xgboost')
+        assert (numpy_predictor.evaluator, xgboost_predictor.evaluator) == ('numpy', 'xgboost')
+        assert np.allclose(numpy_predictor.predict_proba(X_test), xgboost_predictor.predict_proba(X_test), atol=1e-5)
+        loaded = TreeEnsemble.load(os.path.join(path, 'trees.npz'))
+        assert np.array_equal(loaded.predict_margin(X_test), TreeEnsemble.from_booster(model).predict_margin(X_test))
+
+        script = f"import sys; sys.path.insert(0, {ROOT!r}); from model_bundle import load_model_bundle; load_model_bundle({path!r}).predict(__import__('numpy').zeros((1, 6))); print('xgboost' in sys.modules)"
+        assert subprocess.run([sys.executable, '-c', script], check=True, capture_output=True, text=True).stdout.strip() == 'False', 'the numpy evaluator imported xgboost'
+
+    print('Numpy tree evaluator matches predict_proba (plain, hist, stumps, early stopping) and loads without xgboost')
@@ -0,0 +1,66 @@
+import os
+import sys
+import json
+import tempfile
+import subprocess
+import numpy as np
+import xgboost as xgb
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'testing', 'benchmarks'))
+from batch_scoring import BatchScorer, recording_files
+from preprocessing_functions import process_night_features
+from model_bundle import save_model_bundle, load_model_bundle
+from model_training import FEATURES
+from synthetic import write_synthetic_psg
+
+if __name__ == "__main__":
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            directory = os.path.join('data', 'physionet', 'sleep-cassette')
+            os.makedirs(directory)
+            for night in range(4):
+                write_synthetic_psg(os.path.join(directory, f'SC4{night:02d}1E0-PSG.edf'), 0.3 + 0.1 * night, seed=night)
+            with open(os.path.join(directory, 'SC4991E0-PSG.edf'), 'wb') as f:
+                f.write(b'not an edf')
+
+            # a small model on the training features of the synthetic nights
+            features_df = process_night_features('SC4001E0-PSG.edf')
+            X = features_df[FEATURES].to_numpy(dtype=np.float32)
+            bundle = save_model_bundle(xgb.XGBClassifier(n_estimators=20, max_depth=3).fit(X, X[:, 1] > np.median(X[:, 1])), FEATURES, path='bundle')
+
+            # with and without workers, the hypnograms are the bundle's predictions on exactly the training features
+            edf_files = recording_files(['data'])
+            assert len(edf_files) == 5
+            predictor = load_model_bundle(bundle)
+            for workers, output_dir in ((1, 'scores'), (2, 'scores_parallel')):
+                scored, failed = BatchScorer(bundle, output_dir).score(edf_files, workers=workers, progress=False)
+                assert len(scored) == 4 and list(failed) == [os.path.join(directory, 'SC4991E0-PSG.edf')]
+                scorer = BatchScorer(bundle, output_dir)
+                for night in range(4):
+                    features_df = process_night_features(f'SC4{night:02d}1E0-PSG.edf')
+                    hypnogram = scorer.load(f'SC4{night:02d}1E0-PSG')
+                    expected = predictor.predict_positive_proba(features_df[FEATURES].to_numpy(dtype=np.float32))
+                    assert np.array_equal(hypnogram['probability'].to_numpy(), expected.astype(np.float32)), f'night {night} ({workers} workers) differs'
+                    assert np.array_equal(hypnogram['stage'].to_numpy(), (expected > 0.5).astype(np.int8))
+                    assert np.array_equal(hypnogram['epoch'].to_numpy(), np.arange(len(features_df)))
+                    assert scorer.manifest['nights'][f'SC4{night:02d}1E0-PSG']['epochs'] == len(features_df)
+
+            # up to date nights are skipped, a changed recording or --force scores again
+            scorer = BatchScorer(bundle, 'scores')
+            assert scorer.pending(edf_files) == [os.path.join(directory, 'SC4991E0-PSG.edf')]
+            write_synthetic_psg(os.path.join(directory, 'SC4001E0-PSG.edf'), 0.2, seed=7)
+            assert len(scorer.pending(edf_files)) == 2 and len(scorer.pending(edf_files, force=True)) == 5
+
+            # the command line reports throughput and fails when a night could not be scored
+            result = subprocess.run([sys.executable, os.path.join(ROOT, 'batch_scoring.py'), 'data', '--bundle', bundle, '--output', 'scores_cli', '--workers', '2', '--format', 'parquet'], capture_output=True, text=True)
+            assert result.returncode == 1 and 'nights/min' in result.stdout, result.stdout + result.stderr
+            with open(os.path.join('scores_cli', 'scores.json')) as f:
+                assert json.load(f)['classes'] == ['Other', 'N1/N2 Sleep']
+            assert os.path.exists(os.path.join('scores_cli', 'SC4031E0-PSG.parquet'))
+        finally:
+            os.chdir(cwd)
+    print('Batch scoring verified: hypnograms match the training features, parallel and resumable')
@@ -0,0 +1,99 @@
+import os
+import argparse
+import pandas as pd
+from sklearn.metrics import roc_curve, precision_recall_curve, auc
+
+# report figure of a TrainingResult, kept out of model_training.py so headless training never imports matplotlib/seaborn
+
+TABLE_METRICS = {
+    'mcc': 'MCC',
+    'auc_pr': 'AUC-PR',
+    'f1': 'F1-Score',
+    'roc_auc': 'ROC AUC',
+    'log_loss': 'Log Loss',
+    'precision': 'Precision',
+    'recall': 'Recall',
+    'accuracy': 'Accuracy'
+}
+
+def render_report(result, path=None, show=False):
+    # draws ROC/PR curves, the test confusion matrix and the metrics table; saves to path and/or shows the window
+    import matplotlib
+    if not show:
+        matplotlib.use('Agg') # no display needed when only writing a file
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    test_metrics, train_metrics = result.test_metrics, result.train_metrics
+    fpr, tpr, _ = roc_curve(result.y_test, result.y_test_prob)
+    precision, recall, _ = precision_recall_curve(result.y_test, result.y_test_prob)
+    auc_pr = auc(recall, precision)
+
+    fig, axes = plt.subplots(2, 2, figsize=(12, 8))
+
+    # ROC Curve
+    axes[0, 0].plot(fpr, tpr, color='darkorange', lw=2, label='ROC curve (AUC = %0.3f)' % test_metrics['roc_auc'])
+    axes[0, 0].plot([0, 1], [0, 1], color='navy', lw=2, linestyle='--')
+    axes[0, 0].set_xlim([0.0, 1.0])
+    axes[0, 0].set_ylim([0.0, 1.05])
+    axes[0, 0].set_xlabel('False Positive Rate')
+    axes[0, 0].set_ylabel('True Positive Rate')
+    axes[0, 0].set_title('ROC Curve')
+    axes[0, 0].legend(loc="lower right")
+
+    # Precision-Recall Curve
+    axes[0, 1].plot(recall, precision, color='blue', lw=2, label='Precision-Recall Curve (AUC = %0.3f)' % auc_pr)
+    axes[0, 1].set_xlabel('Recall')
+    axes[0, 1].set_ylabel('Precision')
+    axes[0, 1].set_title('Precision-Recall Curve')
+    axes[0, 1].legend(loc="lower left")
+
+    # Confusion Matrix
+    sns.heatmap(result.test_conf_matrix, annot=True, fmt='d', cmap='Blues', xticklabels=['Other', 'N1/N2 Sleep'], yticklabels=['Other', 'N1/N2 Sleep'], ax=axes[1, 0], cbar=False)
+    axes[1, 0].set_xlabel('Predicted')
+    axes[1, 0].set_ylabel('Actual')
+    axes[1, 0].set_title('Confusion Matrix')
+
+    # Metrics Table
+    metrics_df = pd.DataFrame({
+        'Metric': list(TABLE_METRICS.values()),
+        'Testing': [round(test_metrics[metric], 4) for metric in TABLE_METRICS],
+        'Training': [round(train_metrics[metric], 4) for metric in TABLE_METRICS],
+        'GenRatio': [round(test_metrics[metric] / train_metrics[metric], 4) for metric in TABLE_METRICS]
+    })
+    axes[1, 1].axis('tight')
+    axes[1, 1].axis('off')
+    table = axes[1, 1].table(cellText=metrics_df.values, colLabels=metrics_df.columns, cellLoc='center', loc='center', colColours=['#f2f2f2']*4)
+    table.auto_set_font_size(False)
+    table.set_fontsize(12)
+    table.scale(1.2, 1.2)
+    for (i, j), cell in table.get_celld().items():
+        cell.set_edgecolor('black')
+        if i == 0:
+            cell.set_text_props(weight='bold', color='white')
+            cell.set_facecolor('#40466e')
+        cell.set_height(0.1)
+    axes[1, 1].set_title('Metrics Summary')
+
+    plt.tight_layout(pad=3.0)
+    if path is not None:
+        fig.savefig(path, dpi=100)
+    if show:
+        plt.show()
+    plt.close(fig)
+    return path
+
+if __name__ == "__main__":
+    from model_training import TrainingResult
+
+    parser = argparse.ArgumentParser(description='Render the report of a saved training result (TrainingResult.save) to an image')
+    parser.add_argument('result', help='training result json, e.g. data/models/<bundle>/training_result.json')
+    parser.add_argument('--output', default=None, help='image path, defaults to report.png next to the result')
+    parser.add_argument('--show', action='store_true', help='also open the figure window')
+    args = parser.parse_args()
+
+    result = TrainingResult.load(args.result)
+    output = os.path.join(os.path.dirname(os.path.abspath(args.result)), 'report.png') if args.output is None else args.output
+    render_report(result, output, show=args.show)
+    print(result.summary())
+    print(f'Report saved to {output}')
@@ -0,0 +1,239 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from feature_sets import EPOCH_SECONDS, DEFAULT_FEATURE_SET
+from model_bundle import LABEL_MAPPING, label_positive_rate, load_model_bundle
+
+# online part of the alarm: smoothing of the per-epoch N1/N2 probabilities and the wake-window decision,
+# plain float arithmetic with constant state so one update costs about a microsecond however long the night is;
+# the offline replay at the bottom scores the same classes against the labelled dataset
+
+LIGHT_SLEEP_STAGES = LABEL_MAPPING['positive_stages']
+
+class LightSleepFilter:
+    # two-state (other / light sleep) HMM forward filter over the classifier's probabilities
+    # enter/leave_probability are the chances of switching state over one 30 s epoch, scaled to the hop between updates;
+    # the classifier's output is a posterior under the training prior, dividing by the prior turns it into a likelihood ratio
+
+    def __init__(self, enter_probability=0.05, leave_probability=0.05, prior=0.5, hop_seconds=EPOCH_SECONDS):
+        steps = hop_seconds / EPOCH_SECONDS
+        stationary = enter_probability / (enter_probability + leave_probability)
+        decay = (1 - enter_probability - leave_probability) ** steps
+        self.stay_light = stationary + (1 - stationary) * decay
+        self.become_light = stationary * (1 - decay)
+        self.prior = prior
+        self.initial = stationary
+        self.posterior = stationary
+
+    def reset(self):
+        self.posterior = self.initial
+
+    def update(self, probability):
+        # a missing score (nan) only advances the chain
+        predicted = self.posterior * self.stay_light + (1 - self.posterior) * self.become_light
+        if probability != probability:
+            self.posterior = predicted
+            return predicted
+        probability = min(max(probability, 1e-6), 1 - 1e-6)
+        light = predicted * probability / self.prior
+        other = (1 - predicted) * (1 - probability) / (1 - self.prior)
+        self.posterior = light / (light + other)
+        return self.posterior
+
+class WakeWindowScheduler:
+    # fires once: at the end of the first confirm_epochs consecutive epochs inside [window_start, deadline] whose smoothed
+    # light sleep probability reaches the threshold, otherwise at the first epoch ending at or after the deadline
+    # times are seconds on the session's clock (epoch end times)
+
+    def __init__(self, window_start, deadline, threshold=0.8, confirm_epochs=2):
+        if deadline < window_start:
+            raise ValueError('The deadline must not be before the window start')
+        self.window_start = window_start
+        self.deadline = deadline
+        self.threshold = threshold
+        self.confirm_epochs = confirm_epochs
+        self.confident_epochs = 0
+        self.fired_time = None
+        self.reason = None
+
+    def update(self, end_time, posterior):
+        # returns 'light_sleep' or 'deadline' on the update that fires, None otherwise
+        if self.fired_time is not None or end_time < self.window_start:
+            return None
+        self.confident_epochs = self.confident_epochs + 1 if posterior >= self.threshold else 0
+        if self.confident_epochs >= self.confirm_epochs:
+            self.reason = 'light_sleep'
+        elif end_time >= self.deadline:
+            self.reason = 'deadline'
+        else:
+            return None
+        self.fired_time = end_time
+        return self.reason
+
+class WakeAlarm:
+    # filter and scheduler together, fed with one (end_time, probability) per scored epoch; the window can be (re)set any time
+
+    def __init__(self, window_start=None, deadline=None, threshold=0.8, confirm_epochs=2, hop_seconds=EPOCH_SECONDS, **filter_parameters):
+        self.filter = LightSleepFilter(hop_seconds=hop_seconds, **filter_parameters)
+        self.threshold = threshold
+        self.confirm_epochs = confirm_epochs
+        self.scheduler = None
+        if window_start is not None:
+            self.set_window(window_start, deadline)
+
+    def set_window(self, window_start, deadline):
+        self.scheduler = WakeWindowScheduler(window_start, deadline, self.threshold, self.confirm_epochs)
+
+    def update(self, end_time, probability):
+        posterior = self.filter.update(probability)
+        alarm = self.scheduler.update(end_time, posterior) if self.scheduler is not None else None
+        return posterior, alarm
+
+def smooth_probabilities(probabilities, **filter_parameters):
+    # the filter run over a whole night, as the alarm would have seen it epoch by epoch
+    light_sleep_filter = LightSleepFilter(**filter_parameters)
+    return np.array([light_sleep_filter.update(probability) for probability in probabilities.tolist()])
+
+def replay_window(end_times, smoothed, light, window_start, deadline, threshold=0.8, confirm_epochs=2):
+    # one wake window over a night's epochs; the target is the end of the first truly light epoch in the window, or the
+    # deadline when there is none, so firing at the deadline after a light-sleep-free window is an error of zero
+    scheduler = WakeWindowScheduler(window_start, deadline, threshold, confirm_epochs)
+    first = int(np.searchsorted(end_times, window_start))
+    fired_epoch = None
+    for i in range(first, len(end_times)):
+        if scheduler.update(end_times[i], smoothed[i]) is not None:
+            fired_epoch = i
+            break
+    if fired_epoch is None:
+        return None
+
+    in_window = np.flatnonzero((end_times >= window_start) & (end_times <= deadline) & light)
+    target_time = end_times[in_window[0]] if len(in_window) else end_times[min(int(np.searchsorted(end_times, deadline)), len(end_times) - 1)]
+    return {
+        'fired_time': float(scheduler.fired_time),
+        'reason': scheduler.reason,
+        'target_time': float(target_time),
+        'error_minutes': float(scheduler.fired_time - target_time) / 60,
+        'false_trigger': scheduler.reason == 'light_sleep' and not light[fired_epoch],
+        'missed': scheduler.reason == 'deadline' and len(in_window) > 0
+    }
+
+def night_windows(end_times, light, window_minutes, step_minutes, earliest_hours):
+    # deadlines every step_minutes from earliest_hours after the first light sleep epoch to the night's last labelled light sleep
+    light_times = end_times[light]
+    if len(light_times) == 0:
+        return []
+    deadlines = np.arange(light_times[0] + earliest_hours * 3600, light_times[-1] + 1, step_minutes * 60)
+    return [(deadline - window_minutes * 60, deadline) for deadline in deadlines]
+
+def out_of_fold_probabilities(df, features, folds=5, model_params=None, seed=0):
+    # every epoch (unlabelled ones too, the alarm scores those as well) is scored by a model that never saw its subject
+    import xgboost as xgb
+    from model_training import LABEL, MODEL_PARAMS
+    from epoch_keys import EPOCH_KEY, factorize_persons
+
+    X = df[features].to_numpy(dtype=np.float32)
+    y = df[LABEL].isin(LIGHT_SLEEP_STAGES).to_numpy(dtype=int)
+    labelled = ~df[LABEL].isin(LABEL_MAPPING['excluded_stages']).to_numpy()
+    person_codes, persons = factorize_persons(df[EPOCH_KEY])
+    person_folds = np.random.default_rng(seed).permutation(len(persons)) % folds
+    probabilities = np.empty(len(df))
+    for fold in range(folds):
+        test_mask = person_folds[person_codes] == fold
+        model = xgb.XGBClassifier(**(MODEL_PARAMS if model_params is None else model_params))
+        model.fit(X[labelled & ~test_mask], y[labelled & ~test_mask])
+        probabilities[test_mask] = model.predict_proba(X[test_mask])[:, 1]
+    return probabilities, label_positive_rate(df[LABEL])
+
+def replay(df, probabilities, prior, window_minutes=30, step_minutes=60, earliest_hours=3, threshold=0.8, confirm_epochs=2, **filter_parameters):
+    # every night of the dataset with several wake windows each; returns one row per window and the filter's time per epoch
+    from model_training import LABEL
+    from epoch_keys import EPOCH_KEY, night_keys, epoch_numbers, epoch_categories, format_epoch_ids
+
+    order = np.argsort(df[EPOCH_KEY].to_numpy(), kind='stable')
+    keys = df[EPOCH_KEY].to_numpy()[order]
+    probabilities = np.asarray(probabilities)[order]
+    light = df[LABEL].isin(LIGHT_SLEEP_STAGES).to_numpy()[order]
+    persons = np.asarray(epoch_categories(keys)['person'])
+    end_times = (epoch_numbers(keys) + 1) * EPOCH_SECONDS
+    boundaries = np.flatnonzero(np.r_[True, night_keys(keys)[1:] != night_keys(keys)[:-1], True])
+
+    rows = []
+    filter_seconds = 0.0
+    for start, stop in zip(boundaries[:-1], boundaries[1:]):
+        start_time = time.perf_counter()
+        smoothed = smooth_probabilities(probabilities[start:stop], prior=prior, **filter_parameters)
+        filter_seconds += time.perf_counter() - start_time
+        for window_start, deadline in night_windows(end_times[start:stop], light[start:stop], window_minutes, step_minutes, earliest_hours):
+            result = replay_window(end_times[start:stop], smoothed, light[start:stop], window_start, deadline, threshold, confirm_epochs)
+            if result is not None:
+                rows.append({'person': persons[start], 'night': format_epoch_ids(keys[start:start + 1])[0].rsplit('-', 1)[0], 'deadline': float(deadline), **result})
+    return rows, filter_seconds / len(keys)
+
+def replay_summary(rows):
+    errors = np.array([row['error_minutes'] for row in rows])
+    return {
+        'windows': len(rows),
+        'mean_abs_error_minutes': float(np.abs(errors).mean()),
+        'median_error_minutes': float(np.median(errors)),
+        'p90_abs_error_minutes': float(np.percentile(np.abs(errors), 90)),
+        'false_trigger_rate': float(np.mean([row['false_trigger'] for row in rows])),
+        'deadline_rate': float(np.mean([row['reason'] == 'deadline' for row in rows])),
+        'missed_rate': float(np.mean([row['missed'] for row in rows]))
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Replay the wake alarm against the labelled dataset: timing error and false triggers over all subjects')
+    parser.add_argument('--feature-set', default=DEFAULT_FEATURE_SET)
+    parser.add_argument('--bundle', default=None, help='score with a saved model bundle (in-sample if it was trained on this data) instead of out-of-fold models')
+    parser.add_argument('--folds', type=int, default=5, help='subject folds of the out-of-fold scores')
+    parser.add_argument('--window', type=float, default=30, help='wake window length in minutes')
+    parser.add_argument('--step', type=float, default=60, help='minutes between the replayed deadlines of a night')
+    parser.add_argument('--earliest', type=float, default=3, help='hours after the first light sleep before the first deadline')
+    parser.add_argument('--threshold', type=float, default=0.8)
+    parser.add_argument('--confirm', type=int, default=2, help='consecutive confident epochs before firing')
+    parser.add_argument('--enter', type=float, default=0.05, help='chance per epoch of entering light sleep')
+    parser.add_argument('--leave', type=float, default=0.05, help='chance per epoch of leaving light sleep')
+    parser.add_argument('--output', default=None, help='write the per-window results and the summary as JSON')
+    args = parser.parse_args()
+
+    from preprocessing_functions import preprocess_labels
+    from feature_sets import get_feature_set
+    from model_training import training_columns
+
+    feature_set = get_feature_set(args.feature_set)
+    if args.bundle is not None:
+        predictor = load_model_bundle(args.bundle)
+        df = preprocess_labels(None, preprocess_labels=False, download_files=False, columns=training_columns(predictor.features), feature_set=predictor.feature_set)
+        probabilities = predictor.predict_positive_proba(df[predictor.features].to_numpy(dtype=np.float32))
+        # the training prior recorded in the bundle, bundles saved before it was recorded get the rate of the replayed data
+        prior = predictor.metadata.get('positive_rate')
+        if prior is None:
+            prior = label_positive_rate(df['sleep_stage'])
+    else:
+        df = preprocess_labels(None, preprocess_labels=False, download_files=False, columns=training_columns(feature_set.columns()), feature_set=feature_set)
+        probabilities, prior = out_of_fold_probabilities(df, feature_set.columns(), args.folds)
+
+    start_time = time.time()
+    rows, filter_seconds = replay(df, probabilities, prior, args.window, args.step, args.earliest, args.threshold, args.confirm, enter_probability=args.enter, leave_probability=args.leave)
+    replay_seconds = time.time() - start_time
+    if not rows:
+        sys.exit('No wake windows to replay, the dataset has no light sleep epochs')
+
+    summary = replay_summary(rows)
+    print(f"{summary['windows']} wake windows of {args.window:g} min over {len({row['night'] for row in rows})} nights, replayed in {replay_seconds:.2f} s (filter {filter_seconds * 1e6:.2f} us/epoch)")
+    print(f"{'Person':<8}{'Windows':>8}{'Mean |err| (min)':>18}{'Median err (min)':>18}{'False trig.':>13}{'Deadline':>10}{'Missed':>8}")
+    for person in sorted({row['person'] for row in rows}) + ['all']:
+        person_rows = rows if person == 'all' else [row for row in rows if row['person'] == person]
+        person_summary = replay_summary(person_rows)
+        print(f"{person:<8}{person_summary['windows']:>8}{person_summary['mean_abs_error_minutes']:>18.2f}{person_summary['median_error_minutes']:>18.2f}"
+              f"{person_summary['false_trigger_rate']:>13.1%}{person_summary['deadline_rate']:>10.1%}{person_summary['missed_rate']:>8.1%}")
+
+    if args.output is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({'parameters': vars(args), 'prior': prior, 'summary': summary, 'filter_us_per_epoch': filter_seconds * 1e6, 'windows': rows}, f, indent=1, default=float)
+        print(f'Results written to {args.output}')